@@ -1,123 +1,267 @@
 import aiohttp
+import asyncio
 import os
-from typing import List, Dict, Any
-from emergentintegrations.llm.chat import LlmChat, UserMessage
+from typing import List, Dict, Any, AsyncIterator, Sequence
+from llm import LlmChat, UserMessage
 import json
+from upstream import Upstream, StaleCache, SingleFlight, normalize_query
+from pubmed_xml import PubmedArticleStream
+from relevance import BatchScorer
 
 LLM_KEY = os.environ.get('EMERGENT_LLM_KEY')
+PUBMED_BASE_URL = os.environ.get('PUBMED_BASE_URL', 'https://eutils.ncbi.nlm.nih.gov/entrez/eutils')
+CLINICAL_TRIALS_BASE_URL = os.environ.get('CLINICAL_TRIALS_BASE_URL', 'https://clinicaltrials.gov/api/v2/studies')
+
+# Offline development: answer LLM calls from the simulator's fixtures
+if os.environ.get('LLM_SIMULATOR'):
+    from simulator import SimulatedLlmChat as LlmChat
+
+# Upstream policies. NCBI allows 3 requests/second per client, or 10 with an API key.
+NCBI_API_KEY = os.environ.get('NCBI_API_KEY')
+UPSTREAM_TIMEOUT = float(os.environ.get('UPSTREAM_TIMEOUT', '5'))
+
+PUBMED = Upstream(
+    "PubMed",
+    rate=10 if NCBI_API_KEY else 3,
+    timeout=UPSTREAM_TIMEOUT,
+    cache=StaleCache(ttl=float(os.environ.get('UPSTREAM_CACHE_TTL', '600')))
+)
+CLINICAL_TRIALS = Upstream(
+    "ClinicalTrials.gov",
+    rate=float(os.environ.get('CLINICAL_TRIALS_RATE_LIMIT', '10')),
+    timeout=UPSTREAM_TIMEOUT,
+    cache=StaleCache(ttl=float(os.environ.get('UPSTREAM_CACHE_TTL', '600')))
+)
+
+# Study pieces requested from ClinicalTrials.gov v2; everything normalize_study
+# reads and nothing else (the full record is several times larger)
+TRIAL_FIELDS = (
+    "NCTId", "BriefTitle", "OfficialTitle", "BriefSummary", "OverallStatus", "Phase",
+    "Condition", "CentralContact", "Location", "EligibilityCriteria"
+)
+CLINICAL_TRIALS_PAGE_SIZE = 100
+CLINICAL_TRIALS_MAX_PAGE_SIZE = 1000
+
+# Parsed efetch records per PMID; articles rarely change once indexed
+PUBMED_ARTICLES = StaleCache(max_entries=20000, ttl=float(os.environ.get('PUBMED_ARTICLE_TTL', '86400')))
+# IDs per efetch call; lists longer than EFETCH_GET_MAX_IDS are POSTed, as NCBI
+# recommends for long ID lists
+EFETCH_BATCH_SIZE = 200
+EFETCH_GET_MAX_IDS = 50
+
+# Identical concurrent LLM prompts (scoring the same item for the same query,
+# analyzing the same search) share one completion
+LLM_FLIGHT = SingleFlight()
+
+# Relevance scoring of search results: "batch" scores every result in one
+# vectorized pass; "llm" asks the LLM once per result
+RELEVANCE_SCORER = os.environ.get('RELEVANCE_SCORER', 'batch')
+BATCH_SCORER = BatchScorer()
+
+def upstream_metrics() -> Dict[str, Any]:
+    metrics = {u.name: u.metrics() for u in (PUBMED, CLINICAL_TRIALS)}
+    metrics["PubMed"]["article_cache"] = PUBMED_ARTICLES.metrics()
+    metrics["LLM"] = {"single_flight": LLM_FLIGHT.metrics()}
+    return metrics
+
+def ncbi_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    if NCBI_API_KEY:
+        params["api_key"] = NCBI_API_KEY
+    return params
 
 async def search_pubmed(query: str, max_results: int = 10) -> List[Dict[str, Any]]:
     """Search PubMed for publications"""
-    base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils"
+    key = ("search", normalize_query(query), max_results)
+    return await PUBMED.cached(key, lambda: fetch_pubmed(query, max_results), default=[])
+
+async def fetch_pubmed(query: str, max_results: int) -> List[Dict[str, Any]]:
+    base_url = PUBMED_BASE_URL
     
-    try:
-        async with aiohttp.ClientSession() as session:
-            # Search for IDs
-            search_url = f"{base_url}/esearch.fcgi"
-            params = {
-                "db": "pubmed",
-                "term": query,
-                "retmax": max_results,
-                "retmode": "json"
-            }
-            
-            async with session.get(search_url, params=params) as response:
-                search_data = await response.json()
-                id_list = search_data.get("esearchresult", {}).get("idlist", [])
-            
-            if not id_list:
-                return []
-            
-            # Fetch details
-            fetch_url = f"{base_url}/esummary.fcgi"
-            params = {
-                "db": "pubmed",
-                "id": ",".join(id_list),
-                "retmode": "json"
-            }
-            
-            async with session.get(fetch_url, params=params) as response:
-                fetch_data = await response.json()
-                results = fetch_data.get("result", {})
-                
-                publications = []
-                for pmid in id_list:
-                    if pmid in results:
-                        pub = results[pmid]
-                        publications.append({
-                            "pubmed_id": f"PMID{pmid}",
-                            "title": pub.get("title", ""),
-                            "authors": [author.get("name", "") for author in pub.get("authors", [])[:5]],
-                            "abstract": pub.get("abstract", ""),
-                            "url": f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/",
-                            "published_date": pub.get("pubdate", ""),
-                            "keywords": pub.get("title", "").lower().split()[:10]
-                        })
-                
-                return publications
-    except Exception as e:
-        print(f"PubMed API Error: {e}")
-        return []
+    async with aiohttp.ClientSession() as session:
+        # Search for IDs
+        search_url = f"{base_url}/esearch.fcgi"
+        params = ncbi_params({
+            "db": "pubmed",
+            "term": query,
+            "retmax": max_results,
+            "retmode": "json"
+        })
+        
+        search_data = await PUBMED.get_json(session, search_url, params)
+        id_list = search_data.get("esearchresult", {}).get("idlist", [])
+        
+        if not id_list:
+            return []
+        
+        articles = await fetch_pubmed_articles(session, id_list)
+        
+        publications = []
+        for pmid in id_list:
+            article = articles.get(pmid)
+            if article:
+                publications.append({
+                    "pubmed_id": f"PMID{pmid}",
+                    "title": article["title"],
+                    "authors": article["authors"],
+                    "abstract": article["abstract"],
+                    "url": f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/",
+                    "published_date": article["published_date"],
+                    "mesh_terms": article["mesh_terms"],
+                    "keywords": article["keywords"][:10]
+                })
+        
+        return publications
+
+async def fetch_pubmed_articles(session: aiohttp.ClientSession, pmids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Abstracts and MeSH terms by PMID, from the cache or batched efetch calls"""
+    articles = {}
+    missing = []
+    for pmid in pmids:
+        hit = PUBMED_ARTICLES.get(pmid)
+        if hit and hit[1]:
+            PUBMED_ARTICLES.hits += 1
+            articles[pmid] = hit[0]
+        else:
+            PUBMED_ARTICLES.misses += 1
+            missing.append(pmid)
+    
+    for start in range(0, len(missing), EFETCH_BATCH_SIZE):
+        batch = missing[start:start + EFETCH_BATCH_SIZE]
+        params = ncbi_params({
+            "db": "pubmed",
+            "id": ",".join(batch),
+            "rettype": "abstract",
+            "retmode": "xml"
+        })
+        method = "POST" if len(batch) > EFETCH_GET_MAX_IDS else "GET"
+        fetched = await PUBMED.request(session, f"{PUBMED_BASE_URL}/efetch.fcgi", params, read_pubmed_articles, method)
+        for pmid, article in fetched.items():
+            PUBMED_ARTICLES.set(pmid, article)
+        articles.update(fetched)
+    
+    return articles
+
+async def read_pubmed_articles(response: aiohttp.ClientResponse) -> Dict[str, Dict[str, Any]]:
+    """Parse an efetch response while it downloads"""
+    stream = PubmedArticleStream()
+    articles = {}
+    async for chunk in response.content.iter_chunked(64 * 1024):
+        for article in stream.feed(chunk):
+            articles[article["pmid"]] = article
+    for article in stream.close():
+        articles[article["pmid"]] = article
+    return articles
 
 async def search_clinical_trials(condition: str, location: str = None, max_results: int = 10) -> List[Dict[str, Any]]:
     """Search ClinicalTrials.gov for trials"""
-    base_url = "https://clinicaltrials.gov/api/v2/studies"
-    
-    try:
-        async with aiohttp.ClientSession() as session:
-            params = {
-                "query.cond": condition,
-                "pageSize": max_results,
-                "format": "json"
-            }
-            
-            if location:
-                params["query.locn"] = location
-            
-            async with session.get(base_url, params=params) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    studies = data.get("studies", [])
-                    
-                    trials = []
-                    for study in studies:
-                        protocol = study.get("protocolSection", {})
-                        id_module = protocol.get("identificationModule", {})
-                        status_module = protocol.get("statusModule", {})
-                        design_module = protocol.get("designModule", {})
-                        desc_module = protocol.get("descriptionModule", {})
-                        conditions_module = protocol.get("conditionsModule", {})
-                        contacts_module = protocol.get("contactsModule", {})
-                        locations_module = protocol.get("locationsModule", {})
-                        
-                        # Get first location
-                        location_str = "Not specified"
-                        locations = locations_module.get("locations", [])
-                        if locations:
-                            loc = locations[0]
-                            city = loc.get("city", "")
-                            country = loc.get("country", "")
-                            location_str = f"{city}, {country}" if city else country
-                        
-                        trials.append({
-                            "nct_id": id_module.get("nctId", ""),
-                            "title": id_module.get("officialTitle", id_module.get("briefTitle", "")),
-                            "description": desc_module.get("briefSummary", ""),
-                            "status": status_module.get("overallStatus", ""),
-                            "phase": design_module.get("phases", ["N/A"])[0] if design_module.get("phases") else "N/A",
-                            "conditions": conditions_module.get("conditions", []),
-                            "location": location_str,
-                            "eligibility": protocol.get("eligibilityModule", {}).get("eligibilityCriteria", ""),
-                            "contact": contacts_module.get("centralContacts", [{}])[0].get("email", "") if contacts_module.get("centralContacts") else ""
-                        })
-                    
-                    return trials
-    except Exception as e:
-        print(f"ClinicalTrials.gov API Error: {e}")
-        return []
+    key = ("search", normalize_query(condition), normalize_query(location) or None, max_results)
+    return await CLINICAL_TRIALS.cached(
+        key,
+        lambda: fetch_clinical_trials(condition, location or None, max_results),
+        default=[]
+    )
+
+async def fetch_clinical_trials(condition: str, location: str, max_results: int) -> List[Dict[str, Any]]:
+    return [trial async for trial in iter_clinical_trials(condition, location, page_size=max_results, max_trials=max_results)]
+
+async def iter_clinical_trials(condition: str, location: str = None, status: str = None, page_size: int = CLINICAL_TRIALS_PAGE_SIZE,
+                               max_trials: int = None, fields: Sequence[str] = TRIAL_FIELDS) -> AsyncIterator[Dict[str, Any]]:
+    """Yield normalized trials page by page, following nextPageToken
+
+    Only one page is held at a time. fields selects the study pieces the API
+    returns (None for the full record); upstream errors propagate to the caller.
+    """
+    params = {
+        "query.cond": condition,
+        "pageSize": min(page_size, CLINICAL_TRIALS_MAX_PAGE_SIZE),
+        "format": "json"
+    }
+    if location:
+        params["query.locn"] = location
+    if status:
+        params["filter.overallStatus"] = status
+    if fields:
+        params["fields"] = ",".join(fields)
+
+    yielded = 0
+    async with aiohttp.ClientSession() as session:
+        while True:
+            data = await CLINICAL_TRIALS.get_json(session, CLINICAL_TRIALS_BASE_URL, params)
+            for study in data.get("studies", []):
+                yield normalize_study(study)
+                yielded += 1
+                if max_trials and yielded >= max_trials:
+                    return
+            next_token = data.get("nextPageToken")
+            if not next_token:
+                return
+            params["pageToken"] = next_token
+
+def normalize_study(study: Dict[str, Any]) -> Dict[str, Any]:
+    """Flatten a v2 study record into the trial shape used across the app"""
+    protocol = study.get("protocolSection", {})
+    id_module = protocol.get("identificationModule", {})
+    status_module = protocol.get("statusModule", {})
+    design_module = protocol.get("designModule", {})
+    desc_module = protocol.get("descriptionModule", {})
+    conditions_module = protocol.get("conditionsModule", {})
+    # Sites and central contacts share one module in v2
+    contacts_module = protocol.get("contactsLocationsModule", {})
+    locations = [normalize_site(site) for site in contacts_module.get("locations", [])]
+
+    # First site as the display location
+    location_str = "Not specified"
+    if locations:
+        city = locations[0]["city"]
+        country = locations[0]["country"]
+        location_str = f"{city}, {country}" if city else country
+
+    return {
+        "nct_id": id_module.get("nctId", ""),
+        "title": id_module.get("officialTitle", id_module.get("briefTitle", "")),
+        "description": desc_module.get("briefSummary", ""),
+        "status": status_module.get("overallStatus", ""),
+        "phase": design_module.get("phases", ["N/A"])[0] if design_module.get("phases") else "N/A",
+        "conditions": conditions_module.get("conditions", []),
+        "location": location_str,
+        "locations": locations,
+        "eligibility": protocol.get("eligibilityModule", {}).get("eligibilityCriteria", ""),
+        "contact": contacts_module.get("centralContacts", [{}])[0].get("email", "") if contacts_module.get("centralContacts") else ""
+    }
+
+def normalize_site(site: Dict[str, Any]) -> Dict[str, Any]:
+    normalized = {
+        "facility": site.get("facility", ""),
+        "city": site.get("city", ""),
+        "state": site.get("state", ""),
+        "country": site.get("country", ""),
+        "status": site.get("status", "")
+    }
+    geo_point = site.get("geoPoint")
+    if geo_point and "lat" in geo_point and "lon" in geo_point:
+        normalized["lat"] = geo_point["lat"]
+        normalized["lon"] = geo_point["lon"]
+    return normalized
+
+async def score_results(query: str, **groups: List[Dict[str, Any]]):
+    """Set relevance_score (0-100) on every item; groups are keyed by item type"""
+    if RELEVANCE_SCORER == "llm":
+        for item_type, items in groups.items():
+            scores = await asyncio.gather(*(calculate_relevance_score(query, item, item_type) for item in items))
+            for item, score in zip(items, scores):
+                item["relevance_score"] = round(score * 100)
+        return
+    for item_type, scores in BATCH_SCORER.score(query, groups).items():
+        for item, score in zip(groups[item_type], scores):
+            item["relevance_score"] = score
 
 async def calculate_relevance_score(query: str, item: Dict[str, Any], item_type: str) -> float:
     """Calculate relevance score using AI"""
+    item_key = item.get("nct_id") or item.get("pubmed_id") or item.get("id") or item.get("name") or item.get("title")
+    key = ("score", item_type, normalize_query(query), item_key, item.get("title") or item.get("name"))
+    return await LLM_FLIGHT.do(key, lambda: score_with_llm(query, item, item_type))
+
+async def score_with_llm(query: str, item: Dict[str, Any], item_type: str) -> float:
     try:
         chat = LlmChat(api_key=LLM_KEY, session_id=f"scoring_{item_type}")
         chat.with_model("openai", "gpt-5")
@@ -186,6 +330,9 @@ Focus on: treatment approaches, key research areas, and potential next steps."""
 
 async def smart_search(query: str, user_type: str) -> Dict[str, str]:
     """Determine search intent and optimize query"""
+    return await LLM_FLIGHT.do(("intent", normalize_query(query), user_type), lambda: analyze_search_intent(query, user_type))
+
+async def analyze_search_intent(query: str, user_type: str) -> Dict[str, str]:
     try:
         chat = LlmChat(api_key=LLM_KEY, session_id="smart_search")
         chat.with_model("openai", "gpt-5")
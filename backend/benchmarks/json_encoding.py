@@ -0,0 +1,128 @@
+"""Compare JSON encode throughput of the default and orjson response paths
+
+Run from the backend directory:
+
+    python -m benchmarks.json_encoding [--repeat 50]
+"""
+import argparse
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+
+from responses import FastJSONResponse, orjson
+
+
+def chat_history(count: int = 1000):
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    return [
+        {
+            "id": str(uuid.UUID(int=i)),
+            "from_user": "patient-1" if i % 2 else "expert-1",
+            "to_user": "expert-1" if i % 2 else "patient-1",
+            "message": f"Message {i}: how are the results from the latest scan? Überprüfung läuft.",
+            "read": i % 3 == 0,
+            "created_at": (start + timedelta(minutes=i)).isoformat()
+        }
+        for i in range(count)
+    ]
+
+
+def favorites(count: int = 50):
+    trials = [
+        {
+            "id": str(uuid.UUID(int=i)),
+            "nct_id": f"NCT{i:08d}",
+            "title": f"Phase 3 study of immunotherapy regimen {i} in glioblastoma",
+            "description": "Randomized, double-blind study. " * 20,
+            "phase": "PHASE3",
+            "status": "RECRUITING",
+            "location": "Boston, United States",
+            "eligibility": "Inclusion Criteria:\n* Age 18-75\n* Confirmed diagnosis\n" * 40,
+            "contact": "trials@example.org",
+            "conditions": ["Glioblastoma", "Brain Cancer"]
+        }
+        for i in range(count)
+    ]
+    publications = [
+        {
+            "id": str(uuid.UUID(int=10_000 + i)),
+            "pubmed_id": f"PMID{38_000_000 + i}",
+            "title": f"Checkpoint inhibitors in recurrent glioma, cohort {i}",
+            "authors": ["Johnson S", "Chen M", "Rodriguez E"],
+            "abstract": "Background: recurrent glioma has limited options. " * 15,
+            "url": f"https://pubmed.ncbi.nlm.nih.gov/{38_000_000 + i}/",
+            "published_date": "2024 Mar 15",
+            "keywords": ["glioma", "immunotherapy"],
+            "relevance_score": 87.5
+        }
+        for i in range(count)
+    ]
+    return {"trials": trials, "publications": publications, "experts": []}
+
+
+def with_datetimes(count: int = 1000):
+    """Payload carrying real datetime objects, as a handler might return them"""
+    start = datetime(2024, 1, 1, 12, 30, 15, 123456, tzinfo=timezone.utc)
+    return [{"id": i, "created_at": start + timedelta(seconds=i), "naive": datetime(2024, 5, 1, 8, i % 60)} for i in range(count)]
+
+
+PAYLOADS = {
+    "chat_history_1000": chat_history,
+    "favorites_nested_50": favorites,
+    "datetimes_1000": with_datetimes
+}
+
+
+def default_path(content):
+    """What FastAPI does for a route without a response_model"""
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def fast_encoded_path(content):
+    return FastJSONResponse(jsonable_encoder(content)).body
+
+
+def fast_direct_path(content):
+    """Handler returns FastJSONResponse itself, skipping jsonable_encoder"""
+    return FastJSONResponse(content).body
+
+
+PATHS = {
+    "default": default_path,
+    "orjson+encoder": fast_encoded_path,
+    "orjson direct": fast_direct_path
+}
+
+
+def measure(fn, content, repeat: int) -> float:
+    fn(content)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn(content)
+    return (time.perf_counter() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    if orjson is None:
+        print("orjson is not installed; FastJSONResponse falls back to the stdlib encoder")
+
+    for name, build in PAYLOADS.items():
+        content = build()
+        expected = default_path(content)
+        print(f"\n{name} ({len(expected) / 1024:.1f} KiB)")
+        for label, fn in PATHS.items():
+            identical = fn(content) == expected
+            seconds = measure(fn, content, args.repeat)
+            mib_per_s = len(expected) / seconds / (1024 * 1024)
+            print(f"  {label:<16} {seconds * 1000:8.3f} ms/op {mib_per_s:9.1f} MiB/s  identical={identical}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""Throughput and latency benchmarks for the API against local stand-ins
+
+Runs server.app in-process over httpx's ASGI transport, backed by an
+in-memory Mongo stand-in (or any storage.py backend with --storage-url) and the
+simulated PubMed, ClinicalTrials.gov and LLM backends from simulator.py,
+with configurable latency distributions, error rates and rate limits.
+Run from the backend directory:
+
+    python -m benchmarks.load                                  # all scenarios
+    python -m benchmarks.load -s chat_polling -n 2000 -c 50
+    python -m benchmarks.load -s smart_search --upstream-error-rate 0.1 --upstream-rate-limit 3
+    python -m benchmarks.load --save main                      # write baselines/main.json
+    python -m benchmarks.load --compare main --tolerance 15    # exit 1 on regression
+    python -m benchmarks.load --storage-url sqlite+aiosqlite:////tmp/bench.db
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+
+from benchmarks import scenarios
+from memory_db import MemoryDatabase
+from simulator import FaultProfile, SimulatedLlmChat, simulated_backends
+
+BASELINE_DIR = Path(__file__).parent / "baselines"
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(pct / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+async def run_scenario(ctx: scenarios.BenchContext, run_one, requests: int, concurrency: int) -> Dict[str, float]:
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    errors = 0
+    counter = itertools.count()
+
+    async def worker():
+        nonlocal errors
+        while (i := next(counter)) < requests:
+            started = time.perf_counter()
+            try:
+                response = await run_one(ctx, i)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                if response.status_code >= 400:
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+        "rps": round(requests / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results: Dict[str, dict], baseline: dict, tolerance: float) -> List[str]:
+    """Scenarios whose p95 rose or throughput fell by more than tolerance percent"""
+    regressions = []
+    print(f"\nCompared with baseline {baseline.get('commit')} ({baseline.get('created_at')}):")
+    for name, current in results.items():
+        previous = baseline["scenarios"].get(name)
+        if not previous:
+            continue
+        p95_change = (current["p95_ms"] - previous["p95_ms"]) / previous["p95_ms"] * 100 if previous["p95_ms"] else 0.0
+        rps_change = (current["rps"] - previous["rps"]) / previous["rps"] * 100 if previous["rps"] else 0.0
+        regressed = p95_change > tolerance or rps_change < -tolerance
+        print(f"  {name:<22} p95 {p95_change:+7.1f}%  rps {rps_change:+7.1f}%{'  REGRESSION' if regressed else ''}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def print_table(results: Dict[str, dict]):
+    print(f"\n{'scenario':<22}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for name, r in results.items():
+        print(f"{name:<22}{r['rps']:>10.1f}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['errors']:>8}")
+
+
+async def main_async(args) -> int:
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.environ.setdefault("DB_NAME", args.db_name)
+    if args.storage_url:
+        os.environ["STORAGE_URL"] = args.storage_url
+    import server
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    if args.storage_url:
+        # server opened STORAGE_URL on import
+        for name in await server.db.list_collection_names():
+            await server.db[name].drop()
+        await server.ensure_indexes()
+    else:
+        server.db = MemoryDatabase(args.db_name, latency=args.db_latency / 1000)
+        server.read_db = server.db
+        server.change_feed.db = server.db
+
+    dataset = await scenarios.seed(server.db, server, users=args.users, catalog=args.catalog, messages_per_chat=args.messages)
+
+    upstream = dict(latency=args.upstream_latency, error_rate=args.upstream_error_rate, rate_limit=args.upstream_rate_limit)
+    results = {}
+    async with simulated_backends(
+        pubmed=FaultProfile(seed=args.seed, **upstream),
+        trials=FaultProfile(seed=args.seed + 1, **upstream),
+        llm=FaultProfile(args.llm_latency, args.llm_error_rate, seed=args.seed + 2),
+        modules=[server]
+    ) as simulator:
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=60) as client:
+            ctx = scenarios.BenchContext(client=client, **dataset)
+            for name in args.scenarios:
+                run_one = scenarios.SCENARIOS[name]
+                await run_scenario(ctx, run_one, args.warmup, min(args.concurrency, max(args.warmup, 1)))
+                results[name] = await run_scenario(ctx, run_one, args.requests, args.concurrency)
+                print(f"{name}: {results[name]['rps']:.1f} req/s, p95 {results[name]['p95_ms']:.2f} ms", file=sys.stderr)
+        upstream_calls = dict(simulator.stats, llm=SimulatedLlmChat.calls)
+
+    await server.storage.close()
+    print_table(results)
+    if upstream_calls:
+        print("\nupstream calls: " + ", ".join(f"{k}={v}" for k, v in sorted(upstream_calls.items())))
+
+    status = 0
+    if args.compare:
+        baseline = json.loads((BASELINE_DIR / f"{args.compare}.json").read_text())
+        if compare(results, baseline, args.tolerance):
+            status = 1
+
+    if args.save:
+        BASELINE_DIR.mkdir(exist_ok=True)
+        path = BASELINE_DIR / f"{args.save}.json"
+        path.write_text(json.dumps({
+            "commit": git_commit(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "config": {k: v for k, v in vars(args).items() if k not in ("save", "compare")},
+            "scenarios": results
+        }, indent=2) + "\n")
+        print(f"\nSaved baseline to {path}")
+    return status
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-s", "--scenario", dest="scenarios", action="append", choices=sorted(scenarios.SCENARIOS),
+                        help="scenario to run (repeatable, default: all)")
+    parser.add_argument("-n", "--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("-c", "--concurrency", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests before each scenario")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--catalog", type=int, default=200, help="trials and publications to seed")
+    parser.add_argument("--messages", type=int, default=200, help="messages per patient conversation")
+    parser.add_argument("--db-latency", type=float, default=0.5, help="in-memory DB round trip in ms")
+    parser.add_argument("--upstream-latency", default="lognormal:150:0.4",
+                        help="PubMed/ClinicalTrials.gov latency distribution in ms, e.g. 150 or uniform:50:250")
+    parser.add_argument("--upstream-error-rate", type=float, default=0.0)
+    parser.add_argument("--upstream-rate-limit", type=float, default=0.0, help="upstream requests/s before 429 (0 = unlimited)")
+    parser.add_argument("--llm-latency", default="lognormal:400:0.3", help="LLM completion latency distribution in ms")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0, help="seed for simulated latency and failures")
+    parser.add_argument("--storage-url", help="mongodb://, postgresql+asyncpg:// or sqlite+aiosqlite:// URL to use instead "
+                                              "of the in-memory stand-in (its collections are dropped)")
+    parser.add_argument("--db-name", default="curalink_benchmark")
+    parser.add_argument("--save", metavar="NAME", help="write results to baselines/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="compare with baselines/NAME.json")
+    parser.add_argument("--tolerance", type=float, default=10.0, help="allowed regression in percent")
+    args = parser.parse_args(argv)
+    args.scenarios = args.scenarios or list(scenarios.SCENARIOS)
+    return args
+
+
+def main(argv=None):
+    sys.exit(asyncio.run(main_async(parse_args(argv))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""Load-test scenarios and the dataset they run against"""
+import random
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timezone, timedelta
+from typing import Awaitable, Callable, Dict, List
+
+import httpx
+
+PASSWORD = "benchmark-password"
+
+SEARCH_QUERIES = [
+    "glioblastoma immunotherapy",
+    "lung cancer targeted therapy",
+    "type 2 diabetes insulin",
+    "rare blood disorder gene therapy",
+    "breast cancer clinical trials"
+]
+
+
+@dataclass
+class BenchContext:
+    client: httpx.AsyncClient
+    patients: List[dict]
+    researchers: List[dict]
+    trial_ids: List[str]
+    etags: Dict[str, str] = field(default_factory=dict)
+
+    def patient(self, i: int) -> dict:
+        return self.patients[i % len(self.patients)]
+
+    def researcher(self, i: int) -> dict:
+        return self.researchers[i % len(self.researchers)]
+
+
+def auth(user: dict) -> dict:
+    return {"Authorization": f"Bearer {user['token']}"}
+
+
+async def seed(db, server, users: int = 200, catalog: int = 200, messages_per_chat: int = 200) -> dict:
+    """Insert a deterministic dataset and return the users it created"""
+    rng = random.Random(42)
+    now = datetime(2024, 6, 1, tzinfo=timezone.utc)
+    password_hash = server.pwd_context.hash(PASSWORD)
+
+    patients, researchers, user_docs, profiles, researcher_profiles, experts = [], [], [], [], [], []
+    for i in range(users):
+        user_type = "researcher" if i % 4 == 0 else "patient"
+        user_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        email = f"{user_type}{i}@bench.example"
+        user_docs.append({"id": user_id, "email": email, "password_hash": password_hash, "user_type": user_type, "created_at": now.isoformat()})
+        user = {"user_id": user_id, "email": email, "token": server.create_access_token(user_id, user_type)}
+        if user_type == "researcher":
+            researchers.append(user)
+            researcher_profiles.append({"id": str(uuid.uuid4()), "user_id": user_id, "specialties": ["Oncology"], "research_interests": ["Immunotherapy"], "availability": True, "bio": "Researcher bio", "created_at": now.isoformat()})
+            experts.append({"id": str(uuid.uuid4()), "user_id": user_id, "name": email.split("@")[0], "specialty": ["Oncology"], "research_interests": ["Immunotherapy"], "is_registered": True, "bio": "Researcher bio", "created_at": now.isoformat()})
+        else:
+            patients.append(user)
+            profiles.append({"id": str(uuid.uuid4()), "user_id": user_id, "conditions": ["Glioblastoma"], "location": "Boston, USA", "raw_input": "brain cancer", "created_at": now.isoformat()})
+
+    trials = [{
+        "id": str(uuid.uuid4()),
+        "nct_id": f"NCT{10_000_000 + i}",
+        "title": f"Phase {i % 3 + 1} trial {i} of immunotherapy",
+        "description": "Randomized study of a novel regimen. " * 10,
+        "phase": f"Phase {i % 3 + 1}",
+        "status": "Recruiting" if i % 2 else "Completed",
+        "location": "Boston, USA",
+        "eligibility": "Inclusion Criteria:\n* Age 18-75\n" * 50,
+        "contact": "trials@example.org",
+        "conditions": ["Glioblastoma"],
+        "created_by": researchers[i % len(researchers)]["user_id"],
+        "created_at": (now - timedelta(days=i)).isoformat()
+    } for i in range(catalog)]
+    publications = [{
+        "id": str(uuid.uuid4()),
+        "pubmed_id": f"PMID{38_000_000 + i}",
+        "title": f"Outcomes of cohort {i}",
+        "authors": ["Johnson S", "Chen M"],
+        "abstract": "Background and methods. " * 40,
+        "url": f"https://pubmed.ncbi.nlm.nih.gov/{38_000_000 + i}/",
+        "keywords": ["glioma"],
+        "published_date": "2024-03-15"
+    } for i in range(catalog)]
+    forums = [{
+        "id": str(uuid.uuid4()),
+        "category": "Cancer Research",
+        "title": f"Forum {i}",
+        "description": "Discussion forum",
+        "created_by": researchers[i % len(researchers)]["user_id"],
+        "created_at": now.isoformat()
+    } for i in range(max(catalog // 10, 1))]
+
+    # Each patient chats with one researcher
+    messages = []
+    for n, patient in enumerate(patients):
+        peer = researchers[n % len(researchers)]
+        patient["peer"] = peer["user_id"]
+        for m in range(messages_per_chat):
+            sender, recipient = (patient, peer) if m % 2 else (peer, patient)
+            messages.append({
+                "id": str(uuid.uuid4()),
+                "from_user": sender["user_id"],
+                "to_user": recipient["user_id"],
+                "message": f"Message {m} about the treatment plan",
+                "read": True,
+                "created_at": (now + timedelta(minutes=m)).isoformat()
+            })
+
+    favorites = [{
+        "id": str(uuid.uuid4()),
+        "user_id": patient["user_id"],
+        "item_type": "trial",
+        "item_id": trials[(n * 7 + k) % len(trials)]["id"],
+        "created_at": now.isoformat()
+    } for n, patient in enumerate(patients) for k in range(10)]
+
+    for name, docs in [
+        ("users", user_docs), ("patient_profiles", profiles), ("researcher_profiles", researcher_profiles),
+        ("health_experts", experts), ("clinical_trials", trials), ("publications", publications),
+        ("forums", forums), ("messages", messages), ("favorites", favorites)
+    ]:
+        if docs:
+            await db[name].insert_many(docs)
+
+    return {"patients": patients, "researchers": researchers, "trial_ids": [t["id"] for t in trials]}
+
+
+async def login_storm(ctx: BenchContext, i: int) -> httpx.Response:
+    user = ctx.patient(i)
+    return await ctx.client.post("/api/auth/login", json={"email": user["email"], "password": PASSWORD})
+
+
+async def patient_dashboard(ctx: BenchContext, i: int) -> httpx.Response:
+    return await ctx.client.get("/api/patients/dashboard", headers=auth(ctx.patient(i)))
+
+
+async def researcher_dashboard(ctx: BenchContext, i: int) -> httpx.Response:
+    return await ctx.client.get("/api/researchers/dashboard", headers=auth(ctx.researcher(i)))
+
+
+async def smart_search(ctx: BenchContext, i: int) -> httpx.Response:
+    query = SEARCH_QUERIES[i % len(SEARCH_QUERIES)]
+    return await ctx.client.post("/api/search/smart", json={"query": query}, headers=auth(ctx.patient(i)))
+
+
+async def chat_polling(ctx: BenchContext, i: int) -> httpx.Response:
+    """Clients poll their open conversation, revalidating with the last ETag"""
+    user = ctx.patient(i)
+    headers = auth(user)
+    key = f"chat:{user['user_id']}"
+    if key in ctx.etags:
+        headers["If-None-Match"] = ctx.etags[key]
+    response = await ctx.client.get(f"/api/chat/messages/{user['peer']}", headers=headers)
+    if "etag" in response.headers:
+        ctx.etags[key] = response.headers["etag"]
+    return response
+
+
+async def favorites(ctx: BenchContext, i: int) -> httpx.Response:
+    """Alternate between toggling a saved trial and loading the favorites page"""
+    user = ctx.patient(i)
+    if i % 2:
+        item_id = ctx.trial_ids[i % len(ctx.trial_ids)]
+        return await ctx.client.post("/api/favorites", json={"item_type": "trial", "item_id": item_id}, headers=auth(user))
+    return await ctx.client.get("/api/favorites", headers=auth(user))
+
+
+SCENARIOS: Dict[str, Callable[[BenchContext, int], Awaitable[httpx.Response]]] = {
+    "login_storm": login_storm,
+    "patient_dashboard": patient_dashboard,
+    "researcher_dashboard": researcher_dashboard,
+    "smart_search": smart_search,
+    "chat_polling": chat_polling,
+    "favorites": favorites
+}
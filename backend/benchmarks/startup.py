@@ -0,0 +1,108 @@
+"""Startup-time profile of the API: import time per module, time per startup
+hook and the latency of the first requests
+
+Imports are measured in a fresh interpreter with `python -X importtime`, so
+nothing is cached. The app is then started in-process on the memory://
+backend (or --storage-url) and its first requests are timed, with or without
+the warm-up hook. Run from the backend directory:
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --top 40 --no-warmup
+    python -m benchmarks.startup --storage-url sqlite+aiosqlite:////tmp/startup.db
+"""
+import argparse
+import asyncio
+import logging
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+import httpx
+
+IMPORT_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+# Requests whose handlers import or load something on first use
+FIRST_REQUESTS = ["/api/metrics/upstreams", "/api/search/semantic?query=brain%20tumor", "/api/"]
+
+
+def profile_imports(module: str, env: Dict[str, str]) -> List[Tuple[str, int, int, int]]:
+    """(module, self us, cumulative us, depth) for every module `import module` loads"""
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                               env=env, capture_output=True, text=True)
+    if completed.returncode:
+        sys.stderr.write(completed.stderr[-2000:])
+        raise SystemExit(f"import {module} failed")
+    rows = []
+    for line in completed.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            rows.append((name, int(own), int(cumulative), (len(indent) - 1) // 2))
+    return rows
+
+
+def print_imports(rows: List[Tuple[str, int, int, int]], top: int):
+    total = sum(own for _, own, _, _ in rows)
+    print(f"\nimport server: {total / 1000:.1f} ms, {len(rows)} modules")
+
+    packages = defaultdict(int)
+    for name, own, _, _ in rows:
+        packages[name.split(".")[0]] += own
+    print(f"\n{'package':<40}{'ms':>10}{'share':>8}")
+    for name, own in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        print(f"{name:<40}{own / 1000:>10.1f}{own / total * 100:>7.1f}%")
+
+    # Top-level imports of the backend's own modules, and what each pulls in
+    print(f"\n{'module (cumulative)':<40}{'ms':>10}")
+    for name, _, cumulative, _ in sorted((r for r in rows if r[3] <= 1), key=lambda r: -r[2])[:top]:
+        print(f"{name:<40}{cumulative / 1000:>10.1f}")
+
+
+async def profile_startup(warmup: bool):
+    os.environ["STARTUP_WARMUP"] = "1" if warmup else "0"
+    started = time.perf_counter()
+    import server
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    print(f"\nimport server (in-process): {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    print(f"\n{'startup hook':<40}{'ms':>10}")
+    for hook in server.app.router.on_startup:
+        started = time.perf_counter()
+        await hook()
+        print(f"{hook.__name__:<40}{(time.perf_counter() - started) * 1000:>10.1f}")
+
+    print(f"\n{'first requests' + (' (warmed up)' if warmup else ''):<40}{'ms':>10}{'again':>10}")
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://startup") as client:
+        for path in FIRST_REQUESTS:
+            timings = []
+            for _ in range(2):
+                started = time.perf_counter()
+                await client.get(path)
+                timings.append((time.perf_counter() - started) * 1000)
+            print(f"{path:<40}{timings[0]:>10.1f}{timings[1]:>10.1f}")
+
+    for hook in server.app.router.on_shutdown:
+        await hook()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--top", type=int, default=20, help="rows per table")
+    parser.add_argument("--no-warmup", action="store_true", help="start without the warm-up hook")
+    parser.add_argument("--storage-url", default="memory://", help="storage backend URL (storage.py)")
+    parser.add_argument("--db-name", default="startup")
+    args = parser.parse_args()
+
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.environ.setdefault("DB_NAME", args.db_name)
+    os.environ["STORAGE_URL"] = args.storage_url
+    print_imports(profile_imports("server", dict(os.environ)), args.top)
+    asyncio.run(profile_startup(not args.no_warmup))
+
+
+if __name__ == "__main__":
+    main()
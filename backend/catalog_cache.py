@@ -0,0 +1,81 @@
+"""Read-through cache for catalog reads: trials, publications, experts, forums
+
+Catalog listings and detail pages change rarely but are read on every page
+load. CatalogCache keeps their results per namespace in a StaleCache for
+CATALOG_CACHE_TTL seconds. Concurrent misses for the same read share one
+query.
+
+Writes to a collection call invalidate() with its namespace. The
+invalidation is published on the shared state's pub/sub, so every worker
+drops its entries. Each namespace has a generation counter, so a read that
+started before an invalidation does not store its result afterwards.
+change_feed.py invalidates on writes made outside the API as well, so the
+TTL only bounds staleness should an invalidation be missed.
+"""
+import os
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from shared_state import get_state
+from upstream import SingleFlight, StaleCache
+
+CATALOG_CACHE_TTL = float(os.environ.get('CATALOG_CACHE_TTL', '600'))
+CATALOG_CACHE_MAX_ENTRIES = int(os.environ.get('CATALOG_CACHE_MAX_ENTRIES', '1000'))
+CATALOG_NAMESPACES = ("trials", "publications", "experts", "forums")
+INVALIDATION_CHANNEL = "catalog_cache"
+
+
+class CatalogCache:
+    def __init__(self, namespaces=CATALOG_NAMESPACES, ttl: float = CATALOG_CACHE_TTL,
+                 max_entries: int = CATALOG_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.caches = {namespace: StaleCache(max_entries, ttl, stale_ttl=ttl) for namespace in namespaces}
+        self.generations = {namespace: 0 for namespace in namespaces}
+        self.invalidations = {namespace: 0 for namespace in namespaces}
+        self.flight = SingleFlight()
+
+    async def get(self, namespace: str, key: Hashable, load: Callable[[], Awaitable[Any]]):
+        """Cached result of load() for key; callers get their own copy"""
+        if self.ttl <= 0:
+            return await load()
+        cache = self.caches[namespace]
+        hit = cache.get(key)
+        if hit:
+            cache.hits += 1
+            return hit[0]
+        cache.misses += 1
+        generation = self.generations[namespace]
+
+        async def fill():
+            value = await load()
+            if self.generations[namespace] == generation:
+                cache.set(key, value)
+            return value
+
+        return await self.flight.do((namespace, generation, key), fill)
+
+    async def invalidate(self, *namespaces: str):
+        """Drop cached reads of namespaces in this worker and the others"""
+        await get_state().publish(INVALIDATION_CHANNEL, {"namespaces": list(namespaces)})
+
+    def drop(self, namespaces):
+        for namespace in namespaces:
+            self.generations[namespace] += 1
+            self.invalidations[namespace] += 1
+            self.caches[namespace].clear()
+
+    async def on_invalidation(self, message: Dict[str, Any]):
+        self.drop(message["namespaces"])
+
+    def subscribe(self, state):
+        state.subscribe(INVALIDATION_CHANNEL, self.on_invalidation)
+
+    def metrics(self) -> Dict[str, Any]:
+        metrics = {"ttl_seconds": self.ttl}
+        for namespace, cache in self.caches.items():
+            lookups = cache.hits + cache.misses
+            metrics[namespace] = {
+                "entries": cache.metrics()["entries"], "hits": cache.hits, "misses": cache.misses,
+                "hit_rate": round(cache.hits / lookups, 3) if lookups else 0.0,
+                "invalidations": self.invalidations[namespace]
+            }
+        return metrics
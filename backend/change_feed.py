@@ -0,0 +1,240 @@
+"""Data change events for caches and indexes, including writes made outside the API
+
+ChangeFeed watches the collections in WATCHED_COLLECTIONS and publishes what
+changed on the shared state's "changes" channel, so every worker receives it:
+
+    {"collection": "messages", "operation": "insert", "ids": [...],
+     "from_user": [...], "to_user": [...]}
+
+`ids` is None when the changed documents are not known (deletes, or a
+document gone before it could be looked up). Routing fields listed for a
+collection carry the distinct values of the changed documents.
+
+On a MongoDB replica set the feed reads a change stream. Standalone MongoDB
+and the other storage backends have none, so the feed polls instead: new
+documents by created_at, and deletes by a drop in the collection's document
+count. A count that grows by more than the new documents found means writes
+without a usable created_at; the feed then publishes a "resync" event, on
+which subscribers rebuild what they hold for the collection, as they do when
+change stream history is lost. Polling does not see updates made outside the
+API; those still expire with the caches' TTL.
+
+One worker runs the feed, holding a lease in the shared state; the others
+take over if it stops renewing. The resume token and poll watermarks are
+saved with each renewal, so a new leader continues where the last one was.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from pymongo.errors import OperationFailure
+
+CHANGE_FEED = os.environ.get('CHANGE_FEED', '1') != '0'
+CHANGE_FEED_POLL_INTERVAL = float(os.environ.get('CHANGE_FEED_POLL_INTERVAL', '2'))
+# The leader renews its lease every third of this; a standby takes over once it lapses
+CHANGE_FEED_LEASE_TTL = float(os.environ.get('CHANGE_FEED_LEASE_TTL', '30'))
+CHANGE_FEED_BATCH = 500
+CHANGES_CHANNEL = "changes"
+LEASE_KEY = "change_feed"
+CHECKPOINT_KEY = "change_feed:checkpoint"
+CHECKPOINT_TTL = 7 * 24 * 3600
+
+# Collection -> fields whose values events carry for routing
+WATCHED_COLLECTIONS: Dict[str, Sequence[str]] = {
+    "clinical_trials": (),
+    "health_experts": (),
+    "forums": (),
+    "forum_posts": ("forum_id", "thread_id"),
+    "messages": ("from_user", "to_user")
+}
+# $changeStream on a standalone server, and change stream history that has rolled off the oplog
+CHANGE_STREAMS_UNSUPPORTED = (40573,)
+CHANGE_STREAM_HISTORY_LOST = (280, 286)
+
+logger = logging.getLogger(__name__)
+
+
+class ChangeFeed:
+    def __init__(self, db, state, change_streams: bool = True, collections: Dict[str, Sequence[str]] = WATCHED_COLLECTIONS,
+                 poll_interval: float = CHANGE_FEED_POLL_INTERVAL, lease_ttl: float = CHANGE_FEED_LEASE_TTL):
+        self.db = db
+        self.state = state
+        self.change_streams = change_streams
+        self.collections = dict(collections)
+        self.poll_interval = poll_interval
+        self.lease_ttl = lease_ttl
+        self.mode = "stopped"
+        self.published = 0
+        self.takeovers = 0
+        self._resume_token: Optional[Dict[str, Any]] = None
+        self._marks: Dict[str, Dict[str, Any]] = {}
+        self._counts: Dict[str, int] = {}
+        self._renewed_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self.mode not in ("stopped", "standby"):
+            await self._save_checkpoint()
+            await self.state.release_lease(LEASE_KEY)
+        self.mode = "stopped"
+
+    async def _run(self):
+        while True:
+            try:
+                if not await self.state.acquire_lease(LEASE_KEY, self.lease_ttl):
+                    self.mode = "standby"
+                    await asyncio.sleep(self.lease_ttl / 3)
+                    continue
+                self.takeovers += 1
+                self._renewed_at = time.monotonic()
+                await self._load_checkpoint()
+                await self._consume()
+                # Lease lost to another worker
+                self.mode = "standby"
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Change feed failed; retrying")
+                await self.state.release_lease(LEASE_KEY)
+                self.mode = "standby"
+                await asyncio.sleep(self.poll_interval)
+
+    async def _consume(self):
+        if self.change_streams:
+            try:
+                await self._watch()
+                return
+            except OperationFailure as e:
+                if e.code not in CHANGE_STREAMS_UNSUPPORTED:
+                    raise
+                logger.info("Change streams unavailable (%s); polling every %ss", e, self.poll_interval)
+                self.change_streams = False
+        await self._poll()
+
+    async def _heartbeat(self) -> bool:
+        """Renew the lease and save the checkpoint every third of the lease TTL;
+        False once another worker holds the lease
+        """
+        if time.monotonic() - self._renewed_at < self.lease_ttl / 3:
+            return True
+        if not await self.state.renew_lease(LEASE_KEY, self.lease_ttl):
+            logger.warning("Change feed lease lost")
+            return False
+        self._renewed_at = time.monotonic()
+        await self._save_checkpoint()
+        return True
+
+    async def _load_checkpoint(self):
+        checkpoint = await self.state.get(CHECKPOINT_KEY) or {}
+        self._resume_token = checkpoint.get("resume_token")
+        self._marks = checkpoint.get("marks", {})
+        self._counts = checkpoint.get("counts", {})
+
+    async def _save_checkpoint(self):
+        await self.state.set(CHECKPOINT_KEY, {
+            "resume_token": self._resume_token, "marks": self._marks, "counts": self._counts
+        }, CHECKPOINT_TTL)
+
+    async def publish(self, collection: str, operation: str, docs: Optional[List[Dict[str, Any]]]):
+        event = {"collection": collection, "operation": operation, "ids": None}
+        if docs is not None:
+            event["ids"] = [d["id"] for d in docs if d.get("id")]
+            for field in self.collections[collection]:
+                event[field] = sorted({d[field] for d in docs if d.get(field) is not None})
+        self.published += 1
+        await self.state.publish(CHANGES_CHANNEL, event)
+
+    # Change streams
+    async def _watch(self):
+        pipeline = [{"$match": {
+            "ns.coll": {"$in": list(self.collections)},
+            "operationType": {"$in": ["insert", "update", "replace", "delete"]}
+        }}]
+        try:
+            stream = self.db.watch(pipeline, full_document="updateLookup", resume_after=self._resume_token,
+                                   max_await_time_ms=int(self.poll_interval * 1000))
+            async with stream:
+                self.mode = "change_stream"
+                while True:
+                    change = await stream.try_next()
+                    if change is not None:
+                        document = change.get("fullDocument")
+                        await self.publish(change["ns"]["coll"], change["operationType"],
+                                           None if document is None else [document])
+                    self._resume_token = stream.resume_token
+                    if not await self._heartbeat():
+                        return
+        except OperationFailure as e:
+            if e.code not in CHANGE_STREAM_HISTORY_LOST:
+                raise
+            # Changes since the checkpoint are gone; subscribers rebuild what they cache
+            logger.warning("Change stream history lost (%s); resynchronizing", e)
+            self._resume_token = None
+            for collection in self.collections:
+                await self.publish(collection, "resync", None)
+
+    # Polling
+    async def _poll(self):
+        self.mode = "polling"
+        while True:
+            for collection in self.collections:
+                await self._poll_collection(collection)
+            if not await self._heartbeat():
+                return
+            await asyncio.sleep(self.poll_interval)
+
+    async def _poll_collection(self, collection: str):
+        fields = self.collections[collection]
+        projection = {"_id": 0, "id": 1, "created_at": 1, **{field: 1 for field in fields}}
+        mark = self._marks.get(collection)
+        if mark is None:
+            # Start from the newest document
+            latest = await self.db[collection].find({}, projection).sort("created_at", -1).limit(1).to_list(1)
+            self._marks[collection] = {"created_at": latest[0].get("created_at", "") if latest else "",
+                                       "ids": [d["id"] for d in latest if d.get("id")]}
+            self._counts[collection] = await self.db[collection].estimated_document_count()
+            return
+
+        # Counted before the find: a document inserted in between is found now
+        # and counted next time, which only costs a spurious delete signal
+        count = await self.db[collection].estimated_document_count()
+
+        # Documents created at the watermark itself were seen by the last poll
+        seen = set(mark["ids"])
+        limit = CHANGE_FEED_BATCH + len(seen)
+        docs = await self.db[collection].find(
+            {"created_at": {"$gte": mark["created_at"]}}, projection
+        ).sort("created_at", 1).limit(limit).to_list(limit)
+        new = [d for d in docs if d.get("id") not in seen]
+        if new:
+            newest = new[-1]["created_at"]
+            at_mark = seen if newest == mark["created_at"] else set()
+            self._marks[collection] = {
+                "created_at": newest, "ids": sorted(at_mark | {d["id"] for d in new if d["created_at"] == newest})
+            }
+
+        expected = self._counts[collection] + len(new)
+        self._counts[collection] = count
+        if new:
+            await self.publish(collection, "insert", new)
+        if count < expected:
+            await self.publish(collection, "delete", None)
+        elif count > expected:
+            # Documents the created_at query cannot see (written without one,
+            # or with an older one); subscribers rescan the collection
+            await self.publish(collection, "resync", None)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {"mode": self.mode, "published": self.published, "takeovers": self.takeovers,
+                "collections": sorted(self.collections)}
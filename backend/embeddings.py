@@ -0,0 +1,482 @@
+"""Local text embeddings and NumPy vector indexes for semantic search
+
+Texts are embedded on the CPU by a hashed feature encoder: words, word
+bigrams, character trigrams (so "tumour" still meets "tumor") and concepts
+from the bundled lexicon in data/concepts.tsv, which is what carries
+"brain tumor" to "glioblastoma". Features are hashed into EMBEDDING_DIM
+signed buckets and the vectors L2-normalized, so cosine similarity is a dot
+product and a query against a whole collection is one matrix multiply.
+
+Trials, publications and experts each have a VectorIndex. With
+EMBEDDING_INDEX_DIR set the indexes are saved there and memory-mapped on
+load. Build or refresh them from the backend directory:
+
+    python embeddings.py
+"""
+import asyncio
+import csv
+import itertools
+import json
+import os
+import re
+import unicodedata
+import zlib
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+CONCEPTS_PATH = Path(__file__).parent / "data" / "concepts.tsv"
+EMBEDDING_DIM = int(os.environ.get("EMBEDDING_DIM", "512"))
+EMBEDDING_INDEX_DIR = os.environ.get("EMBEDDING_INDEX_DIR")
+EMBEDDING_BATCH_SIZE = 1000
+WORD = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset(
+    "a an and are as at be been by for from has have in into is it its of on or that the their this to was were "
+    "which with within without".split()
+)
+
+# Relative weight of each feature kind within a field
+FEATURE_WEIGHTS = {"word": 1.0, "bigram": 0.5, "trigram": 0.2, "concept": 2.0, "broader": 0.7}
+
+# What is embedded for each collection, as (field, weight)
+EMBEDDED_FIELDS = {
+    "clinical_trials": (("title", 3.0), ("conditions", 3.0), ("description", 1.0)),
+    "publications": (("title", 3.0), ("keywords", 2.0), ("mesh_terms", 2.0), ("abstract", 1.0)),
+    "health_experts": (("specialty", 3.0), ("research_interests", 3.0), ("bio", 1.0)),
+}
+
+
+def words(text: str) -> List[str]:
+    """Lowercase, accent-free alphanumeric words"""
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode()
+    return WORD.findall(text.lower())
+
+
+class ConceptLexicon:
+    """Phrases naming a concept, each concept optionally under a broader one"""
+
+    def __init__(self, rows: Iterable[Dict[str, str]]):
+        self.phrases: Dict[Tuple[str, ...], str] = {}
+        self.broader: Dict[str, Optional[str]] = {}
+        for row in rows:
+            self.broader[row["concept"]] = row["broader"] or None
+            for term in row["terms"].split("|"):
+                phrase = tuple(words(term))
+                if phrase:
+                    self.phrases.setdefault(phrase, row["concept"])
+
+    def ancestors(self, concept: str) -> List[str]:
+        chain = []
+        parent = self.broader.get(concept)
+        while parent and parent not in chain and parent != concept:
+            chain.append(parent)
+            parent = self.broader.get(parent)
+        return chain
+
+
+@lru_cache(maxsize=1)
+def concept_lexicon() -> ConceptLexicon:
+    with open(CONCEPTS_PATH, newline="", encoding="utf-8") as f:
+        return ConceptLexicon(csv.DictReader(f, delimiter="\t"))
+
+
+def field_text(value: Any) -> str:
+    if isinstance(value, (list, tuple)):
+        return ". ".join(str(v) for v in value if v)
+    return str(value) if value else ""
+
+
+MASK_32 = np.uint64(0xFFFFFFFF)
+# Multiplier for rolling hashes of word sequences (the 64-bit FNV prime)
+PHRASE_PRIME = 0x100000001B3
+
+
+def word_hash(word: str) -> int:
+    return zlib.crc32(word.encode())
+
+
+def phrase_key(hashes: Iterable[int]) -> int:
+    """Rolling hash of a word sequence; equal to the one encode computes with NumPy"""
+    key = 0
+    for h in hashes:
+        key = (key * PHRASE_PRIME + h) & 0xFFFFFFFFFFFFFFFF
+    return key
+
+
+def _signed_buckets(hashes: np.ndarray, first: int, buckets: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Column and sign of 32-bit feature hashes"""
+    return (first + hashes % np.uint64(buckets)).astype(np.int64), np.where(hashes & np.uint64(0x80000000), 1.0, -1.0)
+
+
+def _sublinear(keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Distinct keys and 1 + log of how often each occurs"""
+    unique, counts = np.unique(keys, return_counts=True)
+    return unique, 1.0 + np.log(counts)
+
+
+class HashedEncoder:
+    """Fixed-width embeddings from hashed text features; no model download or
+    training, and the same text always maps to the same vector
+
+    Each concept has a column of its own, so concepts never collide; words,
+    trigrams and bigrams are hashed into the remaining columns. A batch is
+    encoded at once: texts are split into words, and everything after that
+    (word ids, phrase matching, counting, accumulation into the output
+    matrix) is NumPy over the whole batch, with Python work only per
+    distinct word.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM, lexicon: Optional[ConceptLexicon] = None):
+        self.lexicon = lexicon or concept_lexicon()
+        concepts = sorted(self.lexicon.broader)
+        if dim <= 2 * len(concepts):
+            raise ValueError(f"EMBEDDING_DIM must exceed {2 * len(concepts)} for {len(concepts)} concepts")
+        self.dim = dim
+        self.concept_columns = {concept: i for i, concept in enumerate(concepts)}
+        self.hashed_columns = dim - len(concepts)
+        # ancestors[c, p] = 1 when p is broader than concept c
+        self.ancestors = np.zeros((len(concepts), len(concepts)))
+        for concept, column in self.concept_columns.items():
+            for parent in self.lexicon.ancestors(concept):
+                self.ancestors[column, self.concept_columns[parent]] = 1
+        # Per phrase length: sorted phrase keys and the concept column of each
+        self.phrase_tables: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        by_length: Dict[int, Dict[int, int]] = {}
+        for phrase, concept in self.lexicon.phrases.items():
+            by_length.setdefault(len(phrase), {})[phrase_key(map(word_hash, phrase))] = self.concept_columns[concept]
+        for length, table in by_length.items():
+            keys = np.array(sorted(table), dtype=np.uint64)
+            self.phrase_tables[length] = keys, np.array([table[int(k)] for k in keys], dtype=np.int64)
+        self._word_buckets = lru_cache(maxsize=1 << 17)(self._word_features)
+
+    def _hash(self, feature: str) -> Tuple[int, float]:
+        h = word_hash(feature)
+        return len(self.concept_columns) + h % self.hashed_columns, (1.0 if h & 0x80000000 else -1.0)
+
+    def _word_features(self, word: str) -> Tuple[int, Tuple[int, ...], Tuple[float, ...]]:
+        """Hash of a word, and the (column, signed weight) of it and its
+        character trigrams; stopwords have no features of their own
+        """
+        if word in STOPWORDS:
+            return word_hash(word), (), ()
+        features = [("w:" + word, FEATURE_WEIGHTS["word"])]
+        if len(word) > 3:
+            padded = f"#{word}#"
+            features += [("t:" + padded[i:i + 3], FEATURE_WEIGHTS["trigram"]) for i in range(len(padded) - 2)]
+        columns, values = [], []
+        for feature, weight in features:
+            column, sign = self._hash(feature)
+            columns.append(column)
+            values.append(sign * weight)
+        return word_hash(word), tuple(columns), tuple(values)
+
+    def _hashed_part(self, ids: np.ndarray, segments: np.ndarray, features: List[tuple]):
+        """Segment, column and value arrays of word, trigram and bigram features"""
+        lengths = np.fromiter((len(f[1]) for f in features), dtype=np.int64, count=len(features))
+        flat_columns = np.fromiter(itertools.chain.from_iterable(f[1] for f in features), dtype=np.int64)
+        flat_values = np.fromiter(itertools.chain.from_iterable(f[2] for f in features), dtype=np.float64)
+        offsets = np.cumsum(lengths) - lengths
+        content = lengths[ids] > 0
+        ids, segments = ids[content], segments[content]
+
+        # Each distinct (segment, word) expands to the word's features, scaled by its count
+        vocabulary_size = len(features)
+        pairs, scale = _sublinear(segments * vocabulary_size + ids)
+        pair_segments, pair_words = pairs // vocabulary_size, pairs % vocabulary_size
+        repeats = lengths[pair_words]
+        starts = np.cumsum(repeats) - repeats
+        positions = np.arange(repeats.sum()) - np.repeat(starts, repeats) + np.repeat(offsets[pair_words], repeats)
+        word_segments = np.repeat(pair_segments, repeats)
+        word_columns = flat_columns[positions]
+        word_values = flat_values[positions] * np.repeat(scale, repeats)
+
+        # Bigrams of adjacent non-stopwords within a segment, hashed from the two word hashes
+        hashes = np.fromiter((f[0] for f in features), dtype=np.uint64, count=len(features))
+        adjacent = segments[:-1] == segments[1:]
+        bigram_hashes = (hashes[ids[:-1][adjacent]] * np.uint64(0x9E3779B1) + hashes[ids[1:][adjacent]]) & MASK_32
+        keys, scale = _sublinear(segments[:-1][adjacent].astype(np.uint64) << np.uint64(32) | bigram_hashes)
+        bigram_columns, signs = _signed_buckets(keys & MASK_32, len(self.concept_columns), self.hashed_columns)
+        bigram_segments = (keys >> np.uint64(32)).astype(np.int64)
+        return (np.concatenate([word_segments, bigram_segments]),
+                np.concatenate([word_columns, bigram_columns]),
+                np.concatenate([word_values, signs * scale * FEATURE_WEIGHTS["bigram"]]))
+
+    def _concept_part(self, ids: np.ndarray, segments: np.ndarray, hashes: np.ndarray, segment_count: int) -> np.ndarray:
+        """(segments x concepts) values of the concepts each segment names
+
+        Rolling hashes of every word window within a segment are looked up in
+        the phrase tables, longest phrases first; a match claims its words so
+        shorter phrases inside it do not count again.
+        """
+        token_hashes = hashes[ids]
+        windows = {}
+        keys, valid = token_hashes.copy(), np.ones(len(ids), dtype=bool)
+        for length in range(1, max(self.phrase_tables, default=0) + 1):
+            if length > 1:
+                keys = keys[:-1] * np.uint64(PHRASE_PRIME) + token_hashes[length - 1:]
+                valid = valid[:-1] & (segments[:len(keys)] == segments[length - 1:])
+            windows[length] = keys, valid
+
+        counts = np.zeros((segment_count, len(self.concept_columns)))
+        claimed = np.zeros(len(ids) + 1, dtype=np.int64)
+        for length in sorted(self.phrase_tables, reverse=True):
+            keys, valid = windows[length]
+            table_keys, table_columns = self.phrase_tables[length]
+            found = np.minimum(np.searchsorted(table_keys, keys), len(table_keys) - 1)
+            starts = np.flatnonzero(valid & (table_keys[found] == keys))
+            if not len(starts):
+                continue
+            claimed_before = np.cumsum(claimed[:-1])
+            taken = claimed_before[starts + length - 1] - np.concatenate([[0], claimed_before])[starts]
+            starts = starts[taken == 0]
+            if length > 1 and len(starts) > 1:
+                # Overlapping matches of the same length: keep the leftmost
+                kept, end = [], -1
+                for start in starts.tolist():
+                    if start >= end:
+                        kept.append(start)
+                        end = start + length
+                starts = np.array(kept, dtype=np.int64)
+            for offset in range(length):
+                claimed[starts + offset] = 1
+            columns = table_columns[found[starts]]
+            np.add.at(counts, (segments[starts], columns), 1)
+
+        broader = counts @ self.ancestors
+        values = np.zeros_like(counts)
+        for found, weight in ((counts, FEATURE_WEIGHTS["concept"]), (broader, FEATURE_WEIGHTS["broader"])):
+            present = found > 0
+            values[present] += weight * (1 + np.log(found[present]))
+        return values
+
+    def encode_fields(self, documents: Sequence[Sequence[Tuple[str, float]]]) -> np.ndarray:
+        """One unit row per document, each given as (text, weight) fields"""
+        rows, weights, texts = [], [], []
+        for row, fields in enumerate(documents):
+            for text, weight in fields:
+                tokens = words(text) if text else None
+                if tokens:
+                    rows.append(row)
+                    weights.append(weight)
+                    texts.append(tokens)
+        matrix = np.zeros((len(documents), self.dim), dtype=np.float32)
+        if not texts:
+            return matrix
+        segment_rows, segment_weights = np.array(rows, dtype=np.int64), np.array(weights)
+
+        # Word ids: the position where each word first occurs, renumbered densely
+        tokens = list(itertools.chain.from_iterable(texts))
+        first_seen: Dict[str, int] = {}
+        positions = np.fromiter(map(first_seen.setdefault, tokens, itertools.count()), dtype=np.int64, count=len(tokens))
+        distinct, ids = np.unique(positions, return_inverse=True)
+        segments = np.repeat(np.arange(len(texts)), [len(t) for t in texts])
+        features = [self._word_buckets(tokens[i]) for i in distinct.tolist()]
+        hashes = np.fromiter((f[0] for f in features), dtype=np.uint64, count=len(features))
+
+        segment_ids, columns, values = self._hashed_part(ids, segments, features)
+        flat = np.bincount(segment_rows[segment_ids] * self.dim + columns,
+                           weights=values * segment_weights[segment_ids], minlength=matrix.size)
+        matrix += flat.reshape(matrix.shape).astype(np.float32)
+        concepts = self._concept_part(ids, segments, hashes, len(texts)) * segment_weights[:, None]
+        np.add.at(matrix[:, :len(self.concept_columns)], segment_rows, concepts.astype(np.float32))
+
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        return self.encode_fields([[(text, 1.0)] for text in texts])
+
+
+class VectorIndex:
+    """Unit vectors by document id; top-k cosine search over the whole index
+    is one matrix multiply plus a partial sort
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+        self.ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._vectors = np.zeros((0, dim), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._rows
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._vectors[:len(self.ids)]
+
+    def _reserve(self, rows: int):
+        """Room for `rows` vectors in a writable buffer (copying a memory-map)"""
+        capacity = self._vectors.shape[0]
+        if rows <= capacity and self._vectors.flags.writeable:
+            return
+        grown = np.zeros((max(rows, capacity * 2, 64), self.dim), dtype=np.float32)
+        grown[:len(self.ids)] = self.vectors
+        self._vectors = grown
+
+    def upsert(self, ids: Sequence[str], vectors: np.ndarray):
+        new = [doc_id for doc_id in dict.fromkeys(ids) if doc_id not in self._rows]
+        self._reserve(len(self.ids) + len(new))
+        for doc_id in new:
+            self._rows[doc_id] = len(self.ids)
+            self.ids.append(doc_id)
+        self._vectors[[self._rows[doc_id] for doc_id in ids]] = vectors
+
+    def remove(self, ids: Iterable[str]):
+        """Drop vectors by moving the last row into each freed slot"""
+        for doc_id in ids:
+            row = self._rows.pop(doc_id, None)
+            if row is None:
+                continue
+            self._reserve(len(self.ids))
+            last = len(self.ids) - 1
+            if row != last:
+                moved = self.ids[last]
+                self._vectors[row] = self._vectors[last]
+                self.ids[row] = moved
+                self._rows[moved] = row
+            self.ids.pop()
+
+    def search(self, queries: np.ndarray, k: int, min_score: float = 0.0) -> List[List[Tuple[str, float]]]:
+        """Top-k (id, cosine) per query row, best first"""
+        queries = np.atleast_2d(queries)
+        k = min(k, len(self.ids))
+        if k <= 0:
+            return [[] for _ in range(len(queries))]
+        scores = queries @ self.vectors.T
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in zip(scores, top):
+            ranked = candidates[np.argsort(-row[candidates], kind="stable")]
+            results.append([(self.ids[i], float(row[i])) for i in ranked if row[i] > min_score])
+        return results
+
+    def save(self, directory: Path, name: str):
+        """Write <name>.npy and <name>.ids.json, replacing any previous pair"""
+        directory.mkdir(parents=True, exist_ok=True)
+        vectors_path, ids_path = directory / f"{name}.npy", directory / f"{name}.ids.json"
+        with open(vectors_path.with_suffix(".npy.tmp"), "wb") as f:
+            np.save(f, np.ascontiguousarray(self.vectors))
+        ids_path.with_suffix(".tmp").write_text(json.dumps(self.ids))
+        os.replace(vectors_path.with_suffix(".npy.tmp"), vectors_path)
+        os.replace(ids_path.with_suffix(".tmp"), ids_path)
+
+    @classmethod
+    def load(cls, directory: Path, name: str, mmap: bool = True) -> Optional["VectorIndex"]:
+        """A saved index, memory-mapped read-only until first written; None if absent"""
+        vectors_path, ids_path = directory / f"{name}.npy", directory / f"{name}.ids.json"
+        if not vectors_path.exists() or not ids_path.exists():
+            return None
+        vectors = np.load(vectors_path, mmap_mode="r" if mmap else None)
+        ids = json.loads(ids_path.read_text())
+        if vectors.ndim != 2 or len(ids) != vectors.shape[0]:
+            return None
+        index = cls(vectors.shape[1])
+        index.ids = ids
+        index._rows = {doc_id: row for row, doc_id in enumerate(ids)}
+        index._vectors = vectors
+        return index
+
+
+class SemanticIndex:
+    """A VectorIndex per embedded collection, keyed by document id"""
+
+    def __init__(self, encoder: Optional[HashedEncoder] = None, directory: Optional[str] = EMBEDDING_INDEX_DIR):
+        self.encoder = encoder or HashedEncoder()
+        self.directory = Path(directory) if directory else None
+        self.indexes = {name: VectorIndex(self.encoder.dim) for name in EMBEDDED_FIELDS}
+
+    @staticmethod
+    def document_fields(collection: str, doc: Dict[str, Any]) -> List[Tuple[str, float]]:
+        return [(field_text(doc.get(field)), weight) for field, weight in EMBEDDED_FIELDS[collection]]
+
+    def embed(self, collection: str, docs: Sequence[Dict[str, Any]]) -> np.ndarray:
+        return self.encoder.encode_fields([self.document_fields(collection, d) for d in docs])
+
+    def add(self, collection: str, docs: Sequence[Dict[str, Any]]):
+        """Embed documents (inserted or updated) into the collection's index"""
+        docs = [d for d in docs if d.get("id")]
+        if docs:
+            self.indexes[collection].upsert([d["id"] for d in docs], self.embed(collection, docs))
+
+    def remove(self, collection: str, ids: Iterable[str]):
+        self.indexes[collection].remove(ids)
+
+    def search(self, query: str, collections: Sequence[str], k: int) -> Dict[str, List[Tuple[str, float]]]:
+        """Top-k (id, cosine) per collection for one query"""
+        vector = self.encoder.encode([query])
+        return {name: self.indexes[name].search(vector, k)[0] for name in collections}
+
+    async def sync(self, db, collections: Sequence[str] = tuple(EMBEDDED_FIELDS),
+                   batch_size: int = EMBEDDING_BATCH_SIZE) -> Dict[str, Dict[str, int]]:
+        """Bring the indexes in line with the stored documents: drop ids no
+        longer stored and embed documents the indexes lack. Only ids are read
+        for the comparison; encoding runs in a worker thread so the event loop
+        keeps serving requests meanwhile
+        """
+        counts = {}
+        for name in collections:
+            index = self.indexes[name]
+            stored = {doc["id"] async for doc in db[name].find({}, {"_id": 0, "id": 1}) if doc.get("id")}
+            removed = [doc_id for doc_id in index.ids if doc_id not in stored]
+            index.remove(removed)
+            missing = [doc_id for doc_id in stored if doc_id not in index]
+            projection = {"_id": 0, "id": 1, **{field: 1 for field, _ in EMBEDDED_FIELDS[name]}}
+            added = 0
+            for start in range(0, len(missing), batch_size):
+                ids = missing[start:start + batch_size]
+                docs = await db[name].find({"id": {"$in": ids}}, projection).to_list(len(ids))
+                if docs:
+                    added += await self._add_batch(name, docs)
+            counts[name] = {"added": added, "removed": len(removed)}
+        return counts
+
+    async def _add_batch(self, collection: str, docs: List[Dict[str, Any]]) -> int:
+        vectors = await asyncio.to_thread(self.embed, collection, docs)
+        self.indexes[collection].upsert([d["id"] for d in docs], vectors)
+        return len(docs)
+
+    def load(self) -> Dict[str, int]:
+        """Memory-map saved indexes from the index directory, if any"""
+        counts = {}
+        if self.directory is None:
+            return counts
+        for name in EMBEDDED_FIELDS:
+            index = VectorIndex.load(self.directory, name)
+            if index is not None and index.dim == self.encoder.dim:
+                self.indexes[name] = index
+                counts[name] = len(index)
+        return counts
+
+    def save(self):
+        for name, index in self.indexes.items():
+            index.save(self.directory, name)
+
+
+async def main():
+    from dotenv import load_dotenv
+    from storage import open_storage
+
+    load_dotenv(Path(__file__).parent / '.env')
+    directory = os.environ.get("EMBEDDING_INDEX_DIR") or str(Path(__file__).parent / "data" / "embeddings")
+    semantic = SemanticIndex(directory=directory)
+    semantic.load()
+    storage = open_storage(os.environ.get('STORAGE_URL') or os.environ['MONGO_URL'], os.environ['DB_NAME'])
+    counts = await semantic.sync(storage.db)
+    semantic.save()
+    for name, changed in counts.items():
+        print(f"{name}: embedded {changed['added']}, removed {changed['removed']}, {len(semantic.indexes[name])} in index")
+    print(f"saved to {directory}")
+    await storage.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
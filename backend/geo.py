@@ -0,0 +1,210 @@
+"""Offline geocoding of free-text locations against the bundled gazetteer
+
+Trial sites and experts are stored with a GeoJSON `geo` field (a Point, or a
+MultiPoint for multi-site trials) under a 2dsphere index, so radius and
+nearest-first searches are single indexed queries.
+
+Backfill documents stored before geocoding was added, from the backend
+directory:
+
+    python geo.py
+"""
+import asyncio
+import csv
+import math
+import os
+import re
+import unicodedata
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+GAZETTEER_PATH = Path(__file__).parent / "data" / "gazetteer.tsv"
+EARTH_RADIUS_KM = 6371.0088
+
+COUNTRY_ALIASES = {
+    "usa": "united states", "us": "united states", "u.s.": "united states", "u.s.a.": "united states",
+    "united states of america": "united states", "america": "united states",
+    "uk": "united kingdom", "u.k.": "united kingdom", "great britain": "united kingdom", "britain": "united kingdom",
+    "korea, republic of": "south korea", "republic of korea": "south korea", "korea": "south korea",
+    "russian federation": "russia", "czech republic": "czechia", "the netherlands": "netherlands",
+    "holland": "netherlands", "uae": "united arab emirates", "prc": "china",
+    "taiwan, province of china": "taiwan", "hong kong sar": "hong kong", "viet nam": "vietnam",
+    "türkiye": "turkey", "turkiye": "turkey", "iran, islamic republic of": "iran"
+}
+
+US_STATES = {
+    "al": "alabama", "ak": "alaska", "az": "arizona", "ar": "arkansas", "ca": "california", "co": "colorado",
+    "ct": "connecticut", "de": "delaware", "dc": "district of columbia", "fl": "florida", "ga": "georgia",
+    "hi": "hawaii", "id": "idaho", "il": "illinois", "in": "indiana", "ia": "iowa", "ks": "kansas",
+    "ky": "kentucky", "la": "louisiana", "me": "maine", "md": "maryland", "ma": "massachusetts",
+    "mi": "michigan", "mn": "minnesota", "ms": "mississippi", "mo": "missouri", "mt": "montana",
+    "ne": "nebraska", "nv": "nevada", "nh": "new hampshire", "nj": "new jersey", "nm": "new mexico",
+    "ny": "new york", "nc": "north carolina", "nd": "north dakota", "oh": "ohio", "ok": "oklahoma",
+    "or": "oregon", "pa": "pennsylvania", "ri": "rhode island", "sc": "south carolina", "sd": "south dakota",
+    "tn": "tennessee", "tx": "texas", "ut": "utah", "vt": "vermont", "va": "virginia", "wa": "washington",
+    "wv": "west virginia", "wi": "wisconsin", "wy": "wyoming"
+}
+
+
+def normalize_place(text: str) -> str:
+    """Lowercase, accent-free, single-spaced"""
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode()
+    return " ".join(text.lower().replace("-", " ").split())
+
+
+class Gazetteer:
+    """Places by normalized name and alias, in file order of preference"""
+
+    def __init__(self, rows: Iterable[Dict[str, str]]):
+        self.places: Dict[str, List[Dict[str, Any]]] = {}
+        self.entries: List[Dict[str, Any]] = []
+        self.regions = set()
+        self.countries = set()
+        for row in rows:
+            place = {
+                "name": row["name"],
+                "label": f"{row['name']}, {row['country']}",
+                "region": normalize_place(row["region"]),
+                "country": normalize_place(row["country"]),
+                "latitude": float(row["latitude"]),
+                "longitude": float(row["longitude"])
+            }
+            self.entries.append(place)
+            self.regions.add(place["region"])
+            self.countries.add(place["country"])
+            names = [row["name"]] + [a for a in (row.get("aliases") or "").split("|") if a]
+            for name in {normalize_place(n) for n in names}:
+                self.places.setdefault(name, []).append(place)
+
+    def qualifier(self, part: str) -> Optional[str]:
+        """Canonical region or country name for a location qualifier"""
+        part = COUNTRY_ALIASES.get(part, US_STATES.get(part, part))
+        if part in self.regions or part in self.countries:
+            return part
+        return None
+
+    def lookup(self, text: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Best place for 'City, Region, Country' style text, or None
+
+        Parts may come in any order and include facility names; the first part
+        naming a known place wins, narrowed by any region or country given.
+        """
+        if not text:
+            return None
+        normalized = normalize_place(text)
+        for alias in COUNTRY_ALIASES:
+            if "," in alias:
+                normalized = normalized.replace(alias, COUNTRY_ALIASES[alias])
+        parts = [p.strip(" .") for p in re.split(r"[,;/]", normalized) if p.strip(" .")]
+        qualifiers = {q for q in map(self.qualifier, parts) if q}
+        for part in parts:
+            candidates = self.places.get(part)
+            if not candidates:
+                continue
+            if qualifiers:
+                candidates = [c for c in candidates if c["region"] in qualifiers or c["country"] in qualifiers]
+            if candidates:
+                return candidates[0]
+        return None
+
+
+@lru_cache(maxsize=1)
+def gazetteer() -> Gazetteer:
+    with open(GAZETTEER_PATH, newline="", encoding="utf-8") as f:
+        return Gazetteer(csv.DictReader(f, delimiter="\t"))
+
+
+@lru_cache(maxsize=4096)
+def geocode(text: Optional[str]) -> Optional[Tuple[float, float]]:
+    """(latitude, longitude) of a free-text location, or None"""
+    place = gazetteer().lookup(text)
+    if place is None:
+        return None
+    return place["latitude"], place["longitude"]
+
+
+def point(latitude: float, longitude: float) -> Dict[str, Any]:
+    return {"type": "Point", "coordinates": [longitude, latitude]}
+
+
+def location_geometry(text: Optional[str]) -> Optional[Dict[str, Any]]:
+    """GeoJSON Point for a free-text location, or None"""
+    coordinates = geocode(text)
+    return point(*coordinates) if coordinates else None
+
+
+def trial_geometry(trial: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Point or MultiPoint covering every site of a trial
+
+    Sites carry coordinates when they come from ClinicalTrials.gov; the rest
+    are geocoded from their city, state and country, falling back to the
+    display location.
+    """
+    coordinates = []
+    for site in trial.get("locations") or []:
+        if "lat" in site and "lon" in site:
+            found = (site["lat"], site["lon"])
+        else:
+            found = geocode(", ".join(site.get(k) for k in ("city", "state", "country") if site.get(k)))
+        if found and [found[1], found[0]] not in coordinates:
+            coordinates.append([found[1], found[0]])
+    if not coordinates:
+        return location_geometry(trial.get("location"))
+    if len(coordinates) == 1:
+        return {"type": "Point", "coordinates": coordinates[0]}
+    return {"type": "MultiPoint", "coordinates": coordinates}
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def distance_km(geometry: Optional[Dict[str, Any]], latitude: float, longitude: float) -> Optional[float]:
+    """Distance to the nearest point of a Point/MultiPoint geometry"""
+    if not geometry:
+        return None
+    points = [geometry["coordinates"]] if geometry["type"] == "Point" else geometry["coordinates"]
+    return min(haversine_km(latitude, longitude, lat, lon) for lon, lat in points)
+
+
+def near_query(latitude: float, longitude: float, radius_km: float) -> Dict[str, Any]:
+    """Filter matching documents within radius_km, sorted nearest first"""
+    return {"geo": {"$nearSphere": {
+        "$geometry": point(latitude, longitude),
+        "$maxDistance": radius_km * 1000
+    }}}
+
+
+async def backfill(db) -> Dict[str, int]:
+    """Geocode trials and experts stored without a geo field"""
+    counts = {}
+    for name, geometry in (("clinical_trials", trial_geometry),
+                           ("health_experts", lambda doc: location_geometry(doc.get("location")))):
+        collection = db[name]
+        updated = 0
+        async for doc in collection.find({"geo": {"$exists": False}}, {"_id": 1, "location": 1, "locations": 1}):
+            found = geometry(doc)
+            if found:
+                await collection.update_one({"_id": doc["_id"]}, {"$set": {"geo": found}})
+                updated += 1
+        counts[name] = updated
+    return counts
+
+
+async def main():
+    from dotenv import load_dotenv
+    from storage import open_storage
+
+    load_dotenv(Path(__file__).parent / '.env')
+    storage = open_storage(os.environ.get('STORAGE_URL') or os.environ['MONGO_URL'], os.environ['DB_NAME'])
+    counts = await backfill(storage.db)
+    for name, updated in counts.items():
+        print(f"{name}: geocoded {updated}")
+    await storage.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
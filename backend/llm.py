@@ -0,0 +1,26 @@
+"""The LLM client, imported on first use
+
+emergentintegrations imports litellm and the provider SDKs behind it, which
+takes longer than importing the rest of the backend. LlmChat and UserMessage
+here construct the real classes, importing them the first time either is
+called; server.py's warm-up calls load() before the first request arrives.
+Modules keep their own LlmChat name, so the simulator can still swap it.
+"""
+import functools
+
+
+@functools.lru_cache(maxsize=None)
+def load():
+    """emergentintegrations.llm.chat, imported once"""
+    from emergentintegrations.llm import chat
+    return chat
+
+
+class LlmChat:
+    def __new__(cls, *args, **kwargs):
+        return load().LlmChat(*args, **kwargs)
+
+
+class UserMessage:
+    def __new__(cls, *args, **kwargs):
+        return load().UserMessage(*args, **kwargs)
@@ -0,0 +1,596 @@
+"""In-memory implementation of the subset of the Motor API that server.py uses
+
+Serves the memory:// storage backend for tests and benchmarks, and its
+filter/update evaluation handles what sql_storage cannot compile to SQL.
+Good enough to drive the API under load without a mongod: filters support
+equality, the common comparison/logical operators and $nearSphere over
+GeoJSON points (nearest first, as with a 2dsphere index), updates support the
+usual field operators and upserts, unique (and partial unique) indexes are
+enforced, and bulk_write applies mixed writes in one round trip.
+An optional per-operation latency models the network round trip.
+"""
+import asyncio
+import copy
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.operations import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+
+from geo import distance_km
+
+_MISSING = object()
+
+
+def get_path(doc: Dict[str, Any], path: str):
+    value = doc
+    for part in path.split("."):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return _MISSING
+    return value
+
+
+def set_path(doc: Dict[str, Any], path: str, value: Any):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def unset_path(doc: Dict[str, Any], path: str):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(parts[-1], None)
+
+
+def _sort_key(value):
+    """Order values across types roughly as BSON does, None/missing first"""
+    if value is _MISSING or value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (4, value)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    return (3, str(value))
+
+
+def _compare(op: str, actual, expected) -> bool:
+    if actual is _MISSING or actual is None:
+        return False
+    try:
+        if op == "$gt":
+            return actual > expected
+        if op == "$gte":
+            return actual >= expected
+        if op == "$lt":
+            return actual < expected
+        return actual <= expected
+    except TypeError:
+        return False
+
+
+def _values_equal(actual, expected) -> bool:
+    if expected is None:
+        return actual is _MISSING or actual is None
+    if isinstance(actual, list) and not isinstance(expected, list):
+        return expected in actual
+    return actual == expected
+
+
+def _match_operator(actual, op: str, operand, condition: dict) -> bool:
+    if op == "$eq":
+        return _values_equal(actual, operand)
+    if op == "$ne":
+        return not _values_equal(actual, operand)
+    if op == "$in":
+        return any(_values_equal(actual, v) for v in operand)
+    if op == "$nin":
+        return not any(_values_equal(actual, v) for v in operand)
+    if op in ("$gt", "$gte", "$lt", "$lte"):
+        if isinstance(actual, list):
+            return any(_compare(op, v, operand) for v in actual)
+        return _compare(op, actual, operand)
+    if op == "$exists":
+        return (actual is not _MISSING) == bool(operand)
+    if op == "$regex":
+        flags = re.IGNORECASE if "i" in condition.get("$options", "") else 0
+        candidates = actual if isinstance(actual, list) else [actual]
+        return any(isinstance(v, str) and re.search(operand, v, flags) for v in candidates)
+    if op == "$options":
+        return True
+    if op == "$all":
+        return isinstance(actual, list) and all(v in actual for v in operand)
+    if op == "$size":
+        return isinstance(actual, list) and len(actual) == operand
+    if op == "$elemMatch":
+        return isinstance(actual, list) and any(isinstance(v, dict) and matches(v, operand) for v in actual)
+    if op == "$not":
+        return not _match_condition(actual, operand)
+    if op in ("$near", "$nearSphere"):
+        distance = _geo_distance(actual, operand)
+        return distance is not None and distance <= operand.get("$maxDistance", float("inf"))
+    raise NotImplementedError(f"memory_db does not support query operator {op}")
+
+
+def _geo_distance(geometry, near: dict) -> Optional[float]:
+    """Metres from a $nearSphere origin to a stored GeoJSON geometry"""
+    if not isinstance(geometry, dict) or geometry.get("type") not in ("Point", "MultiPoint"):
+        return None
+    longitude, latitude = near["$geometry"]["coordinates"]
+    return distance_km(geometry, latitude, longitude) * 1000
+
+
+def _near_clause(filter_query: Optional[Dict[str, Any]]) -> Optional[Tuple[str, dict]]:
+    for key, condition in (filter_query or {}).items():
+        if isinstance(condition, dict):
+            for op in ("$near", "$nearSphere"):
+                if op in condition:
+                    return key, condition[op]
+    return None
+
+
+def _match_condition(actual, condition) -> bool:
+    if isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+        return all(_match_operator(actual, op, operand, condition) for op, operand in condition.items())
+    return _values_equal(actual, condition)
+
+
+def matches(doc: Dict[str, Any], filter_query: Optional[Dict[str, Any]]) -> bool:
+    for key, condition in (filter_query or {}).items():
+        if key == "$or":
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+        elif key == "$and":
+            if not all(matches(doc, sub) for sub in condition):
+                return False
+        elif key == "$nor":
+            if any(matches(doc, sub) for sub in condition):
+                return False
+        elif not _match_condition(get_path(doc, key), condition):
+            return False
+    return True
+
+
+def project(doc: Dict[str, Any], projection: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    if not projection:
+        return copy.deepcopy(doc)
+    include = {k for k, v in projection.items() if v and k != "_id"}
+    if include:
+        result = {}
+        if projection.get("_id", 1) and "_id" in doc:
+            result["_id"] = doc["_id"]
+        for path in include:
+            value = get_path(doc, path)
+            if value is not _MISSING:
+                set_path(result, path, copy.deepcopy(value))
+        return result
+    result = copy.deepcopy(doc)
+    for path, flag in projection.items():
+        if not flag:
+            unset_path(result, path)
+    return result
+
+
+def _equality_fields(filter_query: Dict[str, Any]) -> Dict[str, Any]:
+    """Seed document for an upsert: the plain equality parts of the filter"""
+    seed = {}
+    for key, condition in filter_query.items():
+        if key.startswith("$"):
+            if key == "$and":
+                for sub in condition:
+                    seed.update(_equality_fields(sub))
+            continue
+        if isinstance(condition, dict) and any(k.startswith("$") for k in condition):
+            if "$eq" in condition:
+                seed[key] = condition["$eq"]
+            continue
+        seed[key] = condition
+    return seed
+
+
+def apply_update(doc: Dict[str, Any], update: Dict[str, Any], inserting: bool = False):
+    if not any(k.startswith("$") for k in update):
+        preserved_id = doc.get("_id")
+        doc.clear()
+        doc.update(copy.deepcopy(update))
+        if preserved_id is not None:
+            doc["_id"] = preserved_id
+        return
+    for op, fields in update.items():
+        for path, value in fields.items():
+            current = get_path(doc, path)
+            if op == "$set":
+                set_path(doc, path, copy.deepcopy(value))
+            elif op == "$setOnInsert":
+                if inserting:
+                    set_path(doc, path, copy.deepcopy(value))
+            elif op == "$unset":
+                unset_path(doc, path)
+            elif op == "$inc":
+                set_path(doc, path, (0 if current is _MISSING else current) + value)
+            elif op == "$max":
+                if current is _MISSING or _sort_key(value) > _sort_key(current):
+                    set_path(doc, path, value)
+            elif op == "$min":
+                if current is _MISSING or _sort_key(value) < _sort_key(current):
+                    set_path(doc, path, value)
+            elif op in ("$push", "$addToSet"):
+                items = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                target = [] if current is _MISSING else current
+                for item in items:
+                    if op == "$push" or item not in target:
+                        target.append(copy.deepcopy(item))
+                if isinstance(value, dict) and "$slice" in value:
+                    limit = value["$slice"]
+                    target[:] = target[limit:] if limit < 0 else target[:limit]
+                set_path(doc, path, target)
+            elif op == "$pull":
+                if isinstance(current, list):
+                    set_path(doc, path, [v for v in current if not _match_condition(v, value)])
+            else:
+                raise NotImplementedError(f"memory_db does not support update operator {op}")
+
+
+@dataclass
+class InsertOneResult:
+    inserted_id: Any
+    acknowledged: bool = True
+
+
+@dataclass
+class InsertManyResult:
+    inserted_ids: List[Any]
+    acknowledged: bool = True
+
+
+@dataclass
+class UpdateResult:
+    matched_count: int
+    modified_count: int
+    upserted_id: Any = None
+    acknowledged: bool = True
+
+
+@dataclass
+class DeleteResult:
+    deleted_count: int
+    acknowledged: bool = True
+
+
+@dataclass
+class BulkWriteResult:
+    inserted_count: int = 0
+    matched_count: int = 0
+    modified_count: int = 0
+    deleted_count: int = 0
+    upserted_ids: Dict[int, Any] = field(default_factory=dict)
+    acknowledged: bool = True
+
+    @property
+    def upserted_count(self) -> int:
+        return len(self.upserted_ids)
+
+    def add(self, index: int, outcome: Tuple[str, Any]):
+        kind, value = outcome
+        if kind == "insert":
+            self.inserted_count += 1
+        elif kind == "delete":
+            self.deleted_count += value
+        elif value.upserted_id is not None:
+            self.upserted_ids[index] = value.upserted_id
+        else:
+            self.matched_count += value.matched_count
+            self.modified_count += value.modified_count
+
+    def error(self, errors: List[Dict[str, Any]]) -> BulkWriteError:
+        """BulkWriteError with Mongo's details for the writes done so far"""
+        return BulkWriteError({
+            "writeErrors": errors, "nInserted": self.inserted_count, "nUpserted": self.upserted_count,
+            "nMatched": self.matched_count, "nModified": self.modified_count, "nRemoved": self.deleted_count,
+            "upserted": [{"index": index, "_id": _id} for index, _id in sorted(self.upserted_ids.items())]
+        })
+
+
+def bulk_operation(request) -> Tuple[str, tuple]:
+    """(kind, arguments) of a pymongo bulk_write request"""
+    if isinstance(request, InsertOne):
+        return "insert", (request._doc,)
+    if isinstance(request, (UpdateOne, UpdateMany, ReplaceOne)):
+        return "update", (request._filter, request._doc, bool(request._upsert), isinstance(request, UpdateMany))
+    if isinstance(request, (DeleteOne, DeleteMany)):
+        return "delete", (request._filter, isinstance(request, DeleteMany))
+    raise NotImplementedError(f"bulk_write does not support {type(request).__name__}")
+
+
+def _normalize_keys(keys) -> List[Tuple[str, int]]:
+    if isinstance(keys, str):
+        return [(keys, 1)]
+    return [(k, d) for k, d in keys]
+
+
+class MemoryCursor:
+    def __init__(self, collection: "MemoryCollection", filter_query, projection):
+        self._collection = collection
+        self._filter = filter_query
+        self._projection = projection
+        self._sort: List[Tuple[str, int]] = []
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key_or_list, direction: int = 1):
+        if isinstance(key_or_list, str):
+            self._sort = [(key_or_list, direction)]
+        else:
+            self._sort = list(key_or_list)
+        return self
+
+    def skip(self, count: int):
+        self._skip = count
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def _results(self, length: Optional[int]) -> List[Dict[str, Any]]:
+        docs = [d for d in self._collection._docs if matches(d, self._filter)]
+        near = _near_clause(self._filter)
+        if near and not self._sort:
+            key, origin = near
+            docs.sort(key=lambda d: _geo_distance(get_path(d, key), origin))
+        for key, direction in reversed(self._sort):
+            docs.sort(key=lambda d: _sort_key(get_path(d, key)), reverse=direction < 0)
+        docs = docs[self._skip:]
+        for cap in (self._limit, length):
+            if cap:
+                docs = docs[:cap]
+        return [project(d, self._projection) for d in docs]
+
+    async def to_list(self, length: Optional[int] = None) -> List[Dict[str, Any]]:
+        await self._collection._database._round_trip()
+        return self._results(length)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in await self.to_list(None):
+            yield doc
+
+
+class MemoryCollection:
+    def __init__(self, database: "MemoryDatabase", name: str):
+        self._database = database
+        self.name = name
+        self._docs: List[Dict[str, Any]] = []
+        self._unique: Dict[str, Tuple[List[str], Optional[Dict[str, Any]]]] = {}
+
+    # Indexes
+    async def create_index(self, keys, unique: bool = False, name: Optional[str] = None, **kwargs) -> str:
+        fields = _normalize_keys(keys)
+        name = name or "_".join(f"{k}_{d}" for k, d in fields)
+        if unique:
+            index = ([k for k, _ in fields], kwargs.get("partialFilterExpression"))
+            # Like MongoDB, an index that stored documents violate is not created
+            self._check_unique([], {name: index})
+            self._unique[name] = index
+        return name
+
+    def _check_unique(self, new_docs: List[Dict[str, Any]], indexes: Optional[Dict[str, Tuple[List[str], Optional[Dict[str, Any]]]]] = None):
+        """Raise DuplicateKeyError if stored docs plus new_docs collide on a unique index"""
+        for name, (fields, partial) in (self._unique if indexes is None else indexes).items():
+            seen = set()
+            for doc in self._docs + new_docs:
+                if partial and not matches(doc, partial):
+                    continue
+                key = tuple(repr(get_path(doc, f)) for f in fields)
+                if key in seen:
+                    raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: {name}", 11000)
+                seen.add(key)
+
+    # Reads
+    def find(self, filter_query: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, Any]] = None) -> MemoryCursor:
+        return MemoryCursor(self, filter_query or {}, projection)
+
+    async def find_one(self, filter_query: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, Any]] = None, sort=None):
+        cursor = self.find(filter_query, projection).limit(1)
+        if sort:
+            cursor.sort(sort)
+        docs = await cursor.to_list(1)
+        return docs[0] if docs else None
+
+    async def count_documents(self, filter_query: Dict[str, Any], limit: int = 0) -> int:
+        await self._database._round_trip()
+        count = sum(1 for d in self._docs if matches(d, filter_query))
+        return min(count, limit) if limit else count
+
+    async def estimated_document_count(self) -> int:
+        return len(self._docs)
+
+    async def distinct(self, key: str, filter_query: Optional[Dict[str, Any]] = None) -> List[Any]:
+        await self._database._round_trip()
+        values = []
+        for doc in self._docs:
+            if matches(doc, filter_query):
+                value = get_path(doc, key)
+                for v in value if isinstance(value, list) else [value]:
+                    if v is not _MISSING and v not in values:
+                        values.append(v)
+        return values
+
+    # Writes
+    def _prepare(self, document: Dict[str, Any]) -> Dict[str, Any]:
+        # Motor adds _id to the caller's document, so do the same
+        document.setdefault("_id", ObjectId())
+        return copy.deepcopy(document)
+
+    async def insert_one(self, document: Dict[str, Any]) -> InsertOneResult:
+        await self._database._round_trip()
+        doc = self._prepare(document)
+        self._check_unique([doc])
+        self._docs.append(doc)
+        return InsertOneResult(doc["_id"])
+
+    async def insert_many(self, documents: List[Dict[str, Any]], ordered: bool = True) -> InsertManyResult:
+        await self._database._round_trip()
+        inserted, errors = [], []
+        for index, document in enumerate(documents):
+            doc = self._prepare(document)
+            try:
+                self._check_unique([doc])
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": e.code, "errmsg": str(e)})
+                if ordered:
+                    break
+                continue
+            self._docs.append(doc)
+            inserted.append(doc["_id"])
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(inserted)})
+        return InsertManyResult(inserted)
+
+    def _update(self, filter_query, update, upsert: bool, many: bool) -> Tuple[UpdateResult, Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        targets = [d for d in self._docs if matches(d, filter_query)]
+        if not many:
+            targets = targets[:1]
+        if targets:
+            before = copy.deepcopy(targets[0])
+            modified = 0
+            for doc in targets:
+                snapshot = copy.deepcopy(doc)
+                apply_update(doc, update)
+                try:
+                    self._check_unique([])
+                except DuplicateKeyError:
+                    doc.clear()
+                    doc.update(snapshot)
+                    raise
+                modified += doc != snapshot
+            return UpdateResult(len(targets), modified), before, targets[0]
+        if not upsert:
+            return UpdateResult(0, 0), None, None
+        doc = copy.deepcopy(_equality_fields(filter_query))
+        apply_update(doc, update, inserting=True)
+        doc.setdefault("_id", ObjectId())
+        self._check_unique([doc])
+        self._docs.append(doc)
+        return UpdateResult(0, 0, upserted_id=doc["_id"]), None, doc
+
+    async def update_one(self, filter_query, update, upsert: bool = False) -> UpdateResult:
+        await self._database._round_trip()
+        return self._update(filter_query, update, upsert, many=False)[0]
+
+    async def update_many(self, filter_query, update, upsert: bool = False) -> UpdateResult:
+        await self._database._round_trip()
+        return self._update(filter_query, update, upsert, many=True)[0]
+
+    async def replace_one(self, filter_query, replacement, upsert: bool = False) -> UpdateResult:
+        await self._database._round_trip()
+        return self._update(filter_query, replacement, upsert, many=False)[0]
+
+    async def find_one_and_update(self, filter_query, update, projection=None, upsert: bool = False, return_document: bool = False, sort=None):
+        await self._database._round_trip()
+        if sort:
+            ordered = await MemoryCursor(self, filter_query, None).sort(sort).limit(1).to_list(1)
+            if ordered:
+                filter_query = {"_id": ordered[0]["_id"]}
+        _, before, after = self._update(filter_query, update, upsert, many=False)
+        doc = after if return_document else before
+        return project(doc, projection) if doc is not None else None
+
+    async def find_one_and_delete(self, filter_query, projection=None):
+        await self._database._round_trip()
+        for index, doc in enumerate(self._docs):
+            if matches(doc, filter_query):
+                del self._docs[index]
+                return project(doc, projection)
+        return None
+
+    def _delete(self, filter_query, many: bool) -> int:
+        if many:
+            kept = [d for d in self._docs if not matches(d, filter_query)]
+            deleted = len(self._docs) - len(kept)
+            self._docs = kept
+            return deleted
+        for index, doc in enumerate(self._docs):
+            if matches(doc, filter_query):
+                del self._docs[index]
+                return 1
+        return 0
+
+    async def delete_one(self, filter_query) -> DeleteResult:
+        await self._database._round_trip()
+        return DeleteResult(self._delete(filter_query, many=False))
+
+    async def delete_many(self, filter_query) -> DeleteResult:
+        await self._database._round_trip()
+        return DeleteResult(self._delete(filter_query, many=True))
+
+    async def bulk_write(self, requests, ordered: bool = True) -> BulkWriteResult:
+        """Apply the writes in one round trip; ordered stops at the first error"""
+        await self._database._round_trip()
+        result, errors = BulkWriteResult(), []
+        for index, request in enumerate(requests):
+            kind, args = bulk_operation(request)
+            try:
+                if kind == "insert":
+                    doc = self._prepare(args[0])
+                    self._check_unique([doc])
+                    self._docs.append(doc)
+                    result.add(index, ("insert", doc["_id"]))
+                elif kind == "update":
+                    result.add(index, ("update", self._update(*args)[0]))
+                else:
+                    result.add(index, ("delete", self._delete(*args)))
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": e.code, "errmsg": str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise result.error(errors)
+        return result
+
+    async def drop(self):
+        self._docs = []
+        self._unique = {}
+
+
+class MemoryDatabase:
+    """Motor-style database: collections are attributes or items"""
+
+    def __init__(self, name: str = "benchmark", latency: float = 0.0):
+        self.name = name
+        self.latency = latency
+        self._collections: Dict[str, MemoryCollection] = {}
+
+    async def _round_trip(self):
+        # Always yield so concurrent requests interleave as they would on a real driver
+        await asyncio.sleep(self.latency)
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        if name not in self._collections:
+            self._collections[name] = MemoryCollection(self, name)
+        return self._collections[name]
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    async def list_collection_names(self) -> List[str]:
+        return list(self._collections)
+
+    async def command(self, command, *args, **kwargs) -> Dict[str, Any]:
+        await self._round_trip()
+        return {"ok": 1.0}
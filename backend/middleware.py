@@ -0,0 +1,160 @@
+import gzip
+import hashlib
+import re
+from typing import Iterable, List
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+
+async def _buffer_response(app: ASGIApp, scope: Scope, receive: Receive, send: Send, on_complete):
+    """Run the app, buffering a single-body response and handing it to on_complete
+
+    Streaming responses (several body messages) are forwarded untouched.
+    """
+    start_message: List[Message] = []
+    body_parts: List[bytes] = []
+    streaming = False
+
+    async def buffered_send(message: Message):
+        nonlocal streaming
+        if message["type"] == "http.response.start":
+            start_message.append(message)
+            return
+        if message["type"] != "http.response.body" or streaming:
+            await send(message)
+            return
+        body_parts.append(message.get("body", b""))
+        if message.get("more_body", False):
+            if len(body_parts) == 1 and len(body_parts[0]) == 0:
+                return
+            streaming = True
+            await send(start_message[0])
+            await send({"type": "http.response.body", "body": b"".join(body_parts), "more_body": True})
+            return
+        await on_complete(start_message[0], b"".join(body_parts))
+
+    await app(scope, receive, buffered_send)
+
+
+class ETagMiddleware:
+    """Weak ETags and If-None-Match handling for GET routes clients poll
+
+    The ETag is a digest of the uncompressed body, so an unchanged payload
+    costs a 304 with headers only instead of the full body.
+    """
+
+    def __init__(self, app: ASGIApp, paths: Iterable[str]):
+        self.app = app
+        self.paths = [re.compile(p) for p in paths]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] != "GET" or not any(p.match(scope["path"]) for p in self.paths):
+            await self.app(scope, receive, send)
+            return
+
+        if_none_match = Headers(scope=scope).get("if-none-match")
+
+        async def on_complete(start: Message, body: bytes):
+            if start["status"] != 200:
+                await send(start)
+                await send({"type": "http.response.body", "body": body})
+                return
+
+            etag = f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+            headers = MutableHeaders(raw=start["headers"])
+            headers["ETag"] = etag
+            headers.setdefault("Cache-Control", "private, no-cache")
+
+            if if_none_match and etag_matches(if_none_match, etag):
+                del headers["Content-Length"]
+                del headers["Content-Type"]
+                await send({"type": "http.response.start", "status": 304, "headers": headers.raw})
+                await send({"type": "http.response.body", "body": b""})
+                return
+
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await _buffer_response(self.app, scope, receive, send, on_complete)
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison as If-None-Match requires (RFC 9110 13.1.2)"""
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
+
+
+class CompressionMiddleware:
+    """Brotli or gzip compression for JSON/text responses above minimum_size
+
+    Brotli is used when the client accepts it and the brotli package is
+    installed; otherwise gzip.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 5):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = self.choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def on_complete(start: Message, body: bytes):
+            headers = MutableHeaders(raw=start["headers"])
+            content_type = headers.get("content-type", "")
+            if (
+                len(body) < self.minimum_size
+                or "content-encoding" in headers
+                or not content_type.startswith(COMPRESSIBLE_TYPES)
+            ):
+                await send(start)
+                await send({"type": "http.response.body", "body": body})
+                return
+
+            if encoding == "br":
+                body = brotli.compress(body, quality=self.brotli_quality)
+            else:
+                body = gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await _buffer_response(self.app, scope, receive, send, on_complete)
+
+    @staticmethod
+    def choose_encoding(accept_encoding: str):
+        accepted = {}
+        for part in accept_encoding.lower().split(","):
+            name, _, params = part.strip().partition(";")
+            quality = 1.0
+            if params.strip().startswith("q="):
+                try:
+                    quality = float(params.strip()[2:])
+                except ValueError:
+                    quality = 0.0
+            accepted[name.strip()] = quality
+        if brotli is not None and accepted.get("br", 0) > 0:
+            return "br"
+        if accepted.get("gzip", 0) > 0:
+            return "gzip"
+        return None
@@ -0,0 +1,178 @@
+"""One-off data migrations, run by hand against a deployment's database
+
+    python migrations.py forum-counters                # recompute forum and thread counters, set thread_id
+    python migrations.py dedupe-unique-keys --dry-run  # list documents that block the unique indexes
+    python migrations.py dedupe-unique-keys            # back them up, remove them, build the indexes
+
+STORAGE_URL selects the backend (see storage.py). Each migration can be run
+again. --dry-run reports what would change and writes nothing.
+"""
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from pymongo.operations import UpdateOne
+
+from storage import open_storage
+
+MIGRATION_BATCH = 1000
+
+# Keys the API's upserts rely on being unique: (collection, fields, partial
+# filter). server.ensure_indexes builds these indexes.
+UNIQUE_KEYS: List[Tuple[str, List[str], Optional[Dict[str, Any]]]] = [
+    ("favorites", ["user_id", "item_type", "item_id"], None),
+    ("connection_requests", ["from_user", "to_user"], None),
+    ("patient_profiles", ["user_id"], None),
+    ("researcher_profiles", ["user_id"], None),
+    # Experts from the seed catalog have no user account
+    ("health_experts", ["user_id"], {"user_id": {"$gt": ""}})
+]
+
+logger = logging.getLogger(__name__)
+
+
+async def write_batches(collection, operations: List[UpdateOne]) -> int:
+    for start in range(0, len(operations), MIGRATION_BATCH):
+        await collection.bulk_write(operations[start:start + MIGRATION_BATCH], ordered=False)
+    return len(operations)
+
+
+def thread_roots(posts: Dict[str, Dict[str, Any]]) -> Dict[str, str]:
+    """Post id -> id of its top-level post, following parent links; a reply
+    whose parent is gone roots its own thread
+    """
+    roots: Dict[str, str] = {}
+    for post_id in posts:
+        path, current = [], post_id
+        while current not in roots:
+            path.append(current)
+            parent_id = posts[current].get("parent_id")
+            if parent_id not in posts or parent_id in path:
+                roots[current] = current
+                break
+            current = parent_id
+        for visited in path:
+            roots[visited] = roots[current]
+    return roots
+
+
+async def backfill_forum_counters(db, dry_run: bool = False) -> Dict[str, int]:
+    """Set thread_id, reply_count and last_activity_at on every post, and
+    post_count, thread_count, last_activity_at and last_post_id on every forum,
+    from the posts as stored. Posts written before these fields existed, or
+    while counters were updated out of step, come out consistent.
+    """
+    fields = {"_id": 0, "id": 1, "forum_id": 1, "parent_id": 1, "thread_id": 1,
+              "reply_count": 1, "created_at": 1, "last_activity_at": 1}
+    posts = {p["id"]: p async for p in db.forum_posts.find({}, fields) if p.get("id")}
+    roots = thread_roots(posts)
+
+    threads: Dict[str, Dict[str, Any]] = {}
+    forums: Dict[str, Dict[str, Any]] = {}
+    for post in sorted(posts.values(), key=lambda p: (p.get("created_at") or "", p["id"])):
+        created_at = post.get("created_at") or ""
+        thread = threads.setdefault(roots[post["id"]], {"reply_count": 0, "last_activity_at": created_at})
+        if roots[post["id"]] != post["id"]:
+            thread["reply_count"] += 1
+        thread["last_activity_at"] = max(thread["last_activity_at"], created_at)
+        forum = forums.setdefault(post.get("forum_id"), {"post_count": 0, "thread_count": 0})
+        forum["post_count"] += 1
+        forum["thread_count"] += 0 if post.get("parent_id") else 1
+        forum["last_activity_at"] = created_at
+        forum["last_post_id"] = post["id"]
+
+    post_updates = []
+    for post_id, post in posts.items():
+        thread = threads.get(post_id, {"reply_count": 0, "last_activity_at": post.get("created_at")})
+        values = {"thread_id": roots[post_id], "reply_count": thread["reply_count"],
+                  "last_activity_at": thread["last_activity_at"] or post.get("created_at")}
+        if any(post.get(k) != v for k, v in values.items()):
+            post_updates.append(UpdateOne({"id": post_id}, {"$set": values}))
+
+    forum_updates = []
+    async for forum in db.forums.find({}, {"_id": 0, "id": 1, "created_at": 1}):
+        counts = forums.get(forum["id"], {"post_count": 0, "thread_count": 0, "last_post_id": None})
+        counts.setdefault("last_activity_at", forum.get("created_at"))
+        forum_updates.append(UpdateOne({"id": forum["id"]}, {"$set": counts}))
+
+    if dry_run:
+        return {"forum_posts": len(post_updates), "forums": len(forum_updates)}
+    return {
+        "forum_posts": await write_batches(db.forum_posts, post_updates),
+        "forums": await write_batches(db.forums, forum_updates)
+    }
+
+
+async def find_duplicates(collection, fields: List[str], partial: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Every document but the oldest of each key"""
+    docs = await collection.find(partial or {}).sort("created_at", 1).to_list(None)
+    seen, duplicates = set(), []
+    for doc in docs:
+        key = tuple(repr(doc.get(f)) for f in fields)
+        if key in seen:
+            duplicates.append(doc)
+        seen.add(key)
+    return duplicates
+
+
+async def dedupe_unique_keys(db, dry_run: bool = False) -> Dict[str, int]:
+    """Remove documents that repeat a UNIQUE_KEYS key, keeping the oldest, and
+    build the unique indexes. Each removed document is logged and copied to
+    migration_backups first, so it can be restored.
+    """
+    removed_at = datetime.now(timezone.utc).isoformat()
+    counts = {}
+    for name, fields, partial in UNIQUE_KEYS:
+        duplicates = await find_duplicates(db[name], fields, partial)
+        counts[name] = len(duplicates)
+        for doc in duplicates:
+            logger.info("%s %s: duplicate %s (id %s)", "Would remove" if dry_run else "Removing", name,
+                        {f: doc.get(f) for f in fields}, doc.get("id"))
+        if dry_run:
+            continue
+        if duplicates:
+            await db.migration_backups.insert_many([{
+                "migration": "dedupe-unique-keys",
+                "collection": name,
+                "removed_at": removed_at,
+                "document": {k: v for k, v in doc.items() if k != "_id"}
+            } for doc in duplicates])
+            await db[name].delete_many({"_id": {"$in": [doc["_id"] for doc in duplicates]}})
+        options = {"partialFilterExpression": partial} if partial else {}
+        await db[name].create_index([(f, 1) for f in fields], unique=True, **options)
+    return counts
+
+
+MIGRATIONS = {
+    "forum-counters": backfill_forum_counters,
+    "dedupe-unique-keys": dedupe_unique_keys
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a one-off data migration")
+    parser.add_argument("migration", choices=sorted(MIGRATIONS))
+    parser.add_argument("--dry-run", action="store_true", help="report what would change, write nothing")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    async def run():
+        load_dotenv(Path(__file__).parent / '.env')
+        storage = open_storage(os.environ.get('STORAGE_URL') or os.environ['MONGO_URL'], os.environ['DB_NAME'])
+        try:
+            counts = await MIGRATIONS[args.migration](storage.db, dry_run=args.dry_run)
+        finally:
+            await storage.close()
+        for name, changed in counts.items():
+            print(f"{name}: {'would change' if args.dry_run else 'changed'} {changed}")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Command and connection pool monitoring for the Motor client
+
+MongoMonitor is registered as a pymongo event listener by storage.py. It
+keeps, per collection and command, the count, failures and latency of
+operations. It also records how long operations waited to check a
+connection out of the pool, how many connections are in use and how many
+checkouts failed. A rising checkout wait with in_use at maxPoolSize is pool
+starvation. pymongo publishes events from Motor's executor threads, so all
+counters are updated under a lock.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Tuple
+
+from pymongo import monitoring
+
+# Operations slower than this are logged; 0 turns the log off
+MONGO_SLOW_MS = float(os.environ.get('MONGO_SLOW_MS', '500'))
+# Latencies kept per operation for percentiles
+LATENCY_SAMPLES = 512
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(samples, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+class LatencyStats:
+    def __init__(self):
+        self.count = 0
+        self.failures = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.samples: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+
+    def record(self, ms: float, failed: bool = False):
+        self.count += 1
+        self.failures += failed
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.samples.append(ms)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {"count": self.count, "failures": self.failures,
+                "mean_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+                "p95_ms": round(percentile(self.samples, 95), 3), "max_ms": round(self.max_ms, 3)}
+
+
+class MongoMonitor(monitoring.CommandListener, monitoring.ConnectionPoolListener):
+    def __init__(self, slow_ms: float = MONGO_SLOW_MS):
+        self.slow_ms = slow_ms
+        self.operations: Dict[Tuple[str, str], LatencyStats] = {}
+        self.checkout_wait = LatencyStats()
+        self.checkout_failures: Dict[str, int] = {}
+        self.in_use = 0
+        self.max_in_use = 0
+        self.connections = 0
+        self.pool_cleared = 0
+        self._collections: Dict[Tuple[int, Any], str] = {}
+        self._checkout_started = threading.local()
+        self._lock = threading.Lock()
+
+    # Commands
+    def started(self, event: monitoring.CommandStartedEvent):
+        target = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            target = event.command.get("collection")
+        with self._lock:
+            self._collections[(event.request_id, event.connection_id)] = target if isinstance(target, str) else "-"
+
+    def _finish(self, event, failed: bool):
+        ms = event.duration_micros / 1000
+        with self._lock:
+            collection = self._collections.pop((event.request_id, event.connection_id), "-")
+            key = (collection, event.command_name)
+            stats = self.operations.get(key)
+            if stats is None:
+                stats = self.operations[key] = LatencyStats()
+            stats.record(ms, failed)
+        if self.slow_ms and ms >= self.slow_ms:
+            logger.warning("Slow MongoDB %s on %s: %.1f ms%s", event.command_name, collection, ms, " (failed)" if failed else "")
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        self._finish(event, False)
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        self._finish(event, True)
+
+    # Connection pool
+    def connection_check_out_started(self, event):
+        # A checkout starts and ends on the same thread
+        self._checkout_started.at = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        ms = (time.perf_counter() - getattr(self._checkout_started, "at", time.perf_counter())) * 1000
+        with self._lock:
+            self.checkout_wait.record(ms)
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+
+    def connection_check_out_failed(self, event):
+        ms = (time.perf_counter() - getattr(self._checkout_started, "at", time.perf_counter())) * 1000
+        with self._lock:
+            self.checkout_wait.record(ms, failed=True)
+            self.checkout_failures[event.reason] = self.checkout_failures.get(event.reason, 0) + 1
+        logger.warning("MongoDB connection checkout failed after %.1f ms: %s", ms, event.reason)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use -= 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections -= 1
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_cleared += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pool": {"connections": self.connections, "in_use": self.in_use, "max_in_use": self.max_in_use,
+                         "checkout_wait": self.checkout_wait.metrics(), "checkout_failures": dict(self.checkout_failures),
+                         "cleared": self.pool_cleared},
+                "operations": {f"{collection}.{command}": stats.metrics()
+                               for (collection, command), stats in sorted(self.operations.items())}
+            }
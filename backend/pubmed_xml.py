@@ -0,0 +1,95 @@
+"""Incremental parser for PubMed efetch XML (PubmedArticleSet)
+
+Articles are parsed as soon as their closing tag arrives and the element is
+then cleared, so memory stays bounded by one article rather than the batch.
+"""
+import xml.etree.ElementTree as ET
+from typing import Any, Dict, Iterator, Optional
+
+MAX_AUTHORS = 5
+
+
+def element_text(element: Optional[ET.Element]) -> str:
+    """Text including inline markup such as <i> or <sup>"""
+    if element is None:
+        return ""
+    return " ".join("".join(element.itertext()).split())
+
+
+def publication_date(article: ET.Element) -> str:
+    """'2024 Mar 15' style date, matching esummary's pubdate"""
+    pub_date = article.find("Journal/JournalIssue/PubDate")
+    if pub_date is None:
+        return ""
+    medline_date = pub_date.findtext("MedlineDate")
+    if medline_date:
+        return medline_date
+    return " ".join(p for p in (pub_date.findtext("Year"), pub_date.findtext("Month"), pub_date.findtext("Day")) if p)
+
+
+def author_names(article: ET.Element):
+    names = []
+    for author in article.iterfind("AuthorList/Author"):
+        collective = author.findtext("CollectiveName")
+        if collective:
+            names.append(collective)
+        elif author.findtext("LastName"):
+            names.append(" ".join(p for p in (author.findtext("LastName"), author.findtext("Initials")) if p))
+        if len(names) == MAX_AUTHORS:
+            break
+    return names
+
+
+def abstract_text(article: ET.Element) -> str:
+    sections = []
+    for section in article.iterfind("Abstract/AbstractText"):
+        text = element_text(section)
+        label = section.get("Label")
+        if text:
+            sections.append(f"{label}: {text}" if label else text)
+    return "\n".join(sections)
+
+
+def parse_article(element: ET.Element) -> Optional[Dict[str, Any]]:
+    citation = element.find("MedlineCitation")
+    if citation is None:
+        return None
+    pmid = citation.findtext("PMID")
+    article = citation.find("Article")
+    if not pmid or article is None:
+        return None
+    title = element_text(article.find("ArticleTitle"))
+    mesh_terms = [element_text(d) for d in citation.iterfind("MeshHeadingList/MeshHeading/DescriptorName")]
+    keywords = [element_text(k) for k in citation.iterfind("KeywordList/Keyword")]
+    return {
+        "pmid": pmid,
+        "title": title,
+        "authors": author_names(article),
+        "abstract": abstract_text(article),
+        "published_date": publication_date(article),
+        "mesh_terms": mesh_terms,
+        "keywords": [k.lower() for k in mesh_terms + keywords] or title.lower().split()[:10]
+    }
+
+
+class PubmedArticleStream:
+    """Feed efetch XML in chunks; read parsed articles as they complete"""
+
+    def __init__(self):
+        self._parser = ET.XMLPullParser(events=("end",))
+
+    def feed(self, chunk: bytes) -> Iterator[Dict[str, Any]]:
+        self._parser.feed(chunk)
+        return self._drain()
+
+    def close(self) -> Iterator[Dict[str, Any]]:
+        self._parser.close()
+        return self._drain()
+
+    def _drain(self) -> Iterator[Dict[str, Any]]:
+        for _, element in self._parser.read_events():
+            if element.tag == "PubmedArticle":
+                record = parse_article(element)
+                element.clear()
+                if record:
+                    yield record
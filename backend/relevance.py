@@ -0,0 +1,55 @@
+"""Batch relevance scoring of search results against a query
+
+Every candidate of every entity type is embedded in one HashedEncoder batch
+and scored by one matrix-vector product, instead of one LLM call per item.
+Fields are weighted per entity type, as for the semantic index. Cosine
+similarity maps onto the 0-100 relevance_score scale linearly, reaching 100
+at RELEVANCE_FULL_MATCH.
+"""
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from embeddings import EMBEDDED_FIELDS, HashedEncoder, field_text
+
+RELEVANCE_FULL_MATCH = float(os.environ.get("RELEVANCE_FULL_MATCH", "0.6"))
+# Long fields are cut to this many characters before scoring
+SCORED_TEXT_LENGTH = 2000
+
+# Item type -> (field, weight)
+SCORED_FIELDS = {
+    "expert": EMBEDDED_FIELDS["health_experts"],
+    "trial": EMBEDDED_FIELDS["clinical_trials"],
+    "publication": EMBEDDED_FIELDS["publications"],
+}
+
+
+class BatchScorer:
+    def __init__(self, encoder: Optional[HashedEncoder] = None,
+                 fields: Dict[str, Sequence[Tuple[str, float]]] = SCORED_FIELDS,
+                 full_match: float = RELEVANCE_FULL_MATCH):
+        self.encoder = encoder or HashedEncoder()
+        self.fields = fields
+        self.full_match = full_match
+
+    def document(self, item: Dict[str, Any], item_type: str) -> List[Tuple[str, float]]:
+        return [(field_text(item.get(field))[:SCORED_TEXT_LENGTH], weight) for field, weight in self.fields[item_type]]
+
+    def similarities(self, query: str, groups: Dict[str, Sequence[Dict[str, Any]]]) -> Dict[str, np.ndarray]:
+        """Cosine similarity of each item to the query, per item type"""
+        documents = [self.document(item, item_type) for item_type, items in groups.items() for item in items]
+        vectors = self.encoder.encode_fields([[(query, 1.0)]] + documents)
+        similarity = vectors[1:] @ vectors[0]
+        results, start = {}, 0
+        for item_type, items in groups.items():
+            results[item_type] = similarity[start:start + len(items)]
+            start += len(items)
+        return results
+
+    def score(self, query: str, groups: Dict[str, Sequence[Dict[str, Any]]]) -> Dict[str, List[int]]:
+        """0-100 relevance of each item to the query, per item type"""
+        return {
+            item_type: np.rint(np.clip(similarity / self.full_match, 0.0, 1.0) * 100).astype(int).tolist()
+            for item_type, similarity in self.similarities(query, groups).items()
+        }
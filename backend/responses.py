@@ -0,0 +1,40 @@
+import json
+from typing import Any, AsyncIterator
+from starlette.responses import JSONResponse, StreamingResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson when it is installed
+
+    For strings, ints, bools, lists, dicts and None the output is the same
+    bytes as Starlette's compact JSONResponse. Floats differ in two ways:
+    exponents have no plus sign (1e16 where json writes 1e+16), which parses
+    to the same number, and NaN and Infinity, which JSON cannot represent,
+    render as null where JSONResponse raises ValueError. Datetimes render as
+    isoformat() strings, as jsonable_encoder does.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def json_line(content: Any) -> bytes:
+    if orjson is None:
+        return (json.dumps(content, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+
+
+class NDJSONResponse(StreamingResponse):
+    """Newline-delimited JSON, one document per line, written as produced"""
+
+    media_type = "application/x-ndjson"
+
+    def __init__(self, documents: AsyncIterator[Any], **kwargs):
+        super().__init__((json_line(doc) async for doc in documents), **kwargs)
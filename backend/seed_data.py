@@ -1,18 +1,114 @@
+"""Seed the database
+
+    python seed_data.py                                  # the curated demo records
+    python seed_data.py --preset production              # 1M users, 100k trials, 10M messages
+    python seed_data.py --preset small --messages 500000 --seed 7 --drop
+
+Synthetic datasets come from synthetic_data.py and are written with unordered
+insert_many batches, several in flight at once. Indexes are created by the
+API on startup. STORAGE_URL selects the backend (see storage.py), e.g.
+STORAGE_URL=postgresql+asyncpg://... to seed PostgreSQL.
+"""
+import argparse
 import asyncio
-from motor.motor_asyncio import AsyncIOMotorClient
+import time
+from datetime import datetime, timezone
+from collections import Counter
+from passlib.context import CryptContext
+from pymongo.errors import BulkWriteError
 import uuid
 import os
 from dotenv import load_dotenv
 from pathlib import Path
+from typing import Any, Dict, Iterable, Tuple
+from geo import backfill
+from migrations import backfill_forum_counters
+from storage import open_storage
+from synthetic_data import PRESETS, SYNTHETIC_PASSWORD, SyntheticDataset, scaled
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-async def seed_database():
-    mongo_url = os.environ['MONGO_URL']
-    client = AsyncIOMotorClient(mongo_url)
-    db = client[os.environ['DB_NAME']]
-    
+DUPLICATE_KEY = 11000
+
+async def insert_batch(collection, batch) -> Tuple[int, int]:
+    """(inserted, duplicates); other write errors are raised"""
+    try:
+        result = await collection.insert_many(batch, ordered=False)
+        return len(result.inserted_ids), 0
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(error.get("code") != DUPLICATE_KEY for error in errors):
+            raise
+        return e.details.get("nInserted", 0), len(errors)
+
+async def bulk_load(db, documents: Iterable[Tuple[str, Dict[str, Any]]], batch_size: int = 5000,
+                    concurrency: int = 4, report_every: int = 0) -> Counter:
+    """Insert (collection, document) pairs in unordered batches
+
+    Up to `concurrency` batches are in flight while the next ones are built;
+    documents are buffered per collection, so memory stays at a few batches.
+    """
+    counts = Counter()
+    buffers: Dict[str, list] = {}
+    pending = set()
+
+    async def flush(name: str, batch: list):
+        inserted, duplicates = await insert_batch(db[name], batch)
+        counts[name] += inserted
+        counts["duplicates"] += duplicates
+        if report_every and counts[name] // report_every != (counts[name] - inserted) // report_every:
+            print(f"{name}: {counts[name]:,}")
+
+    async def submit(name: str, batch: list):
+        nonlocal pending
+        pending.add(asyncio.ensure_future(flush(name, batch)))
+        if len(pending) >= concurrency:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        else:
+            await asyncio.sleep(0)
+
+    for name, doc in documents:
+        buffer = buffers.setdefault(name, [])
+        buffer.append(doc)
+        if len(buffer) >= batch_size:
+            buffers[name] = []
+            await submit(name, buffer)
+    for name, buffer in buffers.items():
+        if buffer:
+            await submit(name, buffer)
+    if pending:
+        await asyncio.gather(*pending)
+    return counts
+
+async def seed_synthetic(db, config, batch_size: int, concurrency: int, drop: bool):
+    dataset = SyntheticDataset(config, CryptContext(schemes=["bcrypt"], deprecated="auto").hash(SYNTHETIC_PASSWORD))
+    names = ["users", "patient_profiles", "researcher_profiles", "health_experts", "clinical_trials",
+             "publications", "forums", "forum_posts", "messages", "favorites"]
+    if drop:
+        await asyncio.gather(*(db[name].drop() for name in names))
+    elif await db.users.count_documents({}, limit=1):
+        print("Database already seeded; pass --drop to replace it")
+        return
+
+    started = time.perf_counter()
+    counts = await bulk_load(db, dataset.documents(), batch_size, concurrency, report_every=1_000_000)
+    elapsed = time.perf_counter() - started
+    total = sum(v for k, v in counts.items() if k != "duplicates")
+    for name in names:
+        print(f"{name:<22}{counts[name]:>12,}")
+    print(f"{total:,} documents in {elapsed:.1f}s ({total / elapsed:,.0f}/s); users log in with {SYNTHETIC_PASSWORD!r}")
+
+def stamped(docs):
+    """Demo records get a created_at like the API's writes, which the change
+    feed's poller (change_feed.py) uses to find new documents
+    """
+    now = datetime.now(timezone.utc).isoformat()
+    return [{"created_at": now, **doc} for doc in docs]
+
+async def seed_database(db):
     # Check if data already exists
     existing_trials = await db.clinical_trials.count_documents({})
     if existing_trials > 0:
@@ -59,8 +155,7 @@ async def seed_database():
         }
     ]
     
-    for trial_data in trials:
-        await db.clinical_trials.insert_one(trial_data)
+    await db.clinical_trials.insert_many(stamped(trials), ordered=False)
     
     # Seed Publications
     publications = [
@@ -96,8 +191,7 @@ async def seed_database():
         }
     ]
     
-    for pub_data in publications:
-        await db.publications.insert_one(pub_data)
+    await db.publications.insert_many(stamped(publications), ordered=False)
     
     # Seed Health Experts
     experts = [
@@ -107,7 +201,8 @@ async def seed_database():
             "specialty": ["Neuro-Oncology", "Brain Cancer"],
             "research_interests": ["Immunotherapy", "Glioblastoma", "Clinical Trials"],
             "is_registered": False,
-            "bio": "Leading neuro-oncologist with 15 years of experience in brain cancer research"
+            "bio": "Leading neuro-oncologist with 15 years of experience in brain cancer research",
+            "location": "New York, USA"
         },
         {
             "id": str(uuid.uuid4()),
@@ -115,7 +210,8 @@ async def seed_database():
             "specialty": ["Oncology", "Lung Cancer"],
             "research_interests": ["CAR-T Therapy", "Immunotherapy", "Precision Medicine"],
             "is_registered": False,
-            "bio": "Expert in lung cancer treatment and immunotherapy research"
+            "bio": "Expert in lung cancer treatment and immunotherapy research",
+            "location": "Los Angeles, USA"
         },
         {
             "id": str(uuid.uuid4()),
@@ -123,12 +219,12 @@ async def seed_database():
             "specialty": ["Genetics", "Gene Therapy"],
             "research_interests": ["Gene Editing", "CRISPR", "Rare Diseases"],
             "is_registered": False,
-            "bio": "Pioneer in gene therapy for rare genetic disorders"
+            "bio": "Pioneer in gene therapy for rare genetic disorders",
+            "location": "Boston, USA"
         }
     ]
     
-    for expert_data in experts:
-        await db.health_experts.insert_one(expert_data)
+    await db.health_experts.insert_many(stamped(experts), ordered=False)
     
     # Seed Forums
     forums = [
@@ -152,11 +248,40 @@ async def seed_database():
         }
     ]
     
-    for forum_data in forums:
-        await db.forums.insert_one(forum_data)
+    await db.forums.insert_many(stamped(forums), ordered=False)
+    
+    # GeoJSON points for trial and expert locations
+    await backfill(db)
+    await backfill_forum_counters(db)
     
     print("Database seeded successfully!")
-    client.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed the database with demo records or a synthetic dataset")
+    parser.add_argument("--preset", choices=sorted(PRESETS), help="generate a synthetic dataset of this size")
+    for field in ("users", "trials", "publications", "forums", "forum_posts", "messages", "favorites_per_patient", "seed"):
+        parser.add_argument(f"--{field.replace('_', '-')}", dest=field, type=int, help="override the preset")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=4, help="insert_many batches in flight")
+    parser.add_argument("--drop", action="store_true", help="drop the seeded collections first")
+    args = parser.parse_args()
+
+    overrides = {k: getattr(args, k) for k in ("users", "trials", "publications", "forums", "forum_posts",
+                                               "messages", "favorites_per_patient", "seed")}
+    synthetic = args.preset or any(v is not None for v in overrides.values())
+
+    async def run():
+        storage = open_storage(os.environ.get('STORAGE_URL') or os.environ['MONGO_URL'], os.environ['DB_NAME'])
+        try:
+            if synthetic:
+                config = scaled(args.preset or "medium", **overrides)
+                await seed_synthetic(storage.db, config, args.batch_size, args.concurrency, args.drop)
+            else:
+                await seed_database(storage.db)
+        finally:
+            await storage.close()
+
+    asyncio.run(run())
 
 if __name__ == "__main__":
-    asyncio.run(seed_database())
+    main()
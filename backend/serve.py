@@ -0,0 +1,36 @@
+"""Serve the API with several worker processes
+
+Run from the backend directory:
+
+    python serve.py                      # one worker per CPU
+    WEB_CONCURRENCY=4 PORT=8001 python serve.py
+
+or under gunicorn, with the same environment:
+
+    WEB_CONCURRENCY=4 gunicorn server:app -k uvicorn.workers.UvicornWorker -w 4
+
+With more than one worker, server.py keeps upstream caches, rate limits and
+pub/sub in shared state (shared_state.py) in the app's database unless
+SHARED_STATE_URL says otherwise. A memory:// storage backend is per process,
+so multi-worker deployments need MongoDB, PostgreSQL or a SQLite file.
+"""
+import os
+
+import uvicorn
+
+
+def main():
+    workers = int(os.environ.get('WEB_CONCURRENCY') or os.cpu_count() or 1)
+    # server.py reads this at import, in every worker
+    os.environ['WEB_CONCURRENCY'] = str(workers)
+    uvicorn.run(
+        "server:app",
+        host=os.environ.get('HOST', '0.0.0.0'),
+        port=int(os.environ.get('PORT', '8001')),
+        workers=workers,
+        proxy_headers=True
+    )
+
+
+if __name__ == "__main__":
+    main()
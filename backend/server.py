@@ -2,25 +2,54 @@ from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, EmailStr, Field, ConfigDict
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, EmailStr, Field, ConfigDict, field_validator
+from typing import List, Optional, Dict, Any, Literal, Tuple
 import uuid
+import asyncio
+import time
 from datetime import datetime, timezone, timedelta
 import jwt
 from passlib.context import CryptContext
-from emergentintegrations.llm.chat import LlmChat, UserMessage
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.operations import DeleteMany, InsertOne, UpdateOne
+from llm import LlmChat, UserMessage
+from responses import FastJSONResponse, NDJSONResponse
+from middleware import CompressionMiddleware, ETagMiddleware
+from storage import open_storage
+from geo import geocode, location_geometry, distance_km, near_query
+from embeddings import SemanticIndex
+from shared_state import open_shared_state, set_state
+from catalog_cache import CatalogCache
+from migrations import UNIQUE_KEYS
+from change_feed import CHANGE_FEED, CHANGES_CHANNEL, WATCHED_COLLECTIONS, ChangeFeed
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Database connection: MongoDB by default, or any backend storage.py supports
+storage = open_storage(os.environ.get('STORAGE_URL') or os.environ['MONGO_URL'], os.environ['DB_NAME'])
+db = storage.db
+# Read-heavy listings that tolerate replication lag read from secondaries when available
+read_db = storage.read_db
+
+# Caches, rate limits and pub/sub shared by all worker processes (see serve.py);
+# several workers share state through the app's own database by default
+WORKERS = int(os.environ.get('WEB_CONCURRENCY') or 1)
+SHARED_STATE_URL = os.environ.get('SHARED_STATE_URL') or ("storage" if WORKERS > 1 else "memory://")
+shared_state = set_state(open_shared_state(SHARED_STATE_URL, storage, os.environ['DB_NAME']))
+
+# Catalog listings and details, invalidated by the endpoints that write them
+catalog_cache = CatalogCache()
+
+# Writes from any source, including other workers and seed scripts, reach the
+# caches and the semantic index as events on the shared state
+change_feed = ChangeFeed(db, shared_state, change_streams=storage.backend == "mongo")
+
+# Embedding indexes of trials, publications and experts for semantic search
+semantic_index = SemanticIndex()
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -33,9 +62,17 @@ JWT_EXPIRATION_HOURS = 72
 
 # LLM setup
 LLM_KEY = os.environ.get('EMERGENT_LLM_KEY')
+if os.environ.get('LLM_SIMULATOR'):
+    from simulator import SimulatedLlmChat as LlmChat
+
+# Seconds the readiness probe waits for a database ping
+HEALTH_CHECK_TIMEOUT = float(os.environ.get('HEALTH_CHECK_TIMEOUT', '2'))
+
+# Pay one-time costs (imports, connections, caches) at startup, not on the first request
+STARTUP_WARMUP = os.environ.get('STARTUP_WARMUP', '1') != '0'
 
 # FastAPI app
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 api_router = APIRouter(prefix="/api")
 
 # Auth helpers
@@ -54,6 +91,162 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+# Query helpers
+# Card projections: only the fields the dashboard cards render, so large
+# fields such as trial eligibility text never leave the database
+TRIAL_CARD_FIELDS = {"_id": 0, "id": 1, "nct_id": 1, "title": 1, "status": 1, "phase": 1, "location": 1, "conditions": 1}
+PUBLICATION_CARD_FIELDS = {"_id": 0, "id": 1, "pubmed_id": 1, "title": 1, "authors": 1, "published_date": 1, "url": 1}
+EXPERT_CARD_FIELDS = {"_id": 0, "id": 1, "name": 1, "specialty": 1, "research_interests": 1, "is_registered": 1}
+FORUM_CARD_FIELDS = {"_id": 0, "id": 1, "category": 1, "title": 1, "description": 1, "created_at": 1}
+
+def find_many(collection, filter_query: Optional[dict] = None, projection: Optional[dict] = None, limit: int = 100):
+    """Build a find() coroutine, excluding _id unless a projection is given"""
+    cursor = collection.find(filter_query or {}, projection or {"_id": 0})
+    return cursor.limit(limit).to_list(limit)
+
+async def fetch_concurrently(**queries) -> Dict[str, Any]:
+    """Await independent queries at the same time and return results by name"""
+    results = await asyncio.gather(*queries.values())
+    return dict(zip(queries.keys(), results))
+
+async def upsert(collection, key: dict, update: dict):
+    """update_one with upsert on a unique key. A concurrent upsert of the same
+    key can lose the insert race with a duplicate key error; the document
+    then exists, so the update is retried against it
+    """
+    try:
+        return await collection.update_one(key, update, upsert=True)
+    except DuplicateKeyError:
+        return await collection.update_one(key, update, upsert=True)
+
+async def upsert_returning(collection, key: dict, update: dict, projection: dict) -> dict:
+    """Upsert on a unique key in one round trip, returning the document after it"""
+    try:
+        return await collection.find_one_and_update(key, update, projection, upsert=True, return_document=True)
+    except DuplicateKeyError:
+        return await collection.find_one_and_update(key, update, projection, upsert=True, return_document=True)
+
+async def ensure_unique_index(collection, fields: List[str], partial: Optional[dict] = None):
+    """Unique index on fields. Duplicates already stored block it; they are
+    reported, not removed: `python migrations.py dedupe-unique-keys` reviews
+    and removes them, keeping a backup
+    """
+    options = {"partialFilterExpression": partial} if partial else {}
+    try:
+        await collection.create_index([(f, 1) for f in fields], unique=True, **options)
+    except DuplicateKeyError as e:
+        logger.error(
+            "Unique index on %s %s not built, duplicates exist (%s). Concurrent writes can add more until "
+            "`python migrations.py dedupe-unique-keys` removes them", collection.name, fields, e
+        )
+
+# Idempotency keys are unique per author; documents without one are not indexed
+IDEMPOTENT = {"idempotency_key": {"$gt": ""}}
+IDEMPOTENCY_NAMESPACE = uuid.UUID("0c5e3f7a-8d1b-4c62-9a57-3be1f0d2c4a9")
+
+def idempotent_id(owner: str, key: Optional[str]) -> str:
+    """New document id; with an idempotency key, derived from it, so a replay
+    reports the id the first attempt created
+    """
+    if key is None:
+        return str(uuid.uuid4())
+    return str(uuid.uuid5(IDEMPOTENCY_NAMESPACE, f"{owner}:{key}"))
+
+def idempotent_insert(doc: dict, owner_field: str, key: Optional[str]):
+    """Insert, or with an idempotency key an upsert that a replay leaves alone"""
+    if key is None:
+        return InsertOne(doc)
+    doc["idempotency_key"] = key
+    match = {owner_field: doc[owner_field], "idempotency_key": key}
+    return UpdateOne(match, {"$setOnInsert": {k: v for k, v in doc.items() if k not in match}}, upsert=True)
+
+async def bulk_write_items(collection, operations: list) -> Tuple[set, Dict[int, dict]]:
+    """Unordered bulk_write: (indexes of upserts that inserted, write error by index)"""
+    if not operations:
+        return set(), {}
+    try:
+        result = await collection.bulk_write(operations, ordered=False)
+        return set(result.upserted_ids), {}
+    except BulkWriteError as e:
+        upserted = {u["index"] for u in e.details.get("upserted", [])}
+        return upserted, {error["index"]: error for error in e.details["writeErrors"]}
+
+def insert_status(operation, index: int, upserted: set, errors: Dict[int, dict]) -> str:
+    """created, duplicate (an idempotency key seen before) or error"""
+    error = errors.get(index)
+    if isinstance(operation, InsertOne):
+        return "error" if error else "created"
+    if index in upserted:
+        return "created"
+    # A concurrent replay can lose the upsert race on the unique index
+    return "error" if error and error.get("code") != 11000 else "duplicate"
+
+# Keyset pagination over (created_at, id), newest first
+NEWEST_FIRST = [("created_at", -1), ("id", -1)]
+
+def encode_cursor(doc: dict) -> str:
+    return f"{doc['created_at']}|{doc['id']}"
+
+def keyset_before(cursor: str) -> dict:
+    """Filter for documents that sort after the cursor in NEWEST_FIRST order"""
+    created_at, _, item_id = cursor.partition("|")
+    return {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "id": {"$lt": item_id}}
+    ]}
+
+# Notifications: a feed entry per event, plus per-user badge counters kept with $inc
+NOTIFICATION_COUNTERS = {
+    "message": "unread_messages",
+    "connection_request": "pending_connection_requests",
+    "meeting_request": "pending_meeting_requests"
+}
+
+def notification(user_id: str, kind: str, ref_id: str, from_user: str, created_at: str) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "type": kind,
+        "ref_id": ref_id,
+        "from_user": from_user,
+        "created_at": created_at
+    }
+
+async def notify(notifications: List[dict]):
+    """Add feed entries and raise each recipient's counters, one $inc per recipient"""
+    if not notifications:
+        return
+    increments: Dict[str, Dict[str, int]] = {}
+    for entry in notifications:
+        counts = increments.setdefault(entry["user_id"], {})
+        field = NOTIFICATION_COUNTERS[entry["type"]]
+        counts[field] = counts.get(field, 0) + 1
+    updated_at = notifications[-1]["created_at"]
+    await asyncio.gather(
+        db.notifications.insert_many(notifications),
+        *(upsert(db.notification_counters, {"user_id": user_id}, {"$inc": counts, "$set": {"updated_at": updated_at}})
+          for user_id, counts in increments.items())
+    )
+
+# Geo search: resolve the origin, then one $nearSphere query on the 2dsphere index
+MAX_RADIUS_KM = 20000
+
+def resolve_origin(near: Optional[str], lat: Optional[float], lon: Optional[float]):
+    if lat is not None and lon is not None:
+        return lat, lon
+    origin = geocode(near)
+    if origin is None:
+        raise HTTPException(status_code=422, detail="Provide lat and lon, or a recognizable place in near")
+    return origin
+
+async def find_nearby(collection, origin, radius_km: float, filter_query: dict, projection: dict, limit: int):
+    """Documents within radius_km of origin, nearest first, with distance_km"""
+    radius_km = min(max(radius_km, 0), MAX_RADIUS_KM)
+    docs = await find_many(collection, {**filter_query, **near_query(*origin, radius_km)}, {**projection, "geo": 1}, limit)
+    for doc in docs:
+        doc["distance_km"] = round(distance_km(doc.pop("geo", None), *origin), 1)
+    return docs
+
 # Pydantic models
 class UserRegister(BaseModel):
     email: EmailStr
@@ -83,6 +276,7 @@ class ResearcherProfileCreate(BaseModel):
     researchgate: Optional[str] = None
     availability: bool = False
     bio: Optional[str] = None
+    location: Optional[str] = None
 
 class ClinicalTrialCreate(BaseModel):
     title: str
@@ -112,6 +306,27 @@ class FavoriteCreate(BaseModel):
     item_type: str
     item_id: str
 
+# Batch writes: one bulk_write per request, with per-item results
+MAX_BATCH_ITEMS = 500
+
+class FavoriteBatchItem(FavoriteCreate):
+    action: Literal["add", "remove"] = "add"
+
+class FavoriteBatch(BaseModel):
+    items: List[FavoriteBatchItem] = Field(min_length=1, max_length=MAX_BATCH_ITEMS)
+
+class MessageBatchItem(MessageCreate):
+    idempotency_key: Optional[str] = Field(None, min_length=1, max_length=128)
+
+class MessageBatch(BaseModel):
+    messages: List[MessageBatchItem] = Field(min_length=1, max_length=MAX_BATCH_ITEMS)
+
+class ForumPostBatchItem(ForumPostCreate):
+    idempotency_key: Optional[str] = Field(None, min_length=1, max_length=128)
+
+class ForumPostBatch(BaseModel):
+    posts: List[ForumPostBatchItem] = Field(min_length=1, max_length=MAX_BATCH_ITEMS)
+
 class ConnectionRequestCreate(BaseModel):
     to_user: str
 
@@ -119,6 +334,92 @@ class MeetingRequestCreate(BaseModel):
     expert_id: str
     notes: Optional[str] = None
 
+MeetingStatus = Literal["pending", "accepted", "declined"]
+MEETING_DECISIONS = {"accept": "accepted", "decline": "declined"}
+
+# List-view response models: the fields the React list pages render.
+# Detail endpoints return the full stored record.
+SNIPPET_LENGTH = 300
+
+def make_snippet(text: Optional[str]) -> Optional[str]:
+    if text and len(text) > SNIPPET_LENGTH:
+        return text[:SNIPPET_LENGTH].rsplit(" ", 1)[0] + "..."
+    return text
+
+class TrialSummary(BaseModel):
+    id: str
+    nct_id: Optional[str] = None
+    title: str
+    status: Optional[str] = None
+    phase: Optional[str] = None
+    location: Optional[str] = None
+    conditions: List[str] = []
+    description: Optional[str] = None
+    relevance_score: Optional[int] = None
+    distance_km: Optional[float] = None
+
+    @field_validator("description")
+    @classmethod
+    def shorten_description(cls, value):
+        return make_snippet(value)
+
+class PublicationSummary(BaseModel):
+    id: str
+    pubmed_id: Optional[str] = None
+    title: str
+    authors: List[str] = []
+    published_date: Optional[str] = None
+    url: Optional[str] = None
+    abstract: Optional[str] = None
+    relevance_score: Optional[int] = None
+
+    @field_validator("abstract")
+    @classmethod
+    def shorten_abstract(cls, value):
+        return make_snippet(value)
+
+class ExpertSummary(BaseModel):
+    id: str
+    name: str
+    specialty: List[str] = []
+    research_interests: List[str] = []
+    is_registered: bool = False
+    location: Optional[str] = None
+    relevance_score: Optional[int] = None
+    distance_km: Optional[float] = None
+
+class ForumSummary(BaseModel):
+    id: str
+    category: str
+    title: str
+    description: Optional[str] = None
+    created_at: Optional[str] = None
+    post_count: int = 0
+    thread_count: int = 0
+    last_activity_at: Optional[str] = None
+
+def list_projection(model) -> dict:
+    """Mongo projection fetching only the fields of a list-view model"""
+    return {"_id": 0, **{name: 1 for name in model.model_fields if name != "relevance_score"}}
+
+TRIAL_LIST_FIELDS = list_projection(TrialSummary)
+PUBLICATION_LIST_FIELDS = list_projection(PublicationSummary)
+EXPERT_LIST_FIELDS = list_projection(ExpertSummary)
+
+class SemanticSearchResults(BaseModel):
+    trials: List[TrialSummary] = []
+    publications: List[PublicationSummary] = []
+    experts: List[ExpertSummary] = []
+
+# Result type -> (collection, list projection) for semantic search
+SEMANTIC_TYPES = {
+    "trials": ("clinical_trials", TRIAL_LIST_FIELDS),
+    "publications": ("publications", PUBLICATION_LIST_FIELDS),
+    "experts": ("health_experts", EXPERT_LIST_FIELDS)
+}
+MAX_SEMANTIC_RESULTS = 50
+FORUM_LIST_FIELDS = list_projection(ForumSummary)
+
 # API endpoints
 @api_router.post("/auth/register")
 async def register(user_data: UserRegister):
@@ -222,62 +523,61 @@ async def create_patient_profile(profile: PatientProfileCreate, payload: dict =
     except Exception as e:
         conditions = [profile.raw_input]
     
-    existing = await db.patient_profiles.find_one({"user_id": user_id})
-    if existing:
-        await db.patient_profiles.update_one(
-            {"user_id": user_id},
-            {"$set": {
+    # One atomic upsert per user, backed by the unique index on user_id
+    saved = await upsert_returning(
+        db.patient_profiles,
+        {"user_id": user_id},
+        {
+            "$set": {
                 "conditions": conditions,
                 "location": profile.location,
                 "raw_input": profile.raw_input
-            }}
-        )
-        return {"id": existing["id"], "conditions": conditions}
-    
-    new_profile = {
-        "id": str(uuid.uuid4()),
-        "user_id": user_id,
-        "conditions": conditions,
-        "location": profile.location,
-        "raw_input": profile.raw_input,
-        "created_at": datetime.now(timezone.utc).isoformat()
-    }
-    await db.patient_profiles.insert_one(new_profile)
-    return {"id": new_profile["id"], "conditions": conditions}
+            },
+            "$setOnInsert": {"id": str(uuid.uuid4()), "created_at": datetime.now(timezone.utc).isoformat()}
+        },
+        {"_id": 0, "id": 1}
+    )
+    return {"id": saved["id"], "conditions": conditions}
 
 @api_router.get("/patients/dashboard")
 async def get_patient_dashboard(payload: dict = Depends(verify_token)):
     user_id = payload["sub"]
-    profile = await db.patient_profiles.find_one({"user_id": user_id}, {"_id": 0})
-    
-    trials = await db.clinical_trials.find({}, {"_id": 0}).limit(5).to_list(5)
-    publications = await db.publications.find({}, {"_id": 0}).limit(5).to_list(5)
-    experts = await db.health_experts.find({}, {"_id": 0}).limit(5).to_list(5)
-    
-    return {
-        "profile": profile,
-        "trials": trials,
-        "publications": publications,
-        "experts": experts
-    }
+    return await fetch_concurrently(
+        profile=db.patient_profiles.find_one({"user_id": user_id}, {"_id": 0}),
+        trials=catalog_cache.get("trials", "cards", lambda: find_many(read_db.clinical_trials, projection=TRIAL_CARD_FIELDS, limit=5)),
+        publications=catalog_cache.get("publications", "cards", lambda: find_many(read_db.publications, projection=PUBLICATION_CARD_FIELDS, limit=5)),
+        experts=catalog_cache.get("experts", "cards", lambda: find_many(read_db.health_experts, projection=EXPERT_CARD_FIELDS, limit=5))
+    )
 
-@api_router.get("/patients/experts")
+@api_router.get("/patients/experts", response_model=List[ExpertSummary], response_model_exclude_none=True)
 async def get_health_experts():
-    experts = await db.health_experts.find({}, {"_id": 0}).limit(20).to_list(20)
+    experts = await catalog_cache.get("experts", "list", lambda: find_many(read_db.health_experts, projection=EXPERT_LIST_FIELDS, limit=20))
     return experts
 
-@api_router.get("/patients/clinical-trials")
+@api_router.get("/patients/experts/nearby", response_model=List[ExpertSummary], response_model_exclude_none=True)
+async def get_nearby_experts(near: Optional[str] = None, lat: Optional[float] = None, lon: Optional[float] = None,
+                             radius_km: float = 100, limit: int = 20):
+    origin = resolve_origin(near, lat, lon)
+    return await find_nearby(read_db.health_experts, origin, radius_km, {}, EXPERT_LIST_FIELDS, max(1, min(limit, 100)))
+
+@api_router.get("/patients/experts/{expert_id}")
+async def get_health_expert(expert_id: str):
+    expert = await catalog_cache.get("experts", ("detail", expert_id), lambda: db.health_experts.find_one({"id": expert_id}, {"_id": 0}))
+    if not expert:
+        raise HTTPException(status_code=404, detail="Expert not found")
+    return expert
+
+@api_router.get("/patients/clinical-trials", response_model=List[TrialSummary], response_model_exclude_none=True)
 async def search_clinical_trials(query: Optional[str] = None, status: Optional[str] = None, location: Optional[str] = None):
-    from api_integrations import search_clinical_trials as api_search_trials, calculate_relevance_score
+    from api_integrations import search_clinical_trials as api_search_trials, score_results
     
     # If query provided, use ClinicalTrials.gov API
     if query:
         api_trials = await api_search_trials(query, location, max_results=15)
         
         # Calculate relevance scores
+        await score_results(query, trial=api_trials)
         for trial in api_trials:
-            score = await calculate_relevance_score(query, trial, "trial")
-            trial["relevance_score"] = round(score * 100)
             trial["id"] = trial.get("nct_id", str(uuid.uuid4()))
         
         # Sort by relevance
@@ -288,23 +588,39 @@ async def search_clinical_trials(query: Optional[str] = None, status: Optional[s
     filter_query = {}
     if status:
         filter_query["status"] = status
-    trials = await db.clinical_trials.find(filter_query, {"_id": 0}).limit(20).to_list(20)
+    trials = await catalog_cache.get("trials", ("list", status), lambda: find_many(read_db.clinical_trials, filter_query, TRIAL_LIST_FIELDS, limit=20))
     for t in trials:
         t["relevance_score"] = 75
     return trials
 
-@api_router.get("/patients/publications")
+@api_router.get("/patients/clinical-trials/nearby", response_model=List[TrialSummary], response_model_exclude_none=True)
+async def get_nearby_clinical_trials(near: Optional[str] = None, lat: Optional[float] = None, lon: Optional[float] = None,
+                                     radius_km: float = 100, status: Optional[str] = None, limit: int = 20):
+    origin = resolve_origin(near, lat, lon)
+    filter_query = {"status": status} if status else {}
+    return await find_nearby(read_db.clinical_trials, origin, radius_km, filter_query, TRIAL_LIST_FIELDS, max(1, min(limit, 100)))
+
+@api_router.get("/patients/clinical-trials/{trial_id}")
+async def get_clinical_trial(trial_id: str):
+    trial = await catalog_cache.get(
+        "trials", ("detail", trial_id),
+        lambda: db.clinical_trials.find_one({"$or": [{"id": trial_id}, {"nct_id": trial_id}]}, {"_id": 0})
+    )
+    if not trial:
+        raise HTTPException(status_code=404, detail="Trial not found")
+    return trial
+
+@api_router.get("/patients/publications", response_model=List[PublicationSummary], response_model_exclude_none=True)
 async def search_publications(query: Optional[str] = None):
-    from api_integrations import search_pubmed, calculate_relevance_score
+    from api_integrations import search_pubmed, score_results
     
     # If query provided, use PubMed API
     if query:
         api_pubs = await search_pubmed(query, max_results=15)
         
         # Calculate relevance scores
+        await score_results(query, publication=api_pubs)
         for pub in api_pubs:
-            score = await calculate_relevance_score(query, pub, "publication")
-            pub["relevance_score"] = round(score * 100)
             pub["id"] = pub.get("pubmed_id", str(uuid.uuid4()))
         
         # Sort by relevance
@@ -312,66 +628,79 @@ async def search_publications(query: Optional[str] = None):
         return api_pubs
     
     # Otherwise return database publications
-    publications = await db.publications.find({}, {"_id": 0}).limit(20).to_list(20)
+    publications = await catalog_cache.get("publications", "list", lambda: find_many(read_db.publications, projection=PUBLICATION_LIST_FIELDS, limit=20))
     for p in publications:
         p["relevance_score"] = 75
     return publications
 
+@api_router.get("/patients/publications/{publication_id}")
+async def get_publication(publication_id: str):
+    publication = await catalog_cache.get(
+        "publications", ("detail", publication_id),
+        lambda: db.publications.find_one({"$or": [{"id": publication_id}, {"pubmed_id": publication_id}]}, {"_id": 0})
+    )
+    if not publication:
+        raise HTTPException(status_code=404, detail="Publication not found")
+    return publication
+
 @api_router.post("/researchers/profile")
 async def create_researcher_profile(profile: ResearcherProfileCreate, payload: dict = Depends(verify_token)):
     user_id = payload["sub"]
     
-    existing = await db.researcher_profiles.find_one({"user_id": user_id})
+    now = datetime.now(timezone.utc).isoformat()
     profile_data = {
         "specialties": profile.specialties,
         "research_interests": profile.research_interests,
         "orcid": profile.orcid,
         "researchgate": profile.researchgate,
         "availability": profile.availability,
-        "bio": profile.bio
+        "bio": profile.bio,
+        "location": profile.location
     }
     
-    if existing:
-        await db.researcher_profiles.update_one({"user_id": user_id}, {"$set": profile_data})
-        profile_id = existing["id"]
-    else:
-        profile_data.update({
-            "id": str(uuid.uuid4()),
-            "user_id": user_id,
-            "created_at": datetime.now(timezone.utc).isoformat()
-        })
-        await db.researcher_profiles.insert_one(profile_data)
-        profile_id = profile_data["id"]
-        
-        # Create health expert entry
-        user = await db.users.find_one({"id": user_id})
-        expert = {
-            "id": str(uuid.uuid4()),
-            "user_id": user_id,
-            "name": user["email"].split('@')[0],
+    # Atomic upserts on the unique user_id indexes: retries and concurrent
+    # calls update the one profile and expert entry instead of adding more
+    results = await fetch_concurrently(
+        profile=upsert_returning(
+            db.researcher_profiles,
+            {"user_id": user_id},
+            {"$set": profile_data, "$setOnInsert": {"id": str(uuid.uuid4()), "created_at": now}},
+            {"_id": 0, "id": 1}
+        ),
+        user=db.users.find_one({"id": user_id}, {"_id": 0, "email": 1})
+    )
+    profile_id = results["profile"]["id"]
+    
+    # Health expert entry: created with the profile, afterwards only its location follows it
+    expert_id = str(uuid.uuid4())
+    result = await upsert(db.health_experts, {"user_id": user_id}, {
+        "$set": {"location": profile.location, "geo": location_geometry(profile.location)},
+        "$setOnInsert": {
+            "id": expert_id,
+            "name": results["user"]["email"].split('@')[0],
             "specialty": profile.specialties,
             "research_interests": profile.research_interests,
             "is_registered": True,
             "bio": profile.bio,
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "created_at": now
         }
-        await db.health_experts.insert_one(expert)
+    })
+    if result.upserted_id is not None:
+        await shared_state.publish("semantic_index", {"collection": "health_experts", "ids": [expert_id]})
     
+    await catalog_cache.invalidate("experts")
     return {"id": profile_id}
 
 @api_router.get("/researchers/dashboard")
 async def get_researcher_dashboard(payload: dict = Depends(verify_token)):
     user_id = payload["sub"]
-    profile = await db.researcher_profiles.find_one({"user_id": user_id}, {"_id": 0})
-    
-    trials = await db.clinical_trials.find({"created_by": user_id}, {"_id": 0}).to_list(100)
-    forums = await db.forums.find({"created_by": user_id}, {"_id": 0}).to_list(100)
-    
-    return {
-        "profile": profile or {},
-        "trials": trials,
-        "forums": forums
-    }
+    results = await fetch_concurrently(
+        profile=db.researcher_profiles.find_one({"user_id": user_id}, {"_id": 0}),
+        trials=find_many(db.clinical_trials, {"created_by": user_id}, TRIAL_CARD_FIELDS),
+        forums=find_many(db.forums, {"created_by": user_id}, FORUM_CARD_FIELDS)
+    )
+    results["profile"] = results["profile"] or {}
+    return results
 
 @api_router.get("/researchers/collaborators")
 async def get_collaborators():
@@ -400,6 +729,7 @@ async def create_clinical_trial(trial: ClinicalTrialCreate, payload: dict = Depe
         "phase": trial.phase,
         "status": trial.status,
         "location": trial.location,
+        "geo": location_geometry(trial.location),
         "eligibility": trial.eligibility,
         "contact": trial.contact,
         "conditions": trial.conditions,
@@ -407,6 +737,8 @@ async def create_clinical_trial(trial: ClinicalTrialCreate, payload: dict = Depe
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     await db.clinical_trials.insert_one(new_trial)
+    await shared_state.publish("semantic_index", {"collection": "clinical_trials", "ids": [new_trial["id"]]})
+    await catalog_cache.invalidate("trials")
     return {"id": new_trial["id"], "nct_id": new_trial["nct_id"]}
 
 @api_router.put("/researchers/clinical-trials/{trial_id}")
@@ -419,6 +751,7 @@ async def update_clinical_trial(trial_id: str, trial: ClinicalTrialCreate, paylo
             "phase": trial.phase,
             "status": trial.status,
             "location": trial.location,
+            "geo": location_geometry(trial.location),
             "eligibility": trial.eligibility,
             "contact": trial.contact,
             "conditions": trial.conditions
@@ -426,29 +759,54 @@ async def update_clinical_trial(trial_id: str, trial: ClinicalTrialCreate, paylo
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Trial not found")
+    await shared_state.publish("semantic_index", {"collection": "clinical_trials", "ids": [trial_id]})
+    await catalog_cache.invalidate("trials")
     return {"id": trial_id}
 
+@api_router.get("/researchers/clinical-trials/sweep")
+async def sweep_clinical_trials(condition: str, location: Optional[str] = None, status: Optional[str] = None,
+                                max_trials: int = 5000, payload: dict = Depends(verify_token)):
+    """Every matching ClinicalTrials.gov study as NDJSON, streamed page by page"""
+    from api_integrations import iter_clinical_trials
+    from upstream import UpstreamError
+
+    trials = iter_clinical_trials(condition, location, status=status, max_trials=max_trials)
+    # Fail with a status code if the first page cannot be fetched; later
+    # failures end the stream with an error line
+    try:
+        first_page = [await trials.__anext__()]
+    except StopAsyncIteration:
+        first_page = []
+    except UpstreamError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+
+    async def documents():
+        for trial in first_page:
+            yield trial
+        try:
+            async for trial in trials:
+                yield trial
+        except UpstreamError as e:
+            yield {"error": str(e)}
+
+    return NDJSONResponse(documents())
+
 @api_router.post("/connection-requests")
 async def create_connection_request(request: ConnectionRequestCreate, payload: dict = Depends(verify_token)):
     from_user = payload["sub"]
     
-    existing = await db.connection_requests.find_one({
-        "from_user": from_user,
-        "to_user": request.to_user
-    })
-    
-    if existing:
-        return {"id": existing["id"], "status": existing["status"]}
-    
-    new_request = {
-        "id": str(uuid.uuid4()),
-        "from_user": from_user,
-        "to_user": request.to_user,
-        "status": "pending",
-        "created_at": datetime.now(timezone.utc).isoformat()
-    }
-    await db.connection_requests.insert_one(new_request)
-    return {"id": new_request["id"], "status": new_request["status"]}
+    # Returns the existing request for the pair, or the one this call created
+    request_id = str(uuid.uuid4())
+    now = datetime.now(timezone.utc).isoformat()
+    saved = await upsert_returning(
+        db.connection_requests,
+        {"from_user": from_user, "to_user": request.to_user},
+        {"$setOnInsert": {"id": request_id, "status": "pending", "created_at": now}},
+        {"_id": 0, "id": 1, "status": 1}
+    )
+    if saved["id"] == request_id:
+        await notify([notification(request.to_user, "connection_request", request_id, from_user, now)])
+    return {"id": saved["id"], "status": saved["status"]}
 
 @api_router.get("/connection-requests")
 async def get_connection_requests(payload: dict = Depends(verify_token)):
@@ -461,6 +819,7 @@ async def get_connection_requests(payload: dict = Depends(verify_token)):
 @api_router.post("/forums")
 async def create_forum(forum: ForumCreate, payload: dict = Depends(verify_token)):
     user_id = payload["sub"]
+    now = datetime.now(timezone.utc).isoformat()
     
     new_forum = {
         "id": str(uuid.uuid4()),
@@ -468,37 +827,222 @@ async def create_forum(forum: ForumCreate, payload: dict = Depends(verify_token)
         "title": forum.title,
         "description": forum.description,
         "created_by": user_id,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": now,
+        "post_count": 0,
+        "thread_count": 0,
+        "last_activity_at": now
     }
     await db.forums.insert_one(new_forum)
+    await catalog_cache.invalidate("forums")
     return {"id": new_forum["id"]}
 
-@api_router.get("/forums")
+@api_router.get("/forums", response_model=List[ForumSummary], response_model_exclude_none=True)
 async def get_forums(category: Optional[str] = None):
     filter_query = {"category": category} if category else {}
-    forums = await db.forums.find(filter_query, {"_id": 0}).to_list(100)
+    forums = await catalog_cache.get("forums", ("list", category), lambda: find_many(read_db.forums, filter_query, FORUM_LIST_FIELDS))
     return forums
 
+@api_router.get("/forums/{forum_id}")
+async def get_forum(forum_id: str):
+    forum = await catalog_cache.get("forums", ("detail", forum_id), lambda: db.forums.find_one({"id": forum_id}, {"_id": 0}))
+    if not forum:
+        raise HTTPException(status_code=404, detail="Forum not found")
+    return forum
+
+# Enough of a post to follow it up to its thread's top-level post
+THREAD_LINK_FIELDS = {"_id": 0, "id": 1, "parent_id": 1, "thread_id": 1}
+
+async def thread_root(post: dict) -> str:
+    """Id of the top-level post a post's thread starts at. Posts written
+    before thread_id existed only link to their parent, so walk those links up
+    """
+    seen = set()
+    while not post.get("thread_id") and post.get("parent_id") and post["id"] not in seen:
+        seen.add(post["id"])
+        parent = await db.forum_posts.find_one({"id": post["parent_id"]}, THREAD_LINK_FIELDS)
+        if not parent:
+            break
+        post = parent
+    return post.get("thread_id") or post["id"]
+
 @api_router.post("/forums/posts")
 async def create_forum_post(post: ForumPostCreate, payload: dict = Depends(verify_token)):
     user_id = payload["sub"]
+    now = datetime.now(timezone.utc).isoformat()
+    post_id = str(uuid.uuid4())
+    
+    # Replies join their parent's thread; top-level posts start a new one
+    thread_id = post_id
+    if post.parent_id:
+        parent = await db.forum_posts.find_one(
+            {"id": post.parent_id, "forum_id": post.forum_id}, THREAD_LINK_FIELDS
+        )
+        if not parent:
+            raise HTTPException(status_code=404, detail="Parent post not found")
+        thread_id = await thread_root(parent)
     
     new_post = {
-        "id": str(uuid.uuid4()),
+        "id": post_id,
         "forum_id": post.forum_id,
         "user_id": user_id,
         "content": post.content,
         "parent_id": post.parent_id,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "thread_id": thread_id,
+        "reply_count": 0,
+        "created_at": now,
+        "last_activity_at": now
     }
     await db.forum_posts.insert_one(new_post)
-    return {"id": new_post["id"]}
+    
+    # Counters move once the post is stored, so a failed insert leaves them as
+    # they were; keeping them current lets listing forums stay one query
+    result = await db.forums.update_one(
+        {"id": post.forum_id},
+        {
+            "$inc": {"post_count": 1, "thread_count": 0 if post.parent_id else 1},
+            "$set": {"last_activity_at": now, "last_post_id": post_id}
+        }
+    )
+    if result.matched_count == 0:
+        await db.forum_posts.delete_one({"id": post_id})
+        raise HTTPException(status_code=404, detail="Forum not found")
+    
+    if post.parent_id:
+        await db.forum_posts.update_one(
+            {"id": thread_id},
+            {"$inc": {"reply_count": 1}, "$set": {"last_activity_at": now}}
+        )
+    # The forum's post and thread counters changed
+    await catalog_cache.invalidate("forums")
+    return {"id": post_id, "thread_id": thread_id}
+
+@api_router.post("/forums/posts/batch")
+async def create_forum_posts(batch: ForumPostBatch, payload: dict = Depends(verify_token)):
+    """Create many posts with one bulk write; posts replayed with the same
+    idempotency_key are reported as duplicates and not counted again
+    """
+    user_id = payload["sub"]
+    now = datetime.now(timezone.utc).isoformat()
+    parent_ids = list({p.parent_id for p in batch.posts if p.parent_id})
+    found = await fetch_concurrently(
+        forums=db.forums.distinct("id", {"id": {"$in": list({p.forum_id for p in batch.posts})}}),
+        parents=find_many(db.forum_posts, {"id": {"$in": parent_ids}}, {**THREAD_LINK_FIELDS, "forum_id": 1}, len(parent_ids) or 1)
+    )
+    forums = set(found["forums"])
+    parents = {p["id"]: p for p in found["parents"]}
+    for parent in parents.values():
+        parent["thread_id"] = await thread_root(parent)
+    
+    results, operations, posts = [], [], []
+    for post in batch.posts:
+        parent = parents.get(post.parent_id) if post.parent_id else None
+        if post.forum_id not in forums:
+            results.append({"status": "error", "detail": "Forum not found"})
+            continue
+        if post.parent_id and (parent is None or parent["forum_id"] != post.forum_id):
+            results.append({"status": "error", "detail": "Parent post not found"})
+            continue
+        post_id = idempotent_id(user_id, post.idempotency_key)
+        new_post = {
+            "id": post_id,
+            "forum_id": post.forum_id,
+            "user_id": user_id,
+            "content": post.content,
+            "parent_id": post.parent_id,
+            "thread_id": parent["thread_id"] if parent else post_id,
+            "reply_count": 0,
+            "created_at": now,
+            "last_activity_at": now
+        }
+        operations.append(idempotent_insert(new_post, "user_id", post.idempotency_key))
+        posts.append(new_post)
+        results.append({"id": post_id, "thread_id": new_post["thread_id"]})
+    
+    upserted, errors = await bulk_write_items(db.forum_posts, operations)
+    created = []
+    written = [r for r in results if "id" in r]
+    for index, (operation, new_post) in enumerate(zip(operations, posts)):
+        written[index]["status"] = insert_status(operation, index, upserted, errors)
+        if written[index]["status"] == "created":
+            created.append(new_post)
+    
+    # Counters move only for posts this request created
+    forum_counts, thread_replies = {}, {}
+    for new_post in created:
+        counts = forum_counts.setdefault(new_post["forum_id"], {"post_count": 0, "thread_count": 0, "last_post_id": None})
+        counts["post_count"] += 1
+        counts["thread_count"] += 0 if new_post["parent_id"] else 1
+        counts["last_post_id"] = new_post["id"]
+        if new_post["parent_id"]:
+            thread_replies[new_post["thread_id"]] = thread_replies.get(new_post["thread_id"], 0) + 1
+    await asyncio.gather(
+        bulk_write_items(db.forums, [
+            UpdateOne({"id": forum_id}, {
+                "$inc": {"post_count": c["post_count"], "thread_count": c["thread_count"]},
+                "$set": {"last_activity_at": now, "last_post_id": c["last_post_id"]}
+            })
+            for forum_id, c in forum_counts.items()
+        ]),
+        bulk_write_items(db.forum_posts, [
+            UpdateOne({"id": thread_id}, {"$inc": {"reply_count": n}, "$set": {"last_activity_at": now}})
+            for thread_id, n in thread_replies.items()
+        ])
+    )
+    if created:
+        await catalog_cache.invalidate("forums")
+    return {"results": results}
 
 @api_router.get("/forums/{forum_id}/posts")
 async def get_forum_posts(forum_id: str):
     posts = await db.forum_posts.find({"forum_id": forum_id}, {"_id": 0}).to_list(100)
     return posts
 
+MAX_THREAD_REPLIES = 1000
+
+def build_post_tree(roots: List[dict], replies: List[dict]) -> List[dict]:
+    """Nest replies under their parents; replies arrive oldest first"""
+    nodes = {p["id"]: {**p, "replies": []} for p in roots + replies}
+    for reply in replies:
+        parent = nodes.get(reply["parent_id"])
+        if parent:
+            parent["replies"].append(nodes[reply["id"]])
+    return [nodes[root["id"]] for root in roots]
+
+@api_router.get("/forums/{forum_id}/threads")
+async def get_forum_threads(forum_id: str, limit: int = 20, cursor: Optional[str] = None):
+    """Top-level posts, newest first, each with its nested replies"""
+    limit = max(1, min(limit, 100))
+    filter_query = {"forum_id": forum_id, "parent_id": None}
+    if cursor:
+        filter_query.update(keyset_before(cursor))
+    roots = await db.forum_posts.find(filter_query, {"_id": 0}).sort(NEWEST_FIRST).limit(limit).to_list(limit)
+    
+    replies = []
+    if roots:
+        root_ids = [r["id"] for r in roots]
+        replies = await db.forum_posts.find({
+            "forum_id": forum_id,
+            "parent_id": {"$ne": None},
+            "thread_id": {"$in": root_ids}
+        }, {"_id": 0}).sort("created_at", 1).to_list(MAX_THREAD_REPLIES)
+        
+        # Posts written before thread_id existed have none, or a non-root one,
+        # until `python migrations.py forum-counters` fixes it; gather them by
+        # parent link one level at a time
+        frontier = root_ids + [r["id"] for r in replies]
+        while frontier and len(replies) < MAX_THREAD_REPLIES:
+            legacy = await db.forum_posts.find(
+                {"forum_id": forum_id, "parent_id": {"$in": frontier}, "thread_id": {"$nin": root_ids}}, {"_id": 0}
+            ).to_list(MAX_THREAD_REPLIES - len(replies))
+            replies += legacy
+            frontier = [r["id"] for r in legacy]
+        replies.sort(key=lambda r: r.get("created_at") or "")
+    
+    return {
+        "threads": build_post_tree(roots, replies),
+        "next_cursor": encode_cursor(roots[-1]) if len(roots) == limit else None
+    }
+
 @api_router.post("/chat/messages")
 async def send_message(message: MessageCreate, payload: dict = Depends(verify_token)):
     from_user = payload["sub"]
@@ -512,8 +1056,37 @@ async def send_message(message: MessageCreate, payload: dict = Depends(verify_to
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     await db.messages.insert_one(new_message)
+    await notify([notification(message.to_user, "message", new_message["id"], from_user, new_message["created_at"])])
     return {"id": new_message["id"]}
 
+@api_router.post("/chat/messages/batch")
+async def send_messages(batch: MessageBatch, payload: dict = Depends(verify_token)):
+    """Send or import many messages with one bulk write; messages replayed with
+    the same idempotency_key are reported as duplicates, not stored twice
+    """
+    from_user = payload["sub"]
+    now = datetime.now(timezone.utc).isoformat()
+    operations, ids = [], []
+    for message in batch.messages:
+        new_message = {
+            "id": idempotent_id(from_user, message.idempotency_key),
+            "from_user": from_user,
+            "to_user": message.to_user,
+            "message": message.message,
+            "read": False,
+            "created_at": now
+        }
+        operations.append(idempotent_insert(new_message, "from_user", message.idempotency_key))
+        ids.append(new_message["id"])
+    upserted, errors = await bulk_write_items(db.messages, operations)
+    statuses = [insert_status(operation, index, upserted, errors) for index, operation in enumerate(operations)]
+    # Replayed messages were counted when first sent
+    await notify([
+        notification(message.to_user, "message", ids[index], from_user, now)
+        for index, message in enumerate(batch.messages) if statuses[index] == "created"
+    ])
+    return {"results": [{"id": message_id, "status": status} for message_id, status in zip(ids, statuses)]}
+
 @api_router.get("/chat/messages/{user_id}")
 async def get_messages(user_id: str, payload: dict = Depends(verify_token)):
     current_user = payload["sub"]
@@ -523,31 +1096,86 @@ async def get_messages(user_id: str, payload: dict = Depends(verify_token)):
             {"from_user": user_id, "to_user": current_user}
         ]
     }, {"_id": 0}).sort("created_at", 1).to_list(1000)
-    return messages
+    # Stored documents are JSON-native, so skip jsonable_encoder on this large payload
+    return FastJSONResponse(messages)
+
+@api_router.post("/chat/messages/{user_id}/read")
+async def mark_messages_read(user_id: str, payload: dict = Depends(verify_token)):
+    """Mark the messages user_id sent the caller as read and lower the unread badge"""
+    current_user = payload["sub"]
+    result = await db.messages.update_many(
+        {"from_user": user_id, "to_user": current_user, "read": False},
+        {"$set": {"read": True}}
+    )
+    if result.modified_count:
+        await db.notification_counters.update_one(
+            {"user_id": current_user}, {"$inc": {"unread_messages": -result.modified_count}}
+        )
+    return {"read": result.modified_count}
+
+@api_router.get("/notifications/counts")
+async def get_notification_counts(payload: dict = Depends(verify_token)):
+    """Badge counts: one point read of the caller's counter document"""
+    counters = await db.notification_counters.find_one({"user_id": payload["sub"]}, {"_id": 0}) or {}
+    # Messages sent before counting began can take a counter below zero once read
+    return {field: max(0, counters.get(field, 0)) for field in NOTIFICATION_COUNTERS.values()}
+
+@api_router.get("/notifications")
+async def get_notifications(limit: int = 20, cursor: Optional[str] = None, payload: dict = Depends(verify_token)):
+    """The caller's notifications, newest first"""
+    limit = max(1, min(limit, 100))
+    filter_query = {"user_id": payload["sub"]}
+    if cursor:
+        filter_query.update(keyset_before(cursor))
+    notifications = await db.notifications.find(filter_query, {"_id": 0}).sort(NEWEST_FIRST).limit(limit).to_list(limit)
+    return {
+        "notifications": notifications,
+        "next_cursor": encode_cursor(notifications[-1]) if len(notifications) == limit else None
+    }
 
 @api_router.post("/favorites")
 async def add_favorite(favorite: FavoriteCreate, payload: dict = Depends(verify_token)):
     user_id = payload["sub"]
     
-    existing = await db.favorites.find_one({
-        "user_id": user_id,
-        "item_type": favorite.item_type,
-        "item_id": favorite.item_id
-    })
+    key = {"user_id": user_id, "item_type": favorite.item_type, "item_id": favorite.item_id}
     
-    if existing:
-        await db.favorites.delete_one({"id": existing["id"]})
-        return {"removed": True}
+    # Toggle: the upsert adds the favorite in one round trip; if it matched an
+    # existing one, that is removed instead
+    favorite_id = str(uuid.uuid4())
+    result = await upsert(db.favorites, key, {"$setOnInsert": {"id": favorite_id, "created_at": datetime.now(timezone.utc).isoformat()}})
+    if result.upserted_id is not None:
+        return {"id": favorite_id, "added": True}
+    await db.favorites.delete_one(key)
+    return {"removed": True}
+
+@api_router.post("/favorites/batch")
+async def update_favorites(batch: FavoriteBatch, payload: dict = Depends(verify_token)):
+    """Add or remove many favorites with one bulk write. Adds are upserts on
+    (user, item), so replaying a batch changes nothing
+    """
+    user_id = payload["sub"]
+    now = datetime.now(timezone.utc).isoformat()
+    operations, ids = [], []
+    for item in batch.items:
+        key = {"user_id": user_id, "item_type": item.item_type, "item_id": item.item_id}
+        ids.append(str(uuid.uuid4()) if item.action == "add" else None)
+        if item.action == "add":
+            operations.append(UpdateOne(key, {"$setOnInsert": {"id": ids[-1], "created_at": now}}, upsert=True))
+        else:
+            operations.append(DeleteMany(key))
+    upserted, errors = await bulk_write_items(db.favorites, operations)
     
-    new_favorite = {
-        "id": str(uuid.uuid4()),
-        "user_id": user_id,
-        "item_type": favorite.item_type,
-        "item_id": favorite.item_id,
-        "created_at": datetime.now(timezone.utc).isoformat()
-    }
-    await db.favorites.insert_one(new_favorite)
-    return {"id": new_favorite["id"], "added": True}
+    results = []
+    for index, item in enumerate(batch.items):
+        result = {"item_type": item.item_type, "item_id": item.item_id}
+        if item.action == "remove":
+            result["status"] = "error" if index in errors else "removed"
+        else:
+            result["status"] = insert_status(operations[index], index, upserted, errors)
+            if result["status"] == "created":
+                result["id"] = ids[index]
+        results.append(result)
+    return {"results": results}
 
 @api_router.get("/favorites")
 async def get_favorites(payload: dict = Depends(verify_token)):
@@ -569,7 +1197,7 @@ async def get_favorites(payload: dict = Depends(verify_token)):
             if expert:
                 result["experts"].append(expert)
     
-    return result
+    return FastJSONResponse(result)
 
 @api_router.post("/meeting-requests")
 async def create_meeting_request(request: MeetingRequestCreate, payload: dict = Depends(verify_token)):
@@ -583,9 +1211,84 @@ async def create_meeting_request(request: MeetingRequestCreate, payload: dict =
         "notes": request.notes,
         "created_at": datetime.now(timezone.utc).isoformat()
     }
-    await db.meeting_requests.insert_one(new_request)
+    results = await fetch_concurrently(
+        expert=db.health_experts.find_one({"id": request.expert_id}, {"_id": 0, "user_id": 1}),
+        inserted=db.meeting_requests.insert_one(new_request)
+    )
+    # Seeded experts have no account to notify
+    expert_user = (results["expert"] or {}).get("user_id")
+    if expert_user:
+        await notify([notification(expert_user, "meeting_request", new_request["id"], patient_id, new_request["created_at"])])
     return {"id": new_request["id"], "status": new_request["status"]}
 
+async def own_expert_id(user_id: str) -> str:
+    """The health_experts id of a researcher's account"""
+    expert = await db.health_experts.find_one({"user_id": user_id}, {"_id": 0, "id": 1})
+    if not expert:
+        raise HTTPException(status_code=404, detail="Expert profile not found")
+    return expert["id"]
+
+@api_router.get("/meeting-requests/inbox")
+async def get_meeting_inbox(status: MeetingStatus = "pending", limit: int = 20, cursor: Optional[str] = None,
+                            payload: dict = Depends(verify_token)):
+    """An expert's requests in one status, newest first, paged on the
+    (expert_id, status, created_at, id) index
+    """
+    limit = max(1, min(limit, 100))
+    filter_query = {"expert_id": await own_expert_id(payload["sub"]), "status": status}
+    if cursor:
+        filter_query.update(keyset_before(cursor))
+    requests = await db.meeting_requests.find(filter_query, {"_id": 0}).sort(NEWEST_FIRST).limit(limit).to_list(limit)
+    return {
+        "requests": requests,
+        "next_cursor": encode_cursor(requests[-1]) if len(requests) == limit else None
+    }
+
+@api_router.post("/meeting-requests/{request_id}/{decision}")
+async def decide_meeting_request(request_id: str, decision: Literal["accept", "decline"], payload: dict = Depends(verify_token)):
+    """Accept or decline a pending request addressed to the caller; only the
+    first decision applies
+    """
+    user_id = payload["sub"]
+    expert_id = await own_expert_id(user_id)
+    decided = await db.meeting_requests.find_one_and_update(
+        {"id": request_id, "expert_id": expert_id, "status": "pending"},
+        {"$set": {"status": MEETING_DECISIONS[decision], "decided_at": datetime.now(timezone.utc).isoformat()}},
+        {"_id": 0},
+        return_document=True
+    )
+    if decided is None:
+        existing = await db.meeting_requests.find_one({"id": request_id, "expert_id": expert_id}, {"_id": 0, "status": 1})
+        if not existing:
+            raise HTTPException(status_code=404, detail="Meeting request not found")
+        raise HTTPException(status_code=409, detail=f"Meeting request already {existing['status']}")
+    await db.notification_counters.update_one({"user_id": user_id}, {"$inc": {"pending_meeting_requests": -1}})
+    return decided
+
+@api_router.get("/meeting-requests")
+async def get_meeting_requests(status: Optional[MeetingStatus] = None, limit: int = 20, cursor: Optional[str] = None,
+                               payload: dict = Depends(verify_token)):
+    """A patient's requests with their status, newest first"""
+    limit = max(1, min(limit, 100))
+    filter_query = {"patient_id": payload["sub"]}
+    if status:
+        filter_query["status"] = status
+    if cursor:
+        filter_query.update(keyset_before(cursor))
+    requests = await db.meeting_requests.find(filter_query, {"_id": 0}).sort(NEWEST_FIRST).limit(limit).to_list(limit)
+    
+    expert_ids = list({r["expert_id"] for r in requests})
+    experts = await db.health_experts.find(
+        {"id": {"$in": expert_ids}}, {"_id": 0, "id": 1, "name": 1, "specialty": 1}
+    ).to_list(len(expert_ids))
+    by_id = {e["id"]: e for e in experts}
+    for r in requests:
+        r["expert"] = by_id.get(r["expert_id"])
+    return {
+        "requests": requests,
+        "next_cursor": encode_cursor(requests[-1]) if len(requests) == limit else None
+    }
+
 @api_router.post("/ai/summarize")
 async def summarize_content(content: dict, payload: dict = Depends(verify_token)):
     try:
@@ -601,7 +1304,7 @@ async def summarize_content(content: dict, payload: dict = Depends(verify_token)
 @api_router.post("/search/smart")
 async def smart_search_endpoint(search_data: dict, payload: dict = Depends(verify_token)):
     """Smart search with AI-powered intent recognition"""
-    from api_integrations import smart_search, search_pubmed, search_clinical_trials as api_search_trials, calculate_relevance_score
+    from api_integrations import smart_search, search_pubmed, search_clinical_trials as api_search_trials, score_results
     
     query = search_data.get("query", "")
     user_type = payload.get("user_type", "patient")
@@ -618,11 +1321,7 @@ async def smart_search_endpoint(search_data: dict, payload: dict = Depends(verif
     }
     
     # Search experts from database
-    experts = await db.health_experts.find({}, {"_id": 0}).limit(10).to_list(10)
-    for expert in experts:
-        score = await calculate_relevance_score(query, expert, "expert")
-        expert["relevance_score"] = round(score * 100)
-        results["experts"].append(expert)
+    results["experts"] = await db.health_experts.find({}, {"_id": 0}).limit(10).to_list(10)
     
     # Search clinical trials via API if condition identified
     if search_analysis.get("condition"):
@@ -632,19 +1331,18 @@ async def smart_search_endpoint(search_data: dict, payload: dict = Depends(verif
             max_results=10
         )
         for trial in api_trials:
-            score = await calculate_relevance_score(query, trial, "trial")
-            trial["relevance_score"] = round(score * 100)
             trial["id"] = trial.get("nct_id", str(uuid.uuid4()))
         results["trials"] = api_trials
     
     # Search publications via PubMed
     api_pubs = await search_pubmed(search_analysis["optimized_query"], max_results=10)
     for pub in api_pubs:
-        score = await calculate_relevance_score(query, pub, "publication")
-        pub["relevance_score"] = round(score * 100)
         pub["id"] = pub.get("pubmed_id", str(uuid.uuid4()))
     results["publications"] = api_pubs
     
+    # Score every result against the query in one pass
+    await score_results(query, expert=results["experts"], trial=results["trials"], publication=results["publications"])
+    
     # Sort all by relevance
     results["experts"].sort(key=lambda x: x.get("relevance_score", 0), reverse=True)
     results["trials"].sort(key=lambda x: x.get("relevance_score", 0), reverse=True)
@@ -652,6 +1350,30 @@ async def smart_search_endpoint(search_data: dict, payload: dict = Depends(verif
     
     return results
 
+@api_router.get("/search/semantic", response_model=SemanticSearchResults, response_model_exclude_none=True)
+async def semantic_search(query: str, types: str = "trials,publications,experts", limit: int = 10):
+    """Stored trials, publications and experts nearest the query by embedding,
+    scored by cosine similarity (0-100); no LLM calls
+    """
+    kinds = [t for t in dict.fromkeys(types.split(",")) if t in SEMANTIC_TYPES]
+    if not kinds:
+        raise HTTPException(status_code=422, detail=f"types must name some of: {', '.join(SEMANTIC_TYPES)}")
+    limit = min(max(limit, 1), MAX_SEMANTIC_RESULTS)
+    hits = semantic_index.search(query, [SEMANTIC_TYPES[k][0] for k in kinds], limit)
+
+    found = await fetch_concurrently(**{
+        kind: find_many(db[collection], {"id": {"$in": [doc_id for doc_id, _ in hits[collection]]}}, projection, limit)
+        for kind, (collection, projection) in ((k, SEMANTIC_TYPES[k]) for k in kinds)
+    })
+    results = {}
+    for kind in kinds:
+        by_id = {doc["id"]: doc for doc in found[kind]}
+        results[kind] = [
+            {**by_id[doc_id], "relevance_score": round(score * 100)}
+            for doc_id, score in hits[SEMANTIC_TYPES[kind][0]] if doc_id in by_id
+        ]
+    return results
+
 @api_router.post("/favorites/summary")
 async def generate_favorites_summary_endpoint(favorites_data: dict, payload: dict = Depends(verify_token)):
     """Generate AI summary of selected favorites"""
@@ -680,14 +1402,60 @@ async def update_researcher_profile(profile: ResearcherProfileCreate, payload: d
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Profile not found")
     
+    await catalog_cache.invalidate("experts")
     return {"message": "Profile updated successfully"}
 
+@api_router.get("/metrics/upstreams")
+async def get_upstream_metrics():
+    """Circuit breaker, rate limiter and cache state per external API"""
+    from api_integrations import upstream_metrics
+    return upstream_metrics()
+
+@api_router.get("/metrics/storage")
+async def get_storage_metrics():
+    """Connection pool checkout waits and per-collection operation latency"""
+    return storage.metrics()
+
+@api_router.get("/metrics/catalog-cache")
+async def get_catalog_cache_metrics():
+    """Entries, hit rate and invalidations per catalog namespace, and the
+    change feed that invalidates them
+    """
+    return {**catalog_cache.metrics(), "change_feed": change_feed.metrics()}
+
+@api_router.get("/health/live")
+async def liveness():
+    return {"status": "ok"}
+
+@api_router.get("/health/ready")
+async def readiness():
+    """Ready once the database answers a ping within HEALTH_CHECK_TIMEOUT"""
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(db.command("ping"), HEALTH_CHECK_TIMEOUT)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {e!r}")
+    return {"status": "ok", "storage": storage.backend, "ping_ms": round((time.perf_counter() - started) * 1000, 1)}
+
 @api_router.get("/")
 async def root():
     return {"message": "CuraLink API"}
 
 app.include_router(api_router)
 
+# Routes that clients poll: unchanged payloads are answered with 304
+app.add_middleware(
+    ETagMiddleware,
+    paths=[
+        r"^/api/forums$",
+        r"^/api/forums/[^/]+/posts$",
+        r"^/api/forums/[^/]+/threads$",
+        r"^/api/favorites$",
+        r"^/api/chat/messages/[^/]+$",
+    ],
+)
+app.add_middleware(CompressionMiddleware, minimum_size=int(os.environ.get('COMPRESSION_MIN_SIZE', '1024')))
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -702,6 +1470,104 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def ensure_indexes():
+    await asyncio.gather(
+        db.forums.create_index("id"),
+        db.forum_posts.create_index("id"),
+        db.forum_posts.create_index([("forum_id", 1), ("parent_id", 1), ("created_at", -1), ("id", -1)]),
+        db.forum_posts.create_index([("thread_id", 1), ("created_at", 1)]),
+        db.forum_posts.create_index("parent_id"),
+        db.forum_posts.create_index([("user_id", 1), ("idempotency_key", 1)], unique=True, partialFilterExpression=IDEMPOTENT),
+        db.messages.create_index([("from_user", 1), ("idempotency_key", 1)], unique=True, partialFilterExpression=IDEMPOTENT),
+        db.clinical_trials.create_index([("geo", "2dsphere")]),
+        db.health_experts.create_index([("geo", "2dsphere")]),
+        # One document per key, so the upserts above stay correct under concurrency
+        *(ensure_unique_index(db[name], fields, partial) for name, fields, partial in UNIQUE_KEYS),
+        # Expert inboxes by status and patients' own requests, both paged newest first
+        db.meeting_requests.create_index([("expert_id", 1), ("status", 1), ("created_at", -1), ("id", -1)]),
+        db.meeting_requests.create_index([("patient_id", 1), ("created_at", -1), ("id", -1)]),
+        db.notification_counters.create_index("user_id", unique=True),
+        db.notifications.create_index([("user_id", 1), ("created_at", -1), ("id", -1)]),
+        # Without change streams the change feed polls by created_at
+        *(db[name].create_index("created_at") for name in WATCHED_COLLECTIONS if CHANGE_FEED)
+    )
+
+def import_integrations():
+    import llm
+    import api_integrations
+    llm.load()
+    # Builds the concept lexicon and encoder caches
+    api_integrations.BATCH_SCORER.score("warm up", {"trial": [{"title": "warm up", "conditions": ["warm up"]}]})
+
+@app.on_event("startup")
+async def warm_up():
+    """Import what handlers import lazily, open the database pool and load
+    password hashing in parallel, so the first request pays for none of it
+    """
+    if not STARTUP_WARMUP:
+        return
+    timings = {}
+
+    async def timed(name, work):
+        started = time.perf_counter()
+        await work
+        timings[name] = round((time.perf_counter() - started) * 1000, 1)
+
+    started = time.perf_counter()
+    await asyncio.gather(
+        timed("integrations", asyncio.to_thread(import_integrations)),
+        timed("database_ping", db.command("ping")),
+        timed("password_hashing", asyncio.to_thread(pwd_context.handler().get_backend))
+    )
+    logger.info("Warm-up took %.1f ms: %s", (time.perf_counter() - started) * 1000, timings)
+
+@app.on_event("startup")
+async def load_semantic_index():
+    """Memory-map saved embedding indexes, then embed documents they lack and
+    drop deleted ones; only ids are read for documents already indexed
+    """
+    loaded = semantic_index.load()
+    changed = await semantic_index.sync(db)
+    logger.info("Semantic index: loaded %s, synced %s", loaded, changed)
+
+async def reindex_documents(message: dict):
+    """Embed documents written by any worker into this worker's semantic index"""
+    collection = message["collection"]
+    docs = await db[collection].find({"id": {"$in": message["ids"]}}, {"_id": 0}).to_list(len(message["ids"]))
+    semantic_index.add(collection, docs)
+
+# Catalog cache namespace of each watched collection
+CHANGE_NAMESPACES = {"clinical_trials": "trials", "health_experts": "experts", "forums": "forums", "forum_posts": "forums"}
+
+async def on_data_change(event: dict):
+    """Drop cached reads of a changed collection and re-embed changed documents"""
+    namespace = CHANGE_NAMESPACES.get(event["collection"])
+    if namespace:
+        catalog_cache.drop([namespace])
+    if event["collection"] in semantic_index.indexes:
+        if event["operation"] == "delete" and event["ids"]:
+            semantic_index.remove(event["collection"], event["ids"])
+        elif event["operation"] in ("resync", "delete"):
+            # Deletes usually arrive without ids: compare the index with the stored ids
+            await semantic_index.sync(db, [event["collection"]])
+        elif event["ids"]:
+            await reindex_documents(event)
+
+@app.on_event("startup")
+async def start_shared_state():
+    shared_state.subscribe("semantic_index", reindex_documents)
+    shared_state.subscribe(CHANGES_CHANNEL, on_data_change)
+    catalog_cache.subscribe(shared_state)
+    await shared_state.start()
+    if CHANGE_FEED:
+        await change_feed.start()
+    logger.info("Shared state: %s", shared_state.metrics()["backend"])
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
+    if semantic_index.directory:
+        semantic_index.save()
+    await change_feed.close()
+    await shared_state.close()
+    await storage.close()
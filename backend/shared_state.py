@@ -0,0 +1,339 @@
+"""State shared by the worker processes of one deployment
+
+Upstream caches, rate limits and single-flight, and pub/sub messages between
+workers, go through a shared state backend. MemoryState keeps everything in
+the process, which is all a single worker needs. DatabaseState keeps it in
+a storage database (MongoDB, PostgreSQL or a SQLite file; see storage.py),
+so every worker sees the same state with no extra service to run:
+
+- cache entries are documents with an expiry time
+- token buckets are documents updated by compare-and-set on a version
+- single-flight and leader leases are documents under a unique key
+- published messages go into an event log that every worker polls
+
+SHARED_STATE_URL picks the backend: memory://, `storage` for the app's own
+database, or any storage URL. With more than one worker (WEB_CONCURRENCY)
+it defaults to `storage`.
+"""
+import asyncio
+import copy
+import logging
+import os
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+SHARED_STATE_POLL_INTERVAL = float(os.environ.get('SHARED_STATE_POLL_INTERVAL', '0.5'))
+# Published messages are kept this long, then purged
+SHARED_EVENT_RETENTION = float(os.environ.get('SHARED_EVENT_RETENTION', '3600'))
+# A gap in the event sequence older than this is a publisher that died between
+# taking a number and writing its event; pollers stop waiting for it
+SHARED_EVENT_GAP_TIMEOUT = 5.0
+SHARED_EVENT_BATCH = 500
+CAS_ATTEMPTS = 20
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+def reserve_token(tokens: float, refilled_at: float, now: float, rate: float, burst: int,
+                  max_wait: float) -> Tuple[float, Optional[float]]:
+    """Token bucket reservation: (tokens left, seconds to wait), with a wait of
+    None when it would exceed max_wait (and nothing is taken)
+    """
+    tokens = min(burst, tokens + (now - refilled_at) * rate)
+    wait = max(0.0, (1 - tokens) / rate)
+    if wait > max_wait:
+        return tokens, None
+    return tokens - 1, wait
+
+
+class MemoryState:
+    """Process-local state; coherent only while there is a single worker"""
+
+    shared = False
+
+    def __init__(self):
+        self._values: Dict[str, Tuple[float, Any]] = {}
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._leases: Dict[str, float] = {}
+        self._handlers: Dict[str, List[Handler]] = {}
+        self.published = 0
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    # Cache
+    async def get(self, key: str) -> Any:
+        entry = self._values.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            del self._values[key]
+            return None
+        return copy.deepcopy(entry[1])
+
+    async def set(self, key: str, value: Any, ttl: float):
+        self._values[key] = (time.time() + ttl, copy.deepcopy(value))
+
+    async def delete(self, key: str):
+        self._values.pop(key, None)
+
+    # Rate limiting
+    async def reserve(self, name: str, rate: float, burst: int, max_wait: float) -> Optional[float]:
+        now = time.time()
+        tokens, refilled_at = self._buckets.get(name, (float(burst), now))
+        tokens, wait = reserve_token(tokens, refilled_at, now, rate, burst, max_wait)
+        if wait is not None:
+            self._buckets[name] = (tokens, now)
+        return wait
+
+    async def penalize(self, name: str, rate: float, burst: int, retry_after: float):
+        now = time.time()
+        tokens, refilled_at = self._buckets.get(name, (float(burst), now))
+        tokens = min(burst, tokens + (now - refilled_at) * rate)
+        self._buckets[name] = (min(tokens, 1 - retry_after * rate), now)
+
+    # Single-flight
+    async def acquire_lease(self, key: str, ttl: float) -> bool:
+        now = time.time()
+        if self._leases.get(key, 0) > now:
+            return False
+        self._leases[key] = now + ttl
+        return True
+
+    async def renew_lease(self, key: str, ttl: float) -> bool:
+        """Extend a lease this process holds; False if it no longer does"""
+        if key not in self._leases:
+            return False
+        self._leases[key] = time.time() + ttl
+        return True
+
+    async def release_lease(self, key: str):
+        self._leases.pop(key, None)
+
+    # Pub/sub
+    def subscribe(self, channel: str, handler: Handler):
+        self._handlers.setdefault(channel, []).append(handler)
+
+    async def publish(self, channel: str, message: Dict[str, Any]):
+        """Deliver to every subscriber, in this worker and the others"""
+        self.published += 1
+        await self._dispatch(channel, message)
+
+    async def _dispatch(self, channel: str, message: Dict[str, Any]):
+        for handler in self._handlers.get(channel, []):
+            try:
+                await handler(copy.deepcopy(message))
+            except Exception:
+                logger.exception("Handler for %s failed", channel)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {"backend": "memory", "shared": self.shared, "values": len(self._values),
+                "buckets": len(self._buckets), "leases": len(self._leases), "published": self.published}
+
+
+class DatabaseState(MemoryState):
+    """State in shared_* collections of a storage database"""
+
+    shared = True
+
+    def __init__(self, db, close: Optional[Callable[[], Awaitable[None]]] = None,
+                 poll_interval: float = SHARED_STATE_POLL_INTERVAL):
+        super().__init__()
+        self.db = db
+        self.origin = uuid.uuid4().hex
+        self.poll_interval = poll_interval
+        self.received = 0
+        self._close = close
+        self._last_seq = 0
+        self._poller: Optional[asyncio.Task] = None
+        self._purged_at = 0.0
+
+    async def start(self):
+        await asyncio.gather(
+            self.db.shared_values.create_index("key", unique=True),
+            self.db.shared_buckets.create_index("key", unique=True),
+            self.db.shared_leases.create_index("key", unique=True),
+            self.db.shared_counters.create_index("key", unique=True),
+            self.db.shared_events.create_index("seq", unique=True)
+        )
+        counter = await self.db.shared_counters.find_one({"key": "events"})
+        self._last_seq = counter["seq"] if counter else 0
+        self._poller = asyncio.create_task(self._poll())
+
+    async def close(self):
+        if self._poller:
+            self._poller.cancel()
+            try:
+                await self._poller
+            except asyncio.CancelledError:
+                pass
+        if self._close:
+            await self._close()
+
+    # Cache
+    async def get(self, key: str) -> Any:
+        doc = await self.db.shared_values.find_one({"key": key, "expires_at": {"$gt": time.time()}}, {"_id": 0, "value": 1})
+        return doc["value"] if doc else None
+
+    async def set(self, key: str, value: Any, ttl: float):
+        update = {"$set": {"value": value, "expires_at": time.time() + ttl}}
+        try:
+            await self.db.shared_values.update_one({"key": key}, update, upsert=True)
+        except DuplicateKeyError:
+            # Another worker inserted the key first; overwrite its entry
+            await self.db.shared_values.update_one({"key": key}, update)
+
+    async def delete(self, key: str):
+        await self.db.shared_values.delete_one({"key": key})
+
+    # Rate limiting
+    async def _update_bucket(self, name: str, burst: int, change) -> Optional[float]:
+        """Apply change(tokens, refilled_at, now) -> (tokens, result) by compare-and-set"""
+        for _ in range(CAS_ATTEMPTS):
+            now = time.time()
+            doc = await self.db.shared_buckets.find_one({"key": name}, {"_id": 0})
+            if doc is None:
+                tokens, result = change(float(burst), now, now)
+                try:
+                    await self.db.shared_buckets.insert_one({"key": name, "tokens": tokens, "refilled_at": now, "version": 0})
+                    return result
+                except DuplicateKeyError:
+                    continue
+            tokens, result = change(doc["tokens"], doc["refilled_at"], now)
+            if tokens is None:
+                return result
+            updated = await self.db.shared_buckets.update_one(
+                {"key": name, "version": doc["version"]},
+                {"$set": {"tokens": tokens, "refilled_at": now}, "$inc": {"version": 1}}
+            )
+            if updated.modified_count:
+                return result
+        return None
+
+    async def reserve(self, name: str, rate: float, burst: int, max_wait: float) -> Optional[float]:
+        def take(tokens, refilled_at, now):
+            tokens, wait = reserve_token(tokens, refilled_at, now, rate, burst, max_wait)
+            return (None if wait is None else tokens), wait
+        return await self._update_bucket(name, burst, take)
+
+    async def penalize(self, name: str, rate: float, burst: int, retry_after: float):
+        def hold_back(tokens, refilled_at, now):
+            return min(min(burst, tokens + (now - refilled_at) * rate), 1 - retry_after * rate), None
+        await self._update_bucket(name, burst, hold_back)
+
+    # Single-flight
+    async def acquire_lease(self, key: str, ttl: float) -> bool:
+        now = time.time()
+        await self.db.shared_leases.delete_one({"key": key, "expires_at": {"$lte": now}})
+        try:
+            await self.db.shared_leases.insert_one({"key": key, "owner": self.origin, "expires_at": now + ttl})
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def renew_lease(self, key: str, ttl: float) -> bool:
+        result = await self.db.shared_leases.update_one(
+            {"key": key, "owner": self.origin}, {"$set": {"expires_at": time.time() + ttl}}
+        )
+        return result.matched_count > 0
+
+    async def release_lease(self, key: str):
+        await self.db.shared_leases.delete_one({"key": key, "owner": self.origin})
+
+    # Pub/sub
+    async def _next_seq(self) -> int:
+        for _ in range(CAS_ATTEMPTS):
+            try:
+                counter = await self.db.shared_counters.find_one_and_update(
+                    {"key": "events"}, {"$inc": {"seq": 1}}, upsert=True, return_document=True
+                )
+                return counter["seq"]
+            except DuplicateKeyError:
+                continue
+        raise RuntimeError("could not allocate an event sequence number")
+
+    async def publish(self, channel: str, message: Dict[str, Any]):
+        """Log the message for the other workers and deliver it here at once"""
+        seq = await self._next_seq()
+        await self.db.shared_events.insert_one({
+            "seq": seq, "channel": channel, "message": message, "origin": self.origin, "created_at": time.time()
+        })
+        self.published += 1
+        await self._dispatch(channel, message)
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.receive()
+                if time.time() - self._purged_at > SHARED_EVENT_RETENTION / 10:
+                    await self.purge()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Polling shared events failed")
+
+    async def receive(self) -> int:
+        """Dispatch events other workers published since the last call, in order"""
+        events = await self.db.shared_events.find(
+            {"seq": {"$gt": self._last_seq}}, {"_id": 0}
+        ).sort("seq", 1).limit(SHARED_EVENT_BATCH).to_list(SHARED_EVENT_BATCH)
+        delivered = 0
+        for event in events:
+            if event["seq"] != self._last_seq + 1 and time.time() - event["created_at"] < SHARED_EVENT_GAP_TIMEOUT:
+                break  # an earlier event is still being written
+            self._last_seq = event["seq"]
+            if event["origin"] != self.origin:
+                self.received += 1
+                delivered += 1
+                await self._dispatch(event["channel"], event["message"])
+        return delivered
+
+    async def purge(self):
+        now = time.time()
+        self._purged_at = now
+        await asyncio.gather(
+            self.db.shared_events.delete_many({"created_at": {"$lt": now - SHARED_EVENT_RETENTION}}),
+            self.db.shared_values.delete_many({"expires_at": {"$lte": now}}),
+            self.db.shared_leases.delete_many({"expires_at": {"$lte": now}})
+        )
+
+    def metrics(self) -> Dict[str, Any]:
+        return {"backend": "database", "shared": self.shared, "origin": self.origin,
+                "published": self.published, "received": self.received, "last_seq": self._last_seq}
+
+
+def open_shared_state(url: Optional[str], storage, db_name: str) -> MemoryState:
+    """Shared state for SHARED_STATE_URL: memory://, `storage` (the app's own
+    database, reusing its connections) or a storage URL of its own
+    """
+    if not url or url.startswith("memory://"):
+        return MemoryState()
+    if url == "storage":
+        if storage.backend == "memory":
+            logger.warning("Shared state on an in-memory database is not shared between processes")
+        return DatabaseState(storage.db)
+    from storage import open_storage
+    own = open_storage(url, db_name)
+    return DatabaseState(own.db, own.close)
+
+
+_state: MemoryState = MemoryState()
+
+
+def get_state() -> MemoryState:
+    return _state
+
+
+def set_state(state: MemoryState) -> MemoryState:
+    global _state
+    _state = state
+    return state
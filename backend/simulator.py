@@ -0,0 +1,366 @@
+"""Offline simulator for the LLM and the PubMed / ClinicalTrials.gov APIs
+
+SimulatedLlmChat is a drop-in for emergentintegrations' LlmChat, and
+UpstreamSimulator is a local HTTP server answering the E-utilities and
+ClinicalTrials.gov v2 endpoints api_integrations.py calls. Responses are
+deterministic fixtures derived from the request, while each backend has a
+FaultProfile: a latency distribution, an error rate and a token-bucket rate
+limit that answers 429 with Retry-After. Everything is seeded, so runs are
+reproducible.
+
+Use it in-process with simulated_backends(), or run the upstream server
+standalone for a dev server:
+
+    python simulator.py --port 8099 --latency lognormal:150:0.5 --error-rate 0.02
+    PUBMED_BASE_URL=http://127.0.0.1:8099/pubmed \\
+    CLINICAL_TRIALS_BASE_URL=http://127.0.0.1:8099/ctgov/studies \\
+    LLM_SIMULATOR=1 uvicorn server:app
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import time
+import zlib
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Iterable, Optional
+from xml.sax.saxutils import escape
+
+from aiohttp import web
+
+
+class LatencyModel:
+    """Latency distribution in milliseconds, parsed from specs such as
+    "150", "fixed:150", "uniform:50:250", "lognormal:150:0.5" (median, sigma)
+    or "exponential:150" (mean)
+    """
+
+    KINDS = ("fixed", "uniform", "lognormal", "exponential")
+
+    def __init__(self, kind: str = "fixed", a: float = 0.0, b: float = 0.0):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown latency distribution {kind!r}")
+        self.kind = kind
+        self.a = a
+        self.b = b
+
+    @classmethod
+    def parse(cls, spec) -> "LatencyModel":
+        if isinstance(spec, LatencyModel):
+            return spec
+        if isinstance(spec, (int, float)):
+            return cls("fixed", float(spec))
+        kind, *params = str(spec).split(":")
+        if not params:
+            return cls("fixed", float(kind))
+        return cls(kind, *(float(p) for p in params))
+
+    def sample(self, rng: random.Random) -> float:
+        """One latency draw in seconds"""
+        if self.kind == "fixed":
+            ms = self.a
+        elif self.kind == "uniform":
+            ms = rng.uniform(self.a, self.b)
+        elif self.kind == "lognormal":
+            ms = self.a * math.exp(rng.gauss(0, self.b))
+        else:
+            ms = rng.expovariate(1 / self.a) if self.a else 0.0
+        return max(ms, 0.0) / 1000
+
+    def __repr__(self):
+        return f"LatencyModel({self.kind}:{self.a:g}:{self.b:g})"
+
+
+class FaultProfile:
+    """How one simulated backend misbehaves"""
+
+    def __init__(self, latency="0", error_rate: float = 0.0, rate_limit: float = 0.0, burst: Optional[int] = None, seed: int = 0):
+        self.latency = LatencyModel.parse(latency)
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.burst = burst if burst is not None else max(int(rate_limit), 1)
+        self.rng = random.Random(seed)
+        self._tokens = float(self.burst)
+        self._refilled_at = time.monotonic()
+
+    def _take_token(self) -> bool:
+        if not self.rate_limit:
+            return True
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate_limit)
+        self._refilled_at = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    async def apply(self) -> Optional[int]:
+        """Wait out the sampled latency; return an HTTP status to fail with, or None"""
+        if not self._take_token():
+            return 429
+        await asyncio.sleep(self.latency.sample(self.rng))
+        if self.error_rate and self.rng.random() < self.error_rate:
+            return self.rng.choice((500, 502, 503))
+        return None
+
+
+def stable_fraction(text: str) -> float:
+    """Deterministic value in [0, 1) derived from text"""
+    return (zlib.crc32(text.encode()) % 1000) / 1000
+
+
+def llm_completion(prompt: str) -> str:
+    """Fixture completion for each prompt shape the app sends"""
+    if prompt.startswith("Rate the relevance"):
+        return f"{0.3 + 0.7 * stable_fraction(prompt):.2f}"
+    if prompt.startswith("Extract medical conditions"):
+        text = prompt.split("from:", 1)[-1].split(". Return", 1)[0].strip()
+        return json.dumps([part.strip() for part in re.split(r",| and ", text) if part.strip()][:3])
+    if prompt.startswith("Analyze this search query"):
+        match = re.search(r'"(.*)"', prompt)
+        query = match.group(1) if match else ""
+        return json.dumps({"condition": query, "treatment": "", "search_type": "general", "optimized_query": query})
+    return "This is a deterministic summary produced by the simulated LLM backend."
+
+
+class SimulatedLlmError(Exception):
+    def __init__(self, status: int):
+        super().__init__(f"Simulated LLM failure (HTTP {status})")
+        self.status = status
+
+
+class SimulatedLlmChat:
+    """Drop-in for emergentintegrations.llm.chat.LlmChat"""
+
+    profile = FaultProfile()
+    calls = 0
+
+    def __init__(self, api_key=None, session_id=None, system_message=None):
+        self.session_id = session_id
+        self.system_message = system_message
+
+    @classmethod
+    def configure(cls, profile: FaultProfile):
+        cls.profile = profile
+        cls.calls = 0
+
+    def with_model(self, provider: str, model: str):
+        return self
+
+    async def send_message(self, message) -> str:
+        type(self).calls += 1
+        status = await self.profile.apply()
+        if status:
+            raise SimulatedLlmError(status)
+        return llm_completion(message.text)
+
+
+def pubmed_ids(term: str, count: int):
+    base = 30_000_000 + zlib.crc32(term.encode()) % 5_000_000
+    return [str(base + i) for i in range(count)]
+
+
+def pubmed_summary(pmid: str) -> dict:
+    return {
+        "uid": pmid,
+        "title": f"Study {pmid} on outcomes in treated cohorts",
+        "authors": [{"name": f"Author {pmid[-2:]}{n}"} for n in range(4)],
+        "pubdate": "2024 Mar 15"
+    }
+
+
+def pubmed_article_xml(pmid: str) -> str:
+    summary = pubmed_summary(pmid)
+    year, month, day = summary["pubdate"].split()
+    authors = "".join(
+        f"<Author><LastName>Author</LastName><Initials>{escape(a['name'].split()[-1])}</Initials></Author>"
+        for a in summary["authors"]
+    )
+    mesh = "".join(f"<MeshHeading><DescriptorName>{term}</DescriptorName></MeshHeading>" for term in ("Humans", "Neoplasms", "Immunotherapy"))
+    return (
+        f"<PubmedArticle><MedlineCitation><PMID>{pmid}</PMID><Article>"
+        f"<Journal><JournalIssue><PubDate><Year>{year}</Year><Month>{month}</Month><Day>{day}</Day></PubDate></JournalIssue></Journal>"
+        f"<ArticleTitle>{escape(summary['title'])}</ArticleTitle>"
+        f"<Abstract><AbstractText Label=\"BACKGROUND\">Cohort {pmid} was followed for treatment outcomes.</AbstractText>"
+        f"<AbstractText Label=\"RESULTS\">Response rates improved by {zlib.crc32(pmid.encode()) % 40 + 5}% versus control.</AbstractText></Abstract>"
+        f"<AuthorList>{authors}</AuthorList></Article>"
+        f"<MeshHeadingList>{mesh}</MeshHeadingList></MedlineCitation></PubmedArticle>"
+    )
+
+
+STUDY_SITES = [
+    {"city": "Boston", "state": "Massachusetts", "country": "United States", "geoPoint": {"lat": 42.36008, "lon": -71.05888}},
+    {"city": "Houston", "state": "Texas", "country": "United States", "geoPoint": {"lat": 29.76328, "lon": -95.36327}},
+    {"city": "Toronto", "state": "Ontario", "country": "Canada", "geoPoint": {"lat": 43.70643, "lon": -79.39864}},
+    {"city": "London", "country": "United Kingdom", "geoPoint": {"lat": 51.50853, "lon": -0.12574}},
+    {"city": "Heidelberg", "state": "Baden-Württemberg", "country": "Germany", "geoPoint": {"lat": 49.40768, "lon": 8.69079}}
+]
+
+
+def clinical_study(nct_id: str, condition: str) -> dict:
+    return {
+        "protocolSection": {
+            "identificationModule": {"nctId": nct_id, "briefTitle": f"{condition.title()} study {nct_id}"},
+            "statusModule": {"overallStatus": "RECRUITING"},
+            "designModule": {"phases": ["PHASE2"]},
+            "descriptionModule": {"briefSummary": f"A study evaluating a new treatment for {condition}. " * 5},
+            "conditionsModule": {"conditions": [condition]},
+            "contactsLocationsModule": {
+                "centralContacts": [{"name": "Trial Coordinator", "role": "CONTACT", "email": "trials@example.org"}],
+                "locations": [
+                    dict(site, facility=f"{site['city']} Medical Center", status="RECRUITING")
+                    for site in STUDY_SITES[:1 + zlib.crc32(nct_id.encode()) % len(STUDY_SITES)]
+                ]
+            },
+            "eligibilityModule": {"eligibilityCriteria": "Inclusion Criteria:\n* Adults 18 and older\n" * 30}
+        }
+    }
+
+
+class UpstreamSimulator:
+    """Local server for the PubMed esearch/esummary/efetch endpoints and /ctgov/studies"""
+
+    def __init__(self, pubmed: Optional[FaultProfile] = None, trials: Optional[FaultProfile] = None, host: str = "127.0.0.1", port: int = 0):
+        self.pubmed = pubmed or FaultProfile()
+        self.trials = trials or FaultProfile()
+        self.host = host
+        self.port = port
+        self.stats = Counter()
+        self._runner = None
+
+    @property
+    def pubmed_url(self) -> str:
+        return f"http://{self.host}:{self.port}/pubmed"
+
+    @property
+    def clinical_trials_url(self) -> str:
+        return f"http://{self.host}:{self.port}/ctgov/studies"
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/pubmed/esearch.fcgi", self.esearch)
+        app.router.add_get("/pubmed/esummary.fcgi", self.esummary)
+        app.router.add_route("*", "/pubmed/efetch.fcgi", self.efetch)
+        app.router.add_get("/ctgov/studies", self.studies)
+        return app
+
+    async def start(self) -> "UpstreamSimulator":
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self.port = self._runner.addresses[0][1]
+        return self
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _fault(self, endpoint: str, profile: FaultProfile) -> Optional[web.Response]:
+        self.stats[endpoint] += 1
+        status = await profile.apply()
+        if status is None:
+            return None
+        self.stats[f"{endpoint}:{status}"] += 1
+        headers = {"Retry-After": "1"} if status == 429 else {}
+        return web.json_response({"error": f"simulated {status}"}, status=status, headers=headers)
+
+    async def esearch(self, request: web.Request) -> web.Response:
+        failure = await self._fault("esearch", self.pubmed)
+        if failure:
+            return failure
+        ids = pubmed_ids(request.query.get("term", ""), int(request.query.get("retmax", 10)))
+        return web.json_response({"esearchresult": {"count": str(len(ids)), "idlist": ids}})
+
+    async def esummary(self, request: web.Request) -> web.Response:
+        failure = await self._fault("esummary", self.pubmed)
+        if failure:
+            return failure
+        ids = [i for i in request.query.get("id", "").split(",") if i]
+        result = {"uids": ids, **{pmid: pubmed_summary(pmid) for pmid in ids}}
+        return web.json_response({"result": result})
+
+    async def efetch(self, request: web.Request) -> web.Response:
+        failure = await self._fault("efetch", self.pubmed)
+        if failure:
+            return failure
+        params = await request.post() if request.method == "POST" else request.query
+        ids = [i for i in params.get("id", "").split(",") if i]
+        body = "<?xml version=\"1.0\" ?><PubmedArticleSet>" + "".join(pubmed_article_xml(i) for i in ids) + "</PubmedArticleSet>"
+        return web.Response(text=body, content_type="text/xml")
+
+    async def studies(self, request: web.Request) -> web.Response:
+        failure = await self._fault("studies", self.trials)
+        if failure:
+            return failure
+        condition = request.query.get("query.cond", "")
+        page_size = int(request.query.get("pageSize", 10))
+        offset = int(request.query.get("pageToken") or 0)
+        # Each condition matches a stable number of studies, paged with an offset token
+        checksum = zlib.crc32(condition.encode())
+        total = 50 + checksum % 2000
+        base = checksum % 90_000_000
+        end = min(offset + page_size, total)
+        page = {"studies": [clinical_study(f"NCT{base + i:08d}", condition) for i in range(offset, end)]}
+        if end < total:
+            page["nextPageToken"] = str(end)
+        return web.json_response(page)
+
+
+@asynccontextmanager
+async def simulated_backends(pubmed: Optional[FaultProfile] = None, trials: Optional[FaultProfile] = None,
+                             llm: Optional[FaultProfile] = None, modules: Iterable = ()):
+    """Start an UpstreamSimulator and point api_integrations (plus any extra
+    modules importing LlmChat, such as server) at the simulated backends
+    """
+    import api_integrations
+
+    simulator = await UpstreamSimulator(pubmed, trials).start()
+    SimulatedLlmChat.configure(llm or FaultProfile())
+    targets = [api_integrations, *modules]
+    saved = [(m, m.LlmChat) for m in targets]
+    saved_urls = (api_integrations.PUBMED_BASE_URL, api_integrations.CLINICAL_TRIALS_BASE_URL)
+    api_integrations.PUBMED_BASE_URL = simulator.pubmed_url
+    api_integrations.CLINICAL_TRIALS_BASE_URL = simulator.clinical_trials_url
+    for module in targets:
+        module.LlmChat = SimulatedLlmChat
+    try:
+        yield simulator
+    finally:
+        api_integrations.PUBMED_BASE_URL, api_integrations.CLINICAL_TRIALS_BASE_URL = saved_urls
+        for module, original in saved:
+            module.LlmChat = original
+        await simulator.stop()
+
+
+async def serve(args):
+    profile = dict(latency=args.latency, error_rate=args.error_rate, rate_limit=args.rate_limit)
+    simulator = UpstreamSimulator(FaultProfile(seed=args.seed, **profile), FaultProfile(seed=args.seed + 1, **profile), args.host, args.port)
+    await simulator.start()
+    print(f"PUBMED_BASE_URL={simulator.pubmed_url}")
+    print(f"CLINICAL_TRIALS_BASE_URL={simulator.clinical_trials_url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await simulator.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve simulated PubMed and ClinicalTrials.gov endpoints")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", default="lognormal:150:0.5", help="latency distribution in ms")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="requests per second before 429 (0 = unlimited)")
+    parser.add_argument("--seed", type=int, default=0)
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,517 @@
+"""Document storage on SQL: PostgreSQL through asyncpg, SQLite through aiosqlite
+
+Each collection is a table of (_id, doc) rows, with doc stored as JSON (JSONB on
+PostgreSQL). The API is the same Motor-style one memory_db implements, so
+server.py runs unchanged on either.
+
+Filters on scalar fields compile to SQL, and so do sort, skip and limit when
+the whole filter compiles. Anything else is evaluated with memory_db's
+matcher over the rows the compiled part selects: array membership, $exists,
+$nearSphere and the rest. create_index builds expression indexes on the
+same JSON expressions the compiled filters use, with a WHERE clause for a
+partialFilterExpression. Multi-row writes are single statements: insert_many
+is one multi-row INSERT, and update_many is one executemany. bulk_write runs
+all of its writes in one transaction.
+"""
+import asyncio
+import copy
+import json
+import re
+from contextlib import asynccontextmanager, nullcontext
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from sqlalchemy import (JSON, BigInteger, Boolean, Column, Float, Index, Integer, MetaData, Table, Text, and_, bindparam,
+                        cast, delete, false, func, insert, inspect, literal_column, or_, select, text, true, update)
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.engine import make_url
+from sqlalchemy.schema import CreateIndex, CreateTable
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from memory_db import (_MISSING, BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult, _equality_fields,
+                       _geo_distance, _near_clause, _normalize_keys, _sort_key, apply_update, bulk_operation, get_path, matches,
+                       project)
+
+# Fields that hold arrays. Equality on them means membership, which is matched in Python.
+ARRAY_FIELDS = {"conditions", "specialty", "specialties", "research_interests", "keywords", "authors",
+                "mesh_terms", "locations", "participants"}
+DOCUMENT = JSON().with_variant(JSONB(), "postgresql")
+# SQLite only autoincrements an INTEGER PRIMARY KEY
+ROW_ID = BigInteger().with_variant(Integer(), "sqlite")
+FIELD_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+DUPLICATE_KEY = 11000
+
+
+def json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def dumps(value) -> str:
+    return json.dumps(value, default=json_default)
+
+
+class SQLCursor:
+    def __init__(self, collection: "SQLCollection", filter_query, projection):
+        self._collection = collection
+        self._filter = filter_query
+        self._projection = projection
+        self._sort: List[Tuple[str, int]] = []
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key_or_list, direction: int = 1):
+        if isinstance(key_or_list, str):
+            self._sort = [(key_or_list, direction)]
+        else:
+            self._sort = list(key_or_list)
+        return self
+
+    def skip(self, count: int):
+        self._skip = count
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    async def to_list(self, length: Optional[int] = None) -> List[Dict[str, Any]]:
+        limit = min(filter(None, (self._limit, length)), default=0)
+        async with self._collection._connect() as conn:
+            docs = await self._collection._select(conn, self._filter, self._sort, self._skip, limit)
+        return [project(d, self._projection) for d in docs]
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in await self.to_list(None):
+            yield doc
+
+
+class SQLCollection:
+    def __init__(self, database: "SQLDatabase", name: str):
+        self._database = database
+        self.name = name
+        self.table = Table(name, database.metadata,
+                           Column("_id", ROW_ID, primary_key=True, autoincrement=True),
+                           Column("doc", DOCUMENT, nullable=False))
+        self._ready = False
+        self._indexes = set()
+
+    @asynccontextmanager
+    async def _connect(self):
+        """Transaction on a pooled connection; creates the table on first use"""
+        async with self._database.connection() as conn:
+            if not self._ready:
+                # IF NOT EXISTS rather than checkfirst: other processes may create it concurrently
+                await conn.execute(CreateTable(self.table, if_not_exists=True))
+                self._ready = True
+            yield conn
+
+    # Compiling filters
+    def _field(self, path: str, value: Any = ""):
+        """SQL expression for a JSON path, typed for comparison with value"""
+        if path == "_id":
+            return self.table.c._id
+        parts = path.split(".")
+        if parts[0] in ARRAY_FIELDS or not all(FIELD_NAME.match(p) for p in parts):
+            return None
+        doc = self.table.c.doc
+        if self._database.dialect == "sqlite":
+            # json_extract returns native SQL types, so one expression serves every operand type
+            return func.json_extract(doc, literal_column(f"'$.{path}'"))
+        if len(parts) == 1:
+            expr = doc.op("->>", return_type=Text)(literal_column(f"'{path}'"))
+        else:
+            expr = doc.op("#>>", return_type=Text)(literal_column("'{%s}'" % ",".join(parts)))
+        if isinstance(value, bool):
+            return cast(expr, Boolean)
+        if isinstance(value, (int, float)):
+            return cast(expr, Float)
+        return expr
+
+    def _compile_op(self, path: str, op: str, operand):
+        scalar = isinstance(operand, (str, int, float)) and not isinstance(operand, bool)
+        if op == "$eq":
+            if operand is None:
+                return self._field(path).is_(None)
+            if scalar or isinstance(operand, bool):
+                return self._field(path, operand) == operand
+            return None
+        if op == "$ne":
+            if operand is None:
+                return self._field(path).is_not(None)
+            if scalar or isinstance(operand, bool):
+                expr = self._field(path, operand)
+                return or_(expr.is_(None), expr != operand)
+            return None
+        if op == "$in" and isinstance(operand, (list, tuple, set)):
+            operand = list(operand)
+            if any(isinstance(v, (dict, list)) for v in operand):
+                return None
+            strings = [v for v in operand if isinstance(v, str)]
+            others = [v for v in operand if not isinstance(v, str)]
+            clauses = [self._field(path).in_(strings)] if strings else []
+            clauses += [self._compile_op(path, "$eq", v) for v in others]
+            return or_(*clauses) if clauses else false()
+        if op in ("$gt", "$gte", "$lt", "$lte") and scalar:
+            expr = self._field(path, operand)
+            return {"$gt": expr > operand, "$gte": expr >= operand, "$lt": expr < operand, "$lte": expr <= operand}[op]
+        return None
+
+    def _compile_field(self, path: str, condition):
+        if self._field(path) is None:
+            return None
+        if isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+            clauses = [self._compile_op(path, op, operand) for op, operand in condition.items()]
+            return None if any(c is None for c in clauses) else and_(*clauses)
+        return self._compile_op(path, "$eq", condition)
+
+    def compile_filter(self, filter_query: Optional[Dict[str, Any]]):
+        """(SQL clause or None, residual filter or None) whose conjunction is the filter"""
+        clauses, residual = [], {}
+        for key, condition in (filter_query or {}).items():
+            if key in ("$or", "$and"):
+                compiled = [self._compile_exact(sub) for sub in condition]
+                if all(c is not None for c in compiled):
+                    clauses.append(or_(*compiled) if key == "$or" else and_(*compiled))
+                    continue
+            clause = None if key.startswith("$") else self._compile_field(key, condition)
+            if clause is None:
+                residual[key] = condition
+            else:
+                clauses.append(clause)
+        return (and_(*clauses) if clauses else None), (residual or None)
+
+    def _compile_exact(self, filter_query):
+        clause, residual = self.compile_filter(filter_query)
+        if residual is not None:
+            return None
+        return true() if clause is None else clause
+
+    def _order(self, sort: List[Tuple[str, int]]):
+        order = []
+        for path, direction in sort:
+            expr = self._field(path)
+            if expr is None:
+                return None
+            order.append(expr.asc().nulls_first() if direction >= 0 else expr.desc().nulls_last())
+        return order
+
+    # Reads
+    @staticmethod
+    def _document(row) -> Dict[str, Any]:
+        return {"_id": row._id, **row.doc}
+
+    async def _select(self, conn, filter_query, sort=(), skip: int = 0, limit: int = 0, for_update: bool = False):
+        clause, residual = self.compile_filter(filter_query)
+        order = self._order(list(sort)) if residual is None else None
+        statement = select(self.table.c._id, self.table.c.doc)
+        if clause is not None:
+            statement = statement.where(clause)
+        if for_update and self._database.dialect == "postgresql":
+            statement = statement.with_for_update()
+        if residual is None and order is not None:
+            # Fully compiled: sort, skip and limit run in the database
+            statement = statement.order_by(*order)
+            if skip:
+                statement = statement.offset(skip)
+            if limit:
+                statement = statement.limit(limit)
+            return [self._document(row) for row in await conn.execute(statement)]
+
+        docs = [self._document(row) for row in await conn.execute(statement)]
+        if residual:
+            docs = [d for d in docs if matches(d, residual)]
+        near = _near_clause(residual)
+        if near and not sort:
+            key, origin = near
+            docs.sort(key=lambda d: _geo_distance(get_path(d, key), origin))
+        for path, direction in reversed(list(sort)):
+            docs.sort(key=lambda d: _sort_key(get_path(d, path)), reverse=direction < 0)
+        docs = docs[skip:]
+        return docs[:limit] if limit else docs
+
+    def find(self, filter_query: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, Any]] = None) -> SQLCursor:
+        return SQLCursor(self, filter_query or {}, projection)
+
+    async def find_one(self, filter_query: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, Any]] = None, sort=None):
+        cursor = self.find(filter_query, projection).limit(1)
+        if sort:
+            cursor.sort(sort)
+        docs = await cursor.to_list(1)
+        return docs[0] if docs else None
+
+    async def count_documents(self, filter_query: Dict[str, Any], limit: int = 0) -> int:
+        clause, residual = self.compile_filter(filter_query)
+        async with self._connect() as conn:
+            if residual is None:
+                matched = select(self.table.c._id)
+                if clause is not None:
+                    matched = matched.where(clause)
+                if limit:
+                    matched = matched.limit(limit)
+                return (await conn.execute(select(func.count()).select_from(matched.subquery()))).scalar_one()
+            docs = await self._select(conn, filter_query)
+        return min(len(docs), limit) if limit else len(docs)
+
+    async def estimated_document_count(self) -> int:
+        return await self.count_documents({})
+
+    async def distinct(self, key: str, filter_query: Optional[Dict[str, Any]] = None) -> List[Any]:
+        values = []
+        for doc in await self.find(filter_query).to_list(None):
+            value = get_path(doc, key)
+            for v in value if isinstance(value, list) else [value]:
+                if v is not _MISSING and v not in values:
+                    values.append(v)
+        return values
+
+    # Indexes
+    async def create_index(self, keys, unique: bool = False, name: Optional[str] = None, **kwargs) -> str:
+        fields = _normalize_keys(keys)
+        name = name or "_".join(f"{k}_{d}" for k, d in fields)
+        # Geo and text indexes have no portable SQL equivalent; those queries are matched in Python
+        if not all(isinstance(d, int) for _, d in fields) or name in self._indexes:
+            return name
+        expressions = []
+        for path, direction in fields:
+            expr = self._field(path)
+            if expr is None:
+                return name
+            expressions.append(expr.desc() if direction < 0 else expr)
+        where = {}
+        if kwargs.get("partialFilterExpression"):
+            clause, residual = self.compile_filter(kwargs["partialFilterExpression"])
+            if residual is not None:
+                return name
+            where = {"sqlite_where": clause, "postgresql_where": clause}
+        index = Index(f"{self.name}__{re.sub(r'[^A-Za-z0-9_]', '_', name)}", *expressions, unique=unique, **where)
+        async with self._connect() as conn:
+            try:
+                await conn.execute(CreateIndex(index, if_not_exists=True))
+            except IntegrityError as e:
+                raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: {name}", DUPLICATE_KEY) from e
+        self._indexes.add(name)
+        return name
+
+    # Writes
+    def _duplicate(self, error: IntegrityError) -> DuplicateKeyError:
+        return DuplicateKeyError(f"E11000 duplicate key error collection: {self.name}: {error.orig}", DUPLICATE_KEY)
+
+    @staticmethod
+    def _body(document: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: v for k, v in document.items() if k != "_id"}
+
+    async def insert_one(self, document: Dict[str, Any]) -> InsertOneResult:
+        try:
+            async with self._connect() as conn:
+                row_id = (await conn.execute(insert(self.table).returning(self.table.c._id), {"doc": self._body(document)})).scalar_one()
+        except IntegrityError as e:
+            raise self._duplicate(e) from e
+        # Motor adds _id to the caller's document, so do the same
+        document["_id"] = row_id
+        return InsertOneResult(row_id)
+
+    async def insert_many(self, documents: List[Dict[str, Any]], ordered: bool = True) -> InsertManyResult:
+        documents = list(documents)
+        if not documents:
+            return InsertManyResult([])
+        statement = insert(self.table).returning(self.table.c._id, sort_by_parameter_order=True)
+        try:
+            async with self._connect() as conn:
+                row_ids = (await conn.execute(statement, [{"doc": self._body(d)} for d in documents])).scalars().all()
+        except IntegrityError:
+            return await self._insert_each(documents, ordered)
+        for document, row_id in zip(documents, row_ids):
+            document["_id"] = row_id
+        return InsertManyResult(list(row_ids))
+
+    async def _insert_each(self, documents: List[Dict[str, Any]], ordered: bool) -> InsertManyResult:
+        """Row-by-row retry after a batch hit a unique index, reporting like Mongo's bulk insert"""
+        inserted, errors = [], []
+        for index, document in enumerate(documents):
+            try:
+                inserted.append((await self.insert_one(document)).inserted_id)
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": DUPLICATE_KEY, "errmsg": str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(inserted)})
+        return InsertManyResult(inserted)
+
+    async def _update_in(self, conn, filter_query, update_doc, upsert: bool, many: bool, sort=None):
+        """(UpdateResult, document before, document after) for the first match"""
+        targets = await self._select(conn, filter_query, sort or (), limit=0 if many else 1, for_update=True)
+        if targets:
+            before = copy.deepcopy(targets[0])
+            changed = []
+            for doc in targets:
+                snapshot = copy.deepcopy(doc)
+                apply_update(doc, update_doc)
+                if doc != snapshot:
+                    changed.append({"row_id": doc["_id"], "body": self._body(doc)})
+            if changed:
+                await conn.execute(
+                    update(self.table).where(self.table.c._id == bindparam("row_id")).values(doc=bindparam("body")),
+                    changed
+                )
+            return UpdateResult(len(targets), len(changed)), before, targets[0]
+        if not upsert:
+            return UpdateResult(0, 0), None, None
+        doc = copy.deepcopy(_equality_fields(filter_query))
+        apply_update(doc, update_doc, inserting=True)
+        doc["_id"] = (await conn.execute(insert(self.table).returning(self.table.c._id), {"doc": self._body(doc)})).scalar_one()
+        return UpdateResult(0, 0, upserted_id=doc["_id"]), None, doc
+
+    async def _update(self, filter_query, update_doc, upsert: bool, many: bool, sort=None):
+        try:
+            async with self._connect() as conn:
+                return await self._update_in(conn, filter_query, update_doc, upsert, many, sort)
+        except IntegrityError as e:
+            raise self._duplicate(e) from e
+
+    async def update_one(self, filter_query, update_doc, upsert: bool = False) -> UpdateResult:
+        return (await self._update(filter_query, update_doc, upsert, many=False))[0]
+
+    async def update_many(self, filter_query, update_doc, upsert: bool = False) -> UpdateResult:
+        return (await self._update(filter_query, update_doc, upsert, many=True))[0]
+
+    async def replace_one(self, filter_query, replacement, upsert: bool = False) -> UpdateResult:
+        return (await self._update(filter_query, replacement, upsert, many=False))[0]
+
+    async def find_one_and_update(self, filter_query, update_doc, projection=None, upsert: bool = False, return_document: bool = False, sort=None):
+        _, before, after = await self._update(filter_query, update_doc, upsert, many=False, sort=sort)
+        doc = after if return_document else before
+        return project(doc, projection) if doc is not None else None
+
+    async def find_one_and_delete(self, filter_query, projection=None):
+        async with self._connect() as conn:
+            docs = await self._select(conn, filter_query, limit=1, for_update=True)
+            if not docs:
+                return None
+            await conn.execute(delete(self.table).where(self.table.c._id == docs[0]["_id"]))
+        return project(docs[0], projection)
+
+    async def delete_one(self, filter_query) -> DeleteResult:
+        return DeleteResult(int(await self.find_one_and_delete(filter_query) is not None))
+
+    async def _delete_many_in(self, conn, filter_query) -> int:
+        clause, residual = self.compile_filter(filter_query)
+        if residual is None:
+            statement = delete(self.table)
+            if clause is not None:
+                statement = statement.where(clause)
+            return (await conn.execute(statement)).rowcount
+        row_ids = [d["_id"] for d in await self._select(conn, filter_query)]
+        if row_ids:
+            await conn.execute(delete(self.table).where(self.table.c._id.in_(row_ids)))
+        return len(row_ids)
+
+    async def delete_many(self, filter_query) -> DeleteResult:
+        async with self._connect() as conn:
+            return DeleteResult(await self._delete_many_in(conn, filter_query))
+
+    async def _write_in(self, conn, kind: str, args: tuple):
+        """One bulk_write request on conn, as (kind, result) for BulkWriteResult.add"""
+        if kind == "insert":
+            document = args[0]
+            document["_id"] = (await conn.execute(insert(self.table).returning(self.table.c._id), {"doc": self._body(document)})).scalar_one()
+            return "insert", document["_id"]
+        if kind == "update":
+            return "update", (await self._update_in(conn, *args))[0]
+        filter_query, many = args
+        if many:
+            return "delete", await self._delete_many_in(conn, filter_query)
+        docs = await self._select(conn, filter_query, limit=1, for_update=True)
+        if docs:
+            await conn.execute(delete(self.table).where(self.table.c._id == docs[0]["_id"]))
+        return "delete", len(docs)
+
+    async def bulk_write(self, requests, ordered: bool = True) -> BulkWriteResult:
+        """All writes in one transaction; if one hits a unique index, the batch is
+        rolled back and retried write by write, reporting like Mongo's bulk write
+        """
+        operations = [bulk_operation(request) for request in requests]
+        result = BulkWriteResult()
+        try:
+            async with self._connect() as conn:
+                for index, (kind, args) in enumerate(operations):
+                    result.add(index, await self._write_in(conn, kind, args))
+            return result
+        except IntegrityError:
+            pass
+        result, errors = BulkWriteResult(), []
+        for index, (kind, args) in enumerate(operations):
+            try:
+                async with self._connect() as conn:
+                    outcome = await self._write_in(conn, kind, args)
+            except IntegrityError as e:
+                errors.append({"index": index, "code": DUPLICATE_KEY, "errmsg": str(self._duplicate(e))})
+                if ordered:
+                    break
+                continue
+            result.add(index, outcome)
+        if errors:
+            raise result.error(errors)
+        return result
+
+    async def drop(self):
+        async with self._database.connection() as conn:
+            await conn.run_sync(self.table.drop, checkfirst=True)
+        self._ready = False
+        self._indexes = set()
+
+
+class SQLDatabase:
+    """Motor-style database over a pooled SQLAlchemy async engine"""
+
+    def __init__(self, url: str, pool_size: Optional[int] = None, max_overflow: Optional[int] = None, **engine_options):
+        url = make_url(url)
+        self.name = url.database
+        self.dialect = url.get_backend_name()
+        options = {"json_serializer": dumps, **engine_options}
+        if self.dialect != "sqlite":
+            options["pool_pre_ping"] = True
+            if pool_size:
+                options["pool_size"] = pool_size
+            if max_overflow is not None:
+                options["max_overflow"] = max_overflow
+        self.engine = create_async_engine(url, **options)
+        self.metadata = MetaData()
+        self._collections: Dict[str, SQLCollection] = {}
+        # SQLite allows one writer at a time; queueing here avoids "database is locked"
+        self._serial = asyncio.Lock() if self.dialect == "sqlite" else None
+
+    @asynccontextmanager
+    async def connection(self):
+        async with self._serial or nullcontext():
+            async with self.engine.begin() as conn:
+                yield conn
+
+    def __getitem__(self, name: str) -> SQLCollection:
+        if name not in self._collections:
+            self._collections[name] = SQLCollection(self, name)
+        return self._collections[name]
+
+    def __getattr__(self, name: str) -> SQLCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    async def list_collection_names(self) -> List[str]:
+        async with self.connection() as conn:
+            return await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_table_names())
+
+    async def command(self, command, *args, **kwargs) -> Dict[str, Any]:
+        async with self.connection() as conn:
+            await conn.execute(text("SELECT 1"))
+        return {"ok": 1.0}
+
+    async def close(self):
+        await self.engine.dispose()
@@ -0,0 +1,317 @@
+"""Deterministic synthetic datasets at configurable scale
+
+Documents match what the API writes (ids, ISO timestamps, denormalized forum
+counters, GeoJSON locations) and are generated lazily, so a 10M message
+dataset never sits in memory. The same config and seed always produce the
+same documents, ids included.
+"""
+import hashlib
+import random
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Tuple
+
+from geo import gazetteer, point
+
+SYNTHETIC_PASSWORD = "synthetic-password"
+# Every Nth user is a researcher; the rest are patients
+RESEARCHER_EVERY = 10
+MESSAGES_PER_CONVERSATION = 50
+DATASET_END = datetime(2024, 6, 1, tzinfo=timezone.utc)
+DATASET_SPAN_DAYS = 730
+
+CONDITIONS = [
+    "Glioblastoma", "Non-Small Cell Lung Cancer", "Breast Cancer", "Prostate Cancer", "Colorectal Cancer",
+    "Pancreatic Cancer", "Melanoma", "Multiple Myeloma", "Acute Myeloid Leukemia", "Lymphoma",
+    "Type 2 Diabetes", "Type 1 Diabetes", "Heart Failure", "Atrial Fibrillation", "Hypertension",
+    "Alzheimer's Disease", "Parkinson's Disease", "Multiple Sclerosis", "Epilepsy", "Migraine",
+    "Rheumatoid Arthritis", "Lupus", "Crohn's Disease", "Ulcerative Colitis", "Psoriasis",
+    "Asthma", "COPD", "Cystic Fibrosis", "Sickle Cell Disease", "Hemophilia",
+    "Chronic Kidney Disease", "Major Depressive Disorder", "Obesity", "HIV", "Hepatitis B"
+]
+INTERVENTIONS = [
+    "pembrolizumab", "nivolumab", "CAR-T cell therapy", "mRNA vaccine", "gene therapy", "CRISPR gene editing",
+    "low-dose radiotherapy", "metformin", "semaglutide", "monoclonal antibody", "stem cell transplant",
+    "targeted kinase inhibitor", "deep brain stimulation", "cognitive behavioral therapy", "dietary intervention"
+]
+SPECIALTIES = [
+    "Oncology", "Neuro-Oncology", "Hematology", "Cardiology", "Endocrinology", "Neurology", "Immunology",
+    "Rheumatology", "Gastroenterology", "Pulmonology", "Nephrology", "Psychiatry", "Genetics", "Infectious Disease"
+]
+RESEARCH_INTERESTS = [
+    "Immunotherapy", "Precision Medicine", "Clinical Trials", "Biomarkers", "Gene Editing", "Epidemiology",
+    "Health Outcomes", "Drug Resistance", "Machine Learning", "Rare Diseases", "Vaccines", "Neuroimaging"
+]
+SURNAMES = [
+    "Smith", "Johnson", "Chen", "Garcia", "Patel", "Kim", "Nguyen", "Müller", "Rossi", "Tanaka", "Okafor",
+    "Cohen", "Silva", "Novak", "Larsen", "Dubois", "Kowalski", "Haddad", "Singh", "Williams", "Martinez", "Lee"
+]
+FORUM_CATEGORIES = ["Cancer Research", "Clinical Trials", "Gene Therapy", "Patient Support", "Neurology", "Cardiology"]
+PHASES = ["Phase 1", "Phase 2", "Phase 3", "Phase 4", "N/A"]
+# (status, weight): most catalogue trials are recruiting or completed
+TRIAL_STATUSES = [("Recruiting", 40), ("Completed", 30), ("Active, not recruiting", 15),
+                  ("Not yet recruiting", 10), ("Terminated", 5)]
+MESSAGE_TEXTS = [
+    "Thank you for getting back to me so quickly.",
+    "Could you tell me more about the eligibility criteria?",
+    "I have uploaded my latest scan results.",
+    "The next screening visit is on Tuesday morning.",
+    "Are there any side effects I should watch for?",
+    "I spoke with my oncologist about the trial and they are supportive.",
+    "We can schedule a call later this week if that suits you.",
+    "Please let me know if anything changes with your symptoms."
+]
+
+
+@dataclass(frozen=True)
+class SyntheticConfig:
+    users: int = 10_000
+    trials: int = 1_000
+    publications: int = 1_000
+    forums: int = 100
+    forum_posts: int = 10_000
+    messages: int = 100_000
+    favorites_per_patient: int = 5
+    seed: int = 42
+
+
+PRESETS = {
+    "small": SyntheticConfig(users=1_000, trials=200, publications=200, forums=20, forum_posts=1_000, messages=10_000),
+    "medium": SyntheticConfig(),
+    "production": SyntheticConfig(users=1_000_000, trials=100_000, publications=100_000, forums=5_000,
+                                  forum_posts=1_000_000, messages=10_000_000)
+}
+
+
+class SyntheticDataset:
+    """(collection, document) pairs for a config, collection by collection"""
+
+    def __init__(self, config: SyntheticConfig, password_hash: str):
+        self.config = config
+        self.password_hash = password_hash
+        self.researchers = (config.users + RESEARCHER_EVERY - 1) // RESEARCHER_EVERY
+        self.patients = config.users - self.researchers
+        self.places = gazetteer().entries
+
+    def rng(self, *scope) -> random.Random:
+        """Independent stream per scope, so each collection is reproducible on its own"""
+        return random.Random(":".join(map(str, (self.config.seed,) + scope)))
+
+    def make_id(self, kind: str, index: int) -> str:
+        """Stable UUID-shaped id; formatted by hand since uuid.UUID dominates at 10M rows"""
+        h = hashlib.blake2b(f"{self.config.seed}:{kind}:{index}".encode(), digest_size=16).hexdigest()
+        return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+    def user_index(self, kind: str, n: int) -> int:
+        """Index in users of the nth researcher or patient"""
+        if kind == "researcher":
+            return n * RESEARCHER_EVERY
+        return n + n // (RESEARCHER_EVERY - 1) + 1
+
+    def user_id(self, kind: str, n: int) -> str:
+        return self.make_id("user", self.user_index(kind, n))
+
+    def timestamp(self, rng: random.Random) -> datetime:
+        return DATASET_END - timedelta(seconds=rng.randrange(DATASET_SPAN_DAYS * 86400))
+
+    def place(self, rng: random.Random) -> Dict[str, Any]:
+        return rng.choice(self.places)
+
+    def documents(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        for generate in (self.users, self.trials, self.publications, self.forums, self.messages, self.favorites):
+            yield from generate()
+
+    def users(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        rng = self.rng("users")
+        for i in range(self.config.users):
+            user_type = "researcher" if i % RESEARCHER_EVERY == 0 else "patient"
+            user_id = self.make_id("user", i)
+            created_at = self.timestamp(rng).isoformat()
+            place = self.place(rng)
+            yield "users", {
+                "id": user_id,
+                "email": f"{user_type}{i}@synthetic.example",
+                "password_hash": self.password_hash,
+                "user_type": user_type,
+                "created_at": created_at
+            }
+            if user_type == "patient":
+                conditions = rng.sample(CONDITIONS, rng.randint(1, 2))
+                yield "patient_profiles", {
+                    "id": self.make_id("patient_profile", i),
+                    "user_id": user_id,
+                    "conditions": conditions,
+                    "location": place["label"],
+                    "raw_input": f"I was diagnosed with {' and '.join(conditions).lower()}",
+                    "created_at": created_at
+                }
+                continue
+            specialties = rng.sample(SPECIALTIES, rng.randint(1, 2))
+            interests = rng.sample(RESEARCH_INTERESTS, rng.randint(1, 3))
+            bio = f"{specialties[0]} researcher focused on {interests[0].lower()}."
+            yield "researcher_profiles", {
+                "id": self.make_id("researcher_profile", i),
+                "user_id": user_id,
+                "specialties": specialties,
+                "research_interests": interests,
+                "orcid": None,
+                "researchgate": None,
+                "availability": rng.random() < 0.6,
+                "bio": bio,
+                "location": place["label"],
+                "created_at": created_at
+            }
+            yield "health_experts", {
+                "id": self.make_id("health_expert", i),
+                "user_id": user_id,
+                "name": f"researcher{i}",
+                "specialty": specialties,
+                "research_interests": interests,
+                "is_registered": True,
+                "bio": bio,
+                "location": place["label"],
+                "geo": point(place["latitude"], place["longitude"]),
+                "created_at": created_at
+            }
+
+    def trials(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        rng = self.rng("trials")
+        statuses, weights = zip(*TRIAL_STATUSES)
+        for i in range(self.config.trials):
+            conditions = rng.sample(CONDITIONS, rng.randint(1, 3))
+            intervention = rng.choice(INTERVENTIONS)
+            phase = rng.choice(PHASES)
+            place = self.place(rng)
+            min_age = rng.choice([12, 18, 18, 21, 40])
+            yield "clinical_trials", {
+                "id": self.make_id("trial", i),
+                "nct_id": f"NCT{10_000_000 + i:08d}",
+                "title": f"{phase} Study of {intervention} in {conditions[0]}",
+                "description": (f"A {phase.lower()} study evaluating the safety and efficacy of {intervention} "
+                                f"in patients with {', '.join(conditions).lower()}. ") * rng.randint(2, 5),
+                "phase": phase,
+                "status": rng.choices(statuses, weights)[0],
+                "location": place["label"],
+                "geo": point(place["latitude"], place["longitude"]),
+                "eligibility": (f"Inclusion Criteria:\n* Age {min_age} to {rng.randint(min_age + 20, 90)}\n"
+                                f"* Confirmed diagnosis of {conditions[0].lower()}\n") * rng.randint(3, 15),
+                "contact": f"trial{i}@synthetic.example",
+                "conditions": conditions,
+                "created_by": self.user_id("researcher", rng.randrange(self.researchers)),
+                "created_at": self.timestamp(rng).isoformat()
+            }
+
+    def publications(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        rng = self.rng("publications")
+        for i in range(self.config.publications):
+            condition = rng.choice(CONDITIONS)
+            intervention = rng.choice(INTERVENTIONS)
+            pmid = 30_000_000 + i
+            published = self.timestamp(rng)
+            yield "publications", {
+                "id": self.make_id("publication", i),
+                "pubmed_id": f"PMID{pmid}",
+                "title": f"Outcomes of {intervention} in {condition.lower()}: a cohort study",
+                "authors": [f"{rng.choice(SURNAMES)} {rng.choice('ABCDEFGHJKLMNPRS')}" for _ in range(rng.randint(2, 5))],
+                "abstract": (f"Background: {condition} remains a major clinical challenge. "
+                             f"Methods: We followed {rng.randint(40, 4000)} patients treated with {intervention}. "
+                             f"Results: Response rates improved by {rng.randint(5, 40)}%. ") * rng.randint(1, 4),
+                "url": f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/",
+                "keywords": [condition.lower(), intervention.lower()],
+                "published_date": f"{published:%Y %b %d}"
+            }
+
+    def forums(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Forums and their posts; counters are derived from the posts generated"""
+        base, extra = divmod(self.config.forum_posts, max(self.config.forums, 1))
+        for f in range(self.config.forums):
+            rng = self.rng("forum", f)
+            forum_id = self.make_id("forum", f)
+            created_at = self.timestamp(rng)
+            posts: List[Dict[str, Any]] = []
+            threads: List[Dict[str, Any]] = []
+            moment = created_at
+            for p in range(base + (f < extra)):
+                moment = min(moment + timedelta(minutes=rng.randint(1, 600)), DATASET_END)
+                now = moment.isoformat()
+                post = {
+                    "id": self.make_id("forum_post", f * (base + 1) + p),
+                    "forum_id": forum_id,
+                    "user_id": self.user_id("researcher", rng.randrange(self.researchers)),
+                    "content": rng.choice(MESSAGE_TEXTS),
+                    "parent_id": None,
+                    "thread_id": None,
+                    "reply_count": 0,
+                    "created_at": now,
+                    "last_activity_at": now
+                }
+                if threads and rng.random() < 0.7:
+                    thread = rng.choice(threads)
+                    post["parent_id"] = thread["id"]
+                    post["thread_id"] = thread["id"]
+                    thread["reply_count"] += 1
+                    thread["last_activity_at"] = now
+                else:
+                    post["thread_id"] = post["id"]
+                    threads.append(post)
+                posts.append(post)
+            yield "forums", {
+                "id": forum_id,
+                "category": rng.choice(FORUM_CATEGORIES),
+                "title": f"{rng.choice(CONDITIONS)} discussion {f}",
+                "description": "Community discussion of research updates and patient experiences",
+                "created_by": self.user_id("researcher", rng.randrange(self.researchers)),
+                "created_at": created_at.isoformat(),
+                "post_count": len(posts),
+                "thread_count": len(threads),
+                "last_activity_at": posts[-1]["created_at"] if posts else created_at.isoformat(),
+                **({"last_post_id": posts[-1]["id"]} if posts else {})
+            }
+            for post in posts:
+                yield "forum_posts", post
+
+    def messages(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Patient-researcher conversations of about MESSAGES_PER_CONVERSATION messages"""
+        if not self.patients or not self.researchers:
+            return
+        conversations = max(self.config.messages // MESSAGES_PER_CONVERSATION, 1)
+        base, extra = divmod(self.config.messages, conversations)
+        rng = self.rng("messages")
+        index = 0
+        for c in range(conversations):
+            patient = self.user_id("patient", c % self.patients)
+            researcher = self.user_id("researcher", rng.randrange(self.researchers))
+            moment = self.timestamp(rng)
+            length = base + (c < extra)
+            for m in range(length):
+                moment = min(moment + timedelta(seconds=rng.randint(30, 86400)), DATASET_END)
+                sender, recipient = (patient, researcher) if rng.random() < 0.5 else (researcher, patient)
+                yield "messages", {
+                    "id": self.make_id("message", index),
+                    "from_user": sender,
+                    "to_user": recipient,
+                    "message": rng.choice(MESSAGE_TEXTS),
+                    "read": m < length - 3,
+                    "created_at": moment.isoformat()
+                }
+                index += 1
+
+    def favorites(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        if not self.config.trials:
+            return
+        rng = self.rng("favorites")
+        per_patient = min(self.config.favorites_per_patient, self.config.trials)
+        for n in range(self.patients):
+            user_id = self.user_id("patient", n)
+            for k, trial in enumerate(rng.sample(range(self.config.trials), per_patient)):
+                yield "favorites", {
+                    "id": self.make_id("favorite", n * per_patient + k),
+                    "user_id": user_id,
+                    "item_type": "trial",
+                    "item_id": self.make_id("trial", trial),
+                    "created_at": self.timestamp(rng).isoformat()
+                }
+
+
+def scaled(preset: str, **overrides) -> SyntheticConfig:
+    return replace(PRESETS[preset], **{k: v for k, v in overrides.items() if v is not None})
@@ -0,0 +1,377 @@
+"""Rate limiting, circuit breaking, request coalescing and
+stale-while-unhealthy caching for the external APIs (NCBI E-utilities,
+ClinicalTrials.gov, the LLM)
+
+With a shared state backend (shared_state.py) the rate limit, the result
+cache and request coalescing also hold across worker processes; circuit
+breakers stay per process.
+"""
+import asyncio
+import copy
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+import aiohttp
+
+from shared_state import get_state
+
+# How often a worker waiting on another worker's fetch checks for its result
+SHARED_FLIGHT_POLL_INTERVAL = 0.05
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamError(Exception):
+    """An upstream call failed or was not attempted"""
+
+
+class UpstreamHTTPError(UpstreamError):
+    def __init__(self, name: str, status: int):
+        super().__init__(f"{name} returned HTTP {status}")
+        self.status = status
+
+
+class CircuitOpenError(UpstreamError):
+    pass
+
+
+class RateLimitedError(UpstreamError):
+    pass
+
+
+class TokenBucket:
+    """Token bucket that queues callers fairly by reserving future tokens
+
+    A caller whose reservation would wait longer than max_wait is rejected
+    instead, so a throttled upstream cannot stack requests up indefinitely.
+    """
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.burst = burst or max(int(rate), 1)
+        self.tokens = float(self.burst)
+        self.throttled = 0
+        self.rejected = 0
+        self._refilled_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    async def acquire(self, max_wait: float):
+        self._refill()
+        wait = max(0.0, (1 - self.tokens) / self.rate)
+        if wait > max_wait:
+            self.rejected += 1
+            raise RateLimitedError(f"rate limit wait {wait:.2f}s exceeds {max_wait:.2f}s")
+        self.tokens -= 1
+        if wait:
+            self.throttled += 1
+            await asyncio.sleep(wait)
+
+    def penalize(self, retry_after: float):
+        """Hold back the next caller for retry_after seconds (HTTP 429)"""
+        self._refill()
+        self.tokens = min(self.tokens, 1 - retry_after * self.rate)
+
+    def metrics(self) -> Dict[str, Any]:
+        self._refill()
+        return {"rate_per_second": self.rate, "burst": self.burst, "tokens": round(self.tokens, 2),
+                "throttled": self.throttled, "rejected": self.rejected}
+
+
+class CircuitBreaker:
+    """closed -> open after failure_threshold consecutive failures; after
+    reset_timeout one half-open probe decides whether to close again
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.consecutive_failures = 0
+        self.opened_count = 0
+        self.short_circuited = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        self.short_circuited += 1
+        return False
+
+    def release(self):
+        """The allowed call was never made (e.g. rejected by the rate limiter)"""
+        self._probing = False
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self._probing or self.consecutive_failures >= self.failure_threshold:
+            if self._opened_at is None or self._probing:
+                self.opened_count += 1
+            self._opened_at = time.monotonic()
+        self._probing = False
+
+    def metrics(self) -> Dict[str, Any]:
+        return {"state": self.state, "consecutive_failures": self.consecutive_failures,
+                "opened_count": self.opened_count, "short_circuited": self.short_circuited}
+
+
+class StaleCache:
+    """LRU of upstream results; entries are fresh for ttl seconds and may
+    still be served for stale_ttl seconds while the upstream is failing
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 600.0, stale_ttl: float = 86400.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.hits = 0
+        self.misses = 0
+        self.stale_served = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable):
+        """(value, is_fresh), or None when absent or past stale_ttl"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        age = time.monotonic() - stored_at
+        if age > self.stale_ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return copy.deepcopy(value), age <= self.ttl
+
+    def set(self, key: Hashable, value: Any, age: float = 0.0):
+        self._entries[key] = (time.monotonic() - age, copy.deepcopy(value))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses, "stale_served": self.stale_served}
+
+
+# PubMed and ClinicalTrials.gov read these as boolean operators only in upper case
+QUERY_OPERATORS = {"AND", "OR", "NOT"}
+
+
+def normalize_query(text: Optional[str]) -> str:
+    """Case- and whitespace-insensitive form of a search string, for cache and
+    single-flight keys only; the caller's text is what goes upstream. Boolean
+    operators keep their case, since "a NOT b" and "a not b" are different searches
+    """
+    return " ".join(word if word in QUERY_OPERATORS else word.lower() for word in (text or "").split())
+
+
+class SingleFlight:
+    """Merge identical concurrent calls into one shared awaitable
+
+    The first caller for a key starts the work as a task; callers arriving
+    while it runs await the same task. Each caller gets its own deep copy of
+    the result, since endpoints decorate results in place. A cancelled
+    caller does not cancel the shared work.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]):
+        task = self._in_flight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.shared += 1
+        return copy.deepcopy(await asyncio.shield(task))
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved so an unawaited failure is not logged
+
+    def metrics(self) -> Dict[str, Any]:
+        return {"calls": self.calls, "shared": self.shared, "in_flight": len(self._in_flight)}
+
+
+class Upstream:
+    """One external API: every HTTP call passes the circuit breaker, the rate
+    limiter and a hard timeout; whole results are cached per query, and
+    concurrent misses for the same query share one fetch
+    """
+
+    def __init__(self, name: str, rate: float, timeout: float = 5.0, max_wait: float = 2.0,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0, cache: Optional[StaleCache] = None):
+        self.name = name
+        self.bucket = TokenBucket(rate)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.max_wait = max_wait
+        self.cache = cache or StaleCache()
+        self.flight = SingleFlight()
+
+    async def request(self, session: aiohttp.ClientSession, url: str, params: Dict[str, Any], read, method: str = "GET"):
+        """Call the API under this upstream's policies; read(response) consumes the body"""
+        probe = self.breaker.state == "half_open"
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        try:
+            await self._acquire()
+            query, form = (params, None) if method == "GET" else (None, params)
+            async with session.request(method, url, params=query, data=form, timeout=self.timeout) as response:
+                if response.status == 429:
+                    await self._penalize(float(response.headers.get("Retry-After", "1") or 1))
+                    raise UpstreamHTTPError(self.name, 429)
+                if response.status >= 500:
+                    raise UpstreamHTTPError(self.name, response.status)
+                if response.status >= 400:
+                    self.breaker.record_success()
+                    raise UpstreamError(f"{self.name} rejected the request (HTTP {response.status})")
+                data = await read(response)
+        except UpstreamHTTPError:
+            self.breaker.record_failure()
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.breaker.record_failure()
+            raise UpstreamError(f"{self.name} request failed: {e!r}") from e
+        except (ValueError, SyntaxError) as e:
+            # An HTML error page or a truncated body where JSON or XML was
+            # expected (JSONDecodeError is a ValueError, ParseError a SyntaxError)
+            self.breaker.record_failure()
+            raise UpstreamError(f"{self.name} returned an unreadable body: {e!r}") from e
+        finally:
+            # A probe that ended without a verdict (rate limited, cancelled, a
+            # bug in read) frees the half-open slot; after a verdict this is a no-op
+            if probe:
+                self.breaker.release()
+        self.breaker.record_success()
+        return data
+
+    async def get_json(self, session: aiohttp.ClientSession, url: str, params: Dict[str, Any]):
+        return await self.request(session, url, params, lambda r: r.json(content_type=None))
+
+    async def get_text(self, session: aiohttp.ClientSession, url: str, params: Dict[str, Any]) -> str:
+        return await self.request(session, url, params, lambda r: r.text())
+
+    async def _acquire(self):
+        state = get_state()
+        if not state.shared:
+            await self.bucket.acquire(self.max_wait)
+            return
+        wait = await state.reserve(f"upstream:{self.name}", self.bucket.rate, self.bucket.burst, self.max_wait)
+        if wait is None:
+            self.bucket.rejected += 1
+            raise RateLimitedError(f"{self.name} shared rate limit wait exceeds {self.max_wait:.2f}s")
+        if wait:
+            self.bucket.throttled += 1
+            await asyncio.sleep(wait)
+
+    async def _penalize(self, retry_after: float):
+        state = get_state()
+        if state.shared:
+            await state.penalize(f"upstream:{self.name}", self.bucket.rate, self.bucket.burst, retry_after)
+        else:
+            self.bucket.penalize(retry_after)
+
+    def _shared_key(self, key: Hashable) -> str:
+        return f"upstream:{self.name}:{key!r}"
+
+    async def _shared_entry(self, key: Hashable):
+        """(value, age) from the shared cache, or None"""
+        entry = await get_state().get(self._shared_key(key))
+        if entry is None:
+            return None
+        return entry["value"], time.time() - entry["stored_at"]
+
+    async def _fetch_shared(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]):
+        """Fetch once across workers: the lease holder fetches and the others
+        wait for its result, fetching themselves if it takes too long
+        """
+        state = get_state()
+        shared_key = self._shared_key(key)
+        lease_ttl = (self.timeout.total or 5.0) + self.max_wait
+        deadline = time.monotonic() + lease_ttl
+        leased = await state.acquire_lease(shared_key, lease_ttl)
+        while not leased and time.monotonic() < deadline:
+            await asyncio.sleep(SHARED_FLIGHT_POLL_INTERVAL)
+            entry = await self._shared_entry(key)
+            if entry and entry[1] <= self.cache.ttl:
+                self.flight.shared += 1
+                self.cache.set(key, entry[0], age=entry[1])
+                return entry[0]
+            leased = await state.acquire_lease(shared_key, lease_ttl)
+        try:
+            value = await fetch()
+            await state.set(shared_key, {"stored_at": time.time(), "value": value}, self.cache.stale_ttl)
+        finally:
+            if leased:
+                await state.release_lease(shared_key)
+        self.cache.set(key, value)
+        return value
+
+    async def cached(self, key: Hashable, fetch: Callable[[], Awaitable[Any]], default: Any):
+        """Fresh cache hit, else fetch; on failure serve a stale entry or default"""
+        hit = self.cache.get(key)
+        if hit and hit[1]:
+            self.cache.hits += 1
+            return hit[0]
+        shared = get_state().shared
+        if shared and hit is None:
+            entry = await self._shared_entry(key)
+            if entry and entry[1] <= self.cache.stale_ttl:
+                self.cache.set(key, entry[0], age=entry[1])
+                hit = self.cache.get(key)
+                if hit and hit[1]:
+                    self.cache.hits += 1
+                    return hit[0]
+        self.cache.misses += 1
+
+        async def load():
+            if shared:
+                return await self._fetch_shared(key, fetch)
+            value = await fetch()
+            self.cache.set(key, value)
+            return value
+
+        try:
+            return await self.flight.do(key, load)
+        except Exception:
+            logger.warning("%s API error", self.name, exc_info=True)
+            if hit:
+                self.cache.stale_served += 1
+                return hit[0]
+            return default
+
+    def metrics(self) -> Dict[str, Any]:
+        return {"shared": get_state().shared, "circuit": self.breaker.metrics(), "rate_limiter": self.bucket.metrics(),
+                "cache": self.cache.metrics(), "single_flight": self.flight.metrics()}
@@ -0,0 +1,30 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# The backend modules import each other by bare name, as they do when the
+# server runs from the backend directory
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "researchbridge_test")
+os.environ.setdefault("STORAGE_URL", "memory://")
+os.environ.setdefault("STARTUP_WARMUP", "0")
+os.environ.setdefault("CHANGE_FEED", "0")
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """The API module on a fresh in-memory database with its indexes"""
+    import server
+    from memory_db import MemoryDatabase
+
+    db = MemoryDatabase("test")
+    monkeypatch.setattr(server, "db", db)
+    monkeypatch.setattr(server, "read_db", db)
+    asyncio.run(server.ensure_indexes())
+    return server
@@ -0,0 +1,46 @@
+import asyncio
+
+USER = {"sub": "patient-1"}
+
+
+def test_replayed_message_batch_stores_nothing_twice(server):
+    batch = server.MessageBatch(messages=[
+        {"to_user": "expert-1", "message": "hello", "idempotency_key": "k1"},
+        {"to_user": "expert-1", "message": "again", "idempotency_key": "k2"}
+    ])
+    first = asyncio.run(server.send_messages(batch, USER))["results"]
+    replay = asyncio.run(server.send_messages(batch, USER))["results"]
+
+    assert [r["status"] for r in first] == ["created", "created"]
+    assert [r["status"] for r in replay] == ["duplicate", "duplicate"]
+    assert [r["id"] for r in replay] == [r["id"] for r in first]
+    assert asyncio.run(server.db.messages.count_documents({})) == 2
+
+
+def test_concurrent_replays_create_each_message_once(server):
+    batch = server.MessageBatch(messages=[{"to_user": "expert-1", "message": "hi", "idempotency_key": "k1"}])
+
+    async def replay():
+        return await asyncio.gather(*[server.send_messages(batch, USER) for _ in range(5)])
+    statuses = [response["results"][0]["status"] for response in asyncio.run(replay())]
+
+    assert statuses.count("created") == 1
+    assert asyncio.run(server.db.messages.count_documents({})) == 1
+
+
+def test_replayed_forum_post_batch_counts_posts_once(server):
+    asyncio.run(server.db.forums.insert_one({"id": "f1", "post_count": 0, "thread_count": 0}))
+    batch = server.ForumPostBatch(posts=[{"forum_id": "f1", "content": "first", "idempotency_key": "p1"}])
+    first = asyncio.run(server.create_forum_posts(batch, USER))["results"]
+    replay = asyncio.run(server.create_forum_posts(batch, USER))["results"]
+
+    assert (first[0]["status"], replay[0]["status"]) == ("created", "duplicate")
+    forum = asyncio.run(server.db.forums.find_one({"id": "f1"}))
+    assert (forum["post_count"], forum["thread_count"]) == (1, 1)
+
+
+def test_replayed_favorite_batch_changes_nothing(server):
+    batch = server.FavoriteBatch(items=[{"item_type": "trial", "item_id": "t1"}, {"item_type": "trial", "item_id": "t2"}])
+    asyncio.run(server.update_favorites(batch, USER))
+    asyncio.run(server.update_favorites(batch, USER))
+    assert asyncio.run(server.db.favorites.count_documents({"user_id": "patient-1"})) == 2
@@ -0,0 +1,47 @@
+import asyncio
+
+from change_feed import CHANGES_CHANNEL, ChangeFeed
+from memory_db import MemoryDatabase
+from shared_state import MemoryState
+
+
+def polled_events(steps):
+    """Events from polling trials once before and once after each write step"""
+    async def run():
+        db, state, events = MemoryDatabase("test"), MemoryState(), []
+
+        async def record(event):
+            events.append((event["operation"], event["ids"]))
+        state.subscribe(CHANGES_CHANNEL, record)
+        feed = ChangeFeed(db, state, change_streams=False)
+        await db.clinical_trials.insert_one({"id": "t0", "created_at": "2024-01-01"})
+        await feed._poll_collection("clinical_trials")
+        for step in steps:
+            await step(db.clinical_trials)
+            await feed._poll_collection("clinical_trials")
+        return events
+    return asyncio.run(run())
+
+
+def test_new_documents_are_published_once():
+    async def insert(trials):
+        await trials.insert_many([{"id": "t1", "created_at": "2024-02-01"}, {"id": "t2", "created_at": "2024-02-01"}])
+
+    async def nothing(trials):
+        pass
+    assert polled_events([insert, nothing]) == [("insert", ["t1", "t2"])]
+
+
+def test_documents_without_created_at_trigger_a_resync():
+    async def insert(trials):
+        await trials.insert_one({"id": "seeded"})
+    assert polled_events([insert]) == [("resync", None)]
+
+
+def test_deletes_after_unseen_inserts_are_still_reported():
+    async def insert(trials):
+        await trials.insert_one({"id": "seeded"})
+
+    async def delete(trials):
+        await trials.delete_one({"id": "t0"})
+    assert polled_events([insert, delete]) == [("resync", None), ("delete", None)]
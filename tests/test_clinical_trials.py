@@ -0,0 +1,46 @@
+from api_integrations import normalize_study
+
+# Trimmed from a ClinicalTrials.gov v2 /studies response
+V2_STUDY = {
+    "protocolSection": {
+        "identificationModule": {
+            "nctId": "NCT04573140",
+            "briefTitle": "Temozolomide Plus Radiation in Glioblastoma",
+            "officialTitle": "A Phase II Study of Temozolomide Plus Radiation in Newly Diagnosed Glioblastoma"
+        },
+        "statusModule": {"overallStatus": "RECRUITING"},
+        "descriptionModule": {"briefSummary": "This study evaluates temozolomide with radiation."},
+        "conditionsModule": {"conditions": ["Glioblastoma", "Brain Tumor"]},
+        "designModule": {"phases": ["PHASE2"]},
+        "eligibilityModule": {"eligibilityCriteria": "Inclusion Criteria:\n\n* Age 18 or older"},
+        "contactsLocationsModule": {
+            "centralContacts": [
+                {"name": "Study Coordinator", "role": "CONTACT", "phone": "617-555-0100", "email": "gbm-trial@example.org"}
+            ],
+            "locations": [
+                {
+                    "facility": "Dana-Farber Cancer Institute", "status": "RECRUITING", "city": "Boston",
+                    "state": "Massachusetts", "zip": "02215", "country": "United States",
+                    "geoPoint": {"lat": 42.35843, "lon": -71.05977}
+                },
+                {"facility": "Toronto Western Hospital", "city": "Toronto", "state": "Ontario", "country": "Canada"}
+            ]
+        }
+    }
+}
+
+
+def test_normalize_study_reads_v2_sites_and_contacts():
+    trial = normalize_study(V2_STUDY)
+
+    assert trial["nct_id"] == "NCT04573140"
+    assert trial["contact"] == "gbm-trial@example.org"
+    assert trial["location"] == "Boston, United States"
+    assert [site["city"] for site in trial["locations"]] == ["Boston", "Toronto"]
+    assert (trial["locations"][0]["lat"], trial["locations"][0]["lon"]) == (42.35843, -71.05977)
+    assert "lat" not in trial["locations"][1]
+
+
+def test_normalize_study_without_sites():
+    trial = normalize_study({"protocolSection": {"identificationModule": {"nctId": "NCT00000001"}}})
+    assert (trial["locations"], trial["location"], trial["contact"]) == ([], "Not specified", "")
@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from migrations import backfill_forum_counters
+
+USER = {"sub": "patient-1"}
+
+
+def seed_legacy_thread(server):
+    """A forum and a reply chain written before counters and thread_id existed"""
+    async def seed():
+        await server.db.forums.insert_one({"id": "f1", "title": "Glioma", "created_at": "2024-01-01"})
+        await server.db.forum_posts.insert_many([
+            {"id": "root", "forum_id": "f1", "parent_id": None, "content": "q", "created_at": "2024-01-02"},
+            {"id": "a", "forum_id": "f1", "parent_id": "root", "content": "a", "created_at": "2024-01-03"},
+            {"id": "b", "forum_id": "f1", "parent_id": "a", "content": "b", "created_at": "2024-01-04"}
+        ])
+    asyncio.run(seed())
+
+
+def test_reply_to_legacy_reply_joins_the_root_thread(server):
+    seed_legacy_thread(server)
+    created = asyncio.run(server.create_forum_post(server.ForumPostCreate(forum_id="f1", content="c", parent_id="b"), USER))
+    assert created["thread_id"] == "root"
+
+    root = asyncio.run(server.db.forum_posts.find_one({"id": "root"}))
+    assert root["reply_count"] == 1
+
+    page = asyncio.run(server.get_forum_threads("f1"))
+    [thread] = page["threads"]
+    assert thread["id"] == "root"
+    assert thread["replies"][0]["replies"][0]["replies"][0]["id"] == created["id"]
+
+
+def test_backfill_recomputes_counters_and_thread_ids(server):
+    seed_legacy_thread(server)
+    counts = asyncio.run(backfill_forum_counters(server.db))
+    assert counts == {"forum_posts": 3, "forums": 1}
+
+    forum = asyncio.run(server.db.forums.find_one({"id": "f1"}))
+    assert (forum["post_count"], forum["thread_count"], forum["last_post_id"]) == (3, 1, "b")
+    posts = {p["id"]: p for p in asyncio.run(server.db.forum_posts.find({}).to_list(None))}
+    assert {p["thread_id"] for p in posts.values()} == {"root"}
+    assert posts["root"]["reply_count"] == 2
+    assert posts["root"]["last_activity_at"] == "2024-01-04"
+
+    # Running it again changes nothing
+    assert asyncio.run(backfill_forum_counters(server.db)) == {"forum_posts": 0, "forums": 1}
+
+
+def test_post_to_missing_forum_leaves_nothing_behind(server):
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(server.create_forum_post(server.ForumPostCreate(forum_id="missing", content="x"), USER))
+    assert error.value.status_code == 404
+    assert asyncio.run(server.db.forum_posts.count_documents({})) == 0
@@ -0,0 +1,13 @@
+import asyncio
+
+
+def test_nearby_limit_is_clamped(server):
+    asyncio.run(server.db.health_experts.insert_many([
+        {"id": f"e{i}", "name": f"Expert {i}", "specialty": "Oncology", "geo": {"type": "Point", "coordinates": [-71.06, 42.36]}}
+        for i in range(3)
+    ]))
+    for limit in (0, -5):
+        experts = asyncio.run(server.get_nearby_experts(lat=42.36, lon=-71.06, radius_km=10, limit=limit))
+        assert len(experts) == 1
+        trials = asyncio.run(server.get_nearby_clinical_trials(lat=42.36, lon=-71.06, radius_km=10, limit=limit))
+        assert trials == []
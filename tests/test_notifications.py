@@ -0,0 +1,56 @@
+import asyncio
+
+EXPERT = {"sub": "expert-1"}
+
+
+def feed(server, user, limit=100):
+    """Every notification of user, following next_cursor page by page"""
+    entries, cursor = [], None
+    while True:
+        page = asyncio.run(server.get_notifications(limit, cursor, user))
+        entries += page["notifications"]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return entries
+
+
+def test_paging_with_shared_created_at_returns_each_entry_once(server):
+    created_at = "2024-05-01T12:00:00+00:00"
+    asyncio.run(server.notify([server.notification("expert-1", "message", f"m{i}", "patient-1", created_at)
+                               for i in range(7)]))
+    asyncio.run(server.notify([server.notification("expert-1", "message", "newest", "patient-1",
+                                                   "2024-05-02T00:00:00+00:00")]))
+
+    entries = feed(server, EXPERT, limit=2)
+
+    assert len(entries) == 8
+    assert len({e["id"] for e in entries}) == 8
+    assert entries[0]["ref_id"] == "newest"
+    assert [(e["created_at"], e["id"]) for e in entries] == sorted(
+        ((e["created_at"], e["id"]) for e in entries), reverse=True)
+
+
+def test_counters_match_the_feed(server):
+    for i in range(3):
+        asyncio.run(server.send_message(server.MessageCreate(to_user="expert-1", message=f"hi {i}"), {"sub": "patient-1"}))
+    batch = server.MessageBatch(messages=[{"to_user": "expert-1", "message": "batched", "idempotency_key": "k1"}])
+    asyncio.run(server.send_messages(batch, {"sub": "patient-2"}))
+    asyncio.run(server.send_messages(batch, {"sub": "patient-2"}))
+    for _ in range(2):
+        asyncio.run(server.create_connection_request(server.ConnectionRequestCreate(to_user="expert-1"), {"sub": "patient-1"}))
+
+    counts = asyncio.run(server.get_notification_counts(EXPERT))
+    kinds = [e["type"] for e in feed(server, EXPERT)]
+    assert counts["unread_messages"] == kinds.count("message") == 4
+    assert counts["pending_connection_requests"] == kinds.count("connection_request") == 1
+    assert counts["pending_meeting_requests"] == kinds.count("meeting_request") == 0
+
+
+def test_reading_messages_lowers_the_unread_count(server):
+    for sender in ("patient-1", "patient-1", "patient-2"):
+        asyncio.run(server.send_message(server.MessageCreate(to_user="expert-1", message="hi"), {"sub": sender}))
+
+    assert asyncio.run(server.mark_messages_read("patient-1", EXPERT)) == {"read": 2}
+    assert asyncio.run(server.mark_messages_read("patient-1", EXPERT)) == {"read": 0}
+    unread = asyncio.run(server.db.messages.count_documents({"to_user": "expert-1", "read": False}))
+    assert asyncio.run(server.get_notification_counts(EXPERT))["unread_messages"] == unread == 1
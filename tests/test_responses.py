@@ -0,0 +1,20 @@
+import json
+import math
+
+from starlette.responses import JSONResponse
+
+from responses import FastJSONResponse
+
+DOCUMENT = {"id": "t1", "title": "Glioma — phase 2", "count": 3, "open": True, "tags": ["a", None], "nested": {"x": 1}}
+
+
+def test_json_native_documents_render_like_jsonresponse():
+    assert FastJSONResponse(DOCUMENT).body == JSONResponse(DOCUMENT).body
+
+
+def test_float_exponents_parse_to_the_same_number():
+    assert json.loads(FastJSONResponse({"score": 1e16}).body) == {"score": 1e16}
+
+
+def test_non_finite_floats_render_as_null():
+    assert json.loads(FastJSONResponse({"score": math.nan, "max": math.inf}).body) == {"score": None, "max": None}
@@ -0,0 +1,62 @@
+import asyncio
+
+from embeddings import SemanticIndex
+
+
+class CountingCollection:
+    """Wraps a collection, recording the projection of each find"""
+
+    def __init__(self, collection, projections):
+        self.collection = collection
+        self.projections = projections
+
+    def find(self, query, projection):
+        self.projections.append(projection)
+        return self.collection.find(query, projection)
+
+
+class CountingDatabase:
+    def __init__(self, db):
+        self.db = db
+        self.projections = []
+
+    def __getitem__(self, name):
+        return CountingCollection(self.db[name], self.projections)
+
+
+def trial(doc_id, title):
+    return {"id": doc_id, "title": title, "conditions": [title], "description": "a study"}
+
+
+def test_sync_embeds_only_missing_documents_and_drops_deleted_ones(server):
+    semantic = SemanticIndex(directory=None)
+    asyncio.run(server.db.clinical_trials.insert_many([trial("t1", "glioblastoma"), trial("t2", "asthma")]))
+    first = asyncio.run(semantic.sync(server.db))
+    assert first["clinical_trials"] == {"added": 2, "removed": 0}
+
+    asyncio.run(server.db.clinical_trials.delete_one({"id": "t1"}))
+    asyncio.run(server.db.clinical_trials.insert_one(trial("t3", "melanoma")))
+    counting = CountingDatabase(server.db)
+    second = asyncio.run(semantic.sync(counting, ["clinical_trials"]))
+
+    assert second == {"clinical_trials": {"added": 1, "removed": 1}}
+    assert sorted(semantic.indexes["clinical_trials"].ids) == ["t2", "t3"]
+    # Full documents are read only for the one that was missing
+    assert counting.projections[0] == {"_id": 0, "id": 1}
+    assert len(counting.projections) == 2
+    hits = semantic.search("glioblastoma", ["clinical_trials"], 5)["clinical_trials"]
+    assert "t1" not in [doc_id for doc_id, _ in hits]
+
+
+def test_delete_events_remove_documents_from_the_index(server, monkeypatch):
+    semantic = SemanticIndex(directory=None)
+    monkeypatch.setattr(server, "semantic_index", semantic)
+    asyncio.run(server.db.clinical_trials.insert_many([trial("t1", "glioblastoma"), trial("t2", "asthma")]))
+    asyncio.run(semantic.sync(server.db))
+
+    asyncio.run(server.db.clinical_trials.delete_one({"id": "t1"}))
+    asyncio.run(server.on_data_change({"collection": "clinical_trials", "operation": "delete", "ids": None}))
+    assert semantic.indexes["clinical_trials"].ids == ["t2"]
+
+    asyncio.run(server.on_data_change({"collection": "clinical_trials", "operation": "delete", "ids": ["t2"]}))
+    assert semantic.indexes["clinical_trials"].ids == []
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from memory_db import MemoryDatabase
+from migrations import dedupe_unique_keys
+
+
+def duplicated_favorites(db):
+    asyncio.run(db.favorites.insert_many([
+        {"id": f"fav-{i}", "user_id": "u1", "item_type": "trial", "item_id": "t1", "created_at": f"2024-0{i + 1}-01"}
+        for i in range(3)
+    ]))
+
+
+def test_startup_reports_duplicates_without_removing_them(server, caplog):
+    db = MemoryDatabase("test")
+    duplicated_favorites(db)
+    server.db = db
+    asyncio.run(server.ensure_indexes())
+
+    assert asyncio.run(db.favorites.count_documents({})) == 3
+    assert "dedupe-unique-keys" in caplog.text
+
+
+def test_dedupe_dry_run_writes_nothing():
+    db = MemoryDatabase("test")
+    duplicated_favorites(db)
+    counts = asyncio.run(dedupe_unique_keys(db, dry_run=True))
+
+    assert counts["favorites"] == 2
+    assert asyncio.run(db.favorites.count_documents({})) == 3
+    assert asyncio.run(db.migration_backups.count_documents({})) == 0
+
+
+def test_dedupe_keeps_the_oldest_backs_up_the_rest_and_builds_the_index():
+    db = MemoryDatabase("test")
+    duplicated_favorites(db)
+    asyncio.run(dedupe_unique_keys(db))
+
+    kept = asyncio.run(db.favorites.find({}, {"_id": 0, "id": 1}).to_list(None))
+    assert kept == [{"id": "fav-0"}]
+    backups = asyncio.run(db.migration_backups.find({}, {"_id": 0}).to_list(None))
+    assert sorted(b["document"]["id"] for b in backups) == ["fav-1", "fav-2"]
+    with pytest.raises(DuplicateKeyError):
+        asyncio.run(db.favorites.insert_one({"user_id": "u1", "item_type": "trial", "item_id": "t1"}))
+
+
+def test_concurrent_favorite_toggles_never_duplicate(server):
+    favorite = server.FavoriteCreate(item_type="trial", item_id="t9")
+
+    async def toggle_many():
+        return await asyncio.gather(*[server.add_favorite(favorite, {"sub": "u2"}) for _ in range(7)])
+    asyncio.run(toggle_many())
+    assert asyncio.run(server.db.favorites.count_documents({"user_id": "u2"})) <= 1
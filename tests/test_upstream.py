@@ -0,0 +1,137 @@
+import asyncio
+import json
+
+import pytest
+
+from upstream import CircuitBreaker, CircuitOpenError, Upstream, UpstreamError, UpstreamHTTPError, normalize_query
+
+
+class FakeResponse:
+    def __init__(self, status: int, body: str):
+        self.status = status
+        self.headers = {}
+        self._body = body
+
+    async def json(self, content_type=None):
+        return json.loads(self._body)
+
+    async def text(self):
+        return self._body
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeSession:
+    """Answers every request with the next (status, body) in responses"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        return FakeResponse(*self.responses.pop(0))
+
+
+def open_upstream() -> Upstream:
+    upstream = Upstream("test", rate=1000, failure_threshold=1, reset_timeout=0.0)
+    upstream.breaker.record_failure()
+    return upstream
+
+
+def test_breaker_opens_and_closes_after_a_successful_probe():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    breaker.reset_timeout = 0.0
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()  # one probe at a time
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_failed_probe_reopens_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=0.0)
+    for _ in range(5):
+        breaker.record_failure()
+    assert breaker.allow()
+    breaker.reset_timeout = 60
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.opened_count == 2
+
+
+def test_unreadable_probe_body_counts_as_failure():
+    upstream = open_upstream()
+    session = FakeSession((200, "<html>Service unavailable</html>"), (200, '{"ok": true}'))
+
+    with pytest.raises(UpstreamError):
+        asyncio.run(upstream.get_json(session, "http://upstream.test", {}))
+    assert upstream.breaker.consecutive_failures == 2
+    assert upstream.breaker.state == "half_open"  # reset_timeout is 0, so it may probe again
+
+    assert asyncio.run(upstream.get_json(session, "http://upstream.test", {})) == {"ok": True}
+    assert upstream.breaker.state == "closed"
+
+
+def test_cancelled_probe_frees_the_half_open_slot():
+    upstream = open_upstream()
+
+    async def never_read(response):
+        raise asyncio.CancelledError()
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(upstream.request(FakeSession((200, "")), "http://upstream.test", {}, never_read))
+    assert upstream.breaker.state == "half_open"
+    assert upstream.breaker.allow()
+
+
+def test_server_errors_keep_the_breaker_open():
+    upstream = open_upstream()
+    upstream.breaker.reset_timeout = 60
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(upstream.get_json(FakeSession((200, "{}")), "http://upstream.test", {}))
+
+    upstream.breaker.reset_timeout = 0.0
+    with pytest.raises(UpstreamHTTPError):
+        asyncio.run(upstream.get_json(FakeSession((503, "")), "http://upstream.test", {}))
+    assert upstream.breaker.opened_count == 2
+
+
+def test_normalize_query_keeps_boolean_operators():
+    assert normalize_query("  Brain   Tumor ") == normalize_query("brain tumor")
+    assert normalize_query("cancer NOT lung") != normalize_query("cancer not lung")
+
+
+def test_searches_send_the_callers_query_upstream(monkeypatch):
+    import api_integrations
+    sent = []
+
+    async def fetch_pubmed(query, max_results):
+        sent.append(query)
+        return []
+
+    monkeypatch.setattr(api_integrations, "fetch_pubmed", fetch_pubmed)
+    asyncio.run(api_integrations.search_pubmed("Glioma NOT  Pediatric", 5))
+    assert sent == ["Glioma NOT  Pediatric"]
+
+
+def test_cached_logs_failures_and_serves_the_default(caplog):
+    upstream = Upstream("test", rate=1000)
+
+    async def fetch():
+        raise UpstreamError("test returned HTTP 503")
+
+    with caplog.at_level("WARNING", logger="upstream"):
+        assert asyncio.run(upstream.cached(("failing",), fetch, [])) == []
+    assert [r.getMessage() for r in caplog.records] == ["test API error"]
+    assert caplog.records[0].exc_info[0] is UpstreamError